@@ -1,20 +1,63 @@
 """
 EcoWise AI Service - Enhanced YOLOv8 Object Detection
+The model is loaded lazily (or in a background thread) so importing this
+module stays cheap; ultralytics itself is only imported on first load.
 """
-from ultralytics import YOLO
+import logging
 import os
+import threading
+import time
+
+import numpy as np
+
+from inference_backends import prepare_model
+from metrics import DETECT_STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class DetectionError(RuntimeError):
+    """The model could not be loaded or inference failed; nothing was detected"""
+
+
+# After a failed model load, requests fail fast for this long before the next
+# attempt; the delay doubles per consecutive failure up to the maximum
+LOAD_RETRY_SECONDS = 5
+LOAD_RETRY_MAX_SECONDS = 300
+
+# Recommendation categories, indexed by category code
+GENERAL, RECYCLABLE, DONATABLE = 0, 1, 2
+CATEGORY_KEYS = ('general', 'recyclable', 'donatable')
+CATEGORY_POINTS = np.array([5, 10, 15], dtype=np.int64)
+CATEGORY_ACTIONS = (
+    "Check local waste guidelines",
+    "Recycle at nearest recycling center",
+    "Donate to local NGO or charity"
+)
+# Action text for every category and whole confidence percentage
+ACTION_TEXT = tuple(
+    tuple(f"{action} ({pct}% confidence)" for pct in range(101))
+    for action in CATEGORY_ACTIONS
+)
 
 class EcoWiseAI:
-    def __init__(self):
-        print("🤖 Initializing EcoWise AI...")
+    def __init__(self, model_path='yolov8n.pt', backend='pytorch'):
+        logger.info("Initializing EcoWise AI", extra={"backend": backend})
         
-        # Load YOLOv8 model
-        model_path = 'yolov8n.pt'
-        if not os.path.exists(model_path):
-            print("⚠️ Model not found, downloading...")
+        self.model = None
+        self.model_name = model_path
+        self.backend = backend
+        self.conf = 0.20
+        # Identifies this model + backend in the detection cache key
+        self.model_id = model_path if backend == 'pytorch' else f"{model_path}[{backend}]"
         
-        self.model = YOLO(model_path)
-        print("✅ YOLOv8 Model Loaded Successfully!")
+        # Loading state reported by /health/ready
+        self._load_lock = threading.Lock()
+        self.load_error = None
+        self.load_failures = 0
+        self._retry_at = None
+        self.load_seconds = None
+        self.warmup_ms = None
         
         # Define recyclable and donation objects
         self.recyclable_objects = {
@@ -34,49 +77,230 @@ class EcoWiseAI:
             'handbag', 'suitcase', 'chair', 'couch', 'bed', 'dining table',
             'potted plant', 'clock', 'vase'
         }
+        self.class_names = None
+        self.build_category_tables()
     
-    def detect_objects(self, image_path):
+    def build_category_tables(self, class_names=None):
         """
-        Detect objects in an image using YOLOv8 with improved sensitivity
+        Precompute category codes from recyclable_objects/donation_objects:
+        category_by_class, indexed by model class id (once the model's class
+        names are known), and category_by_name for detections without an id.
+        Call again after changing either set.
         """
-        try:
-            print(f"🔍 Detecting objects in: {image_path}")
+        if class_names is not None:
+            self.class_names = dict(class_names)
+        self.category_by_name = {}
+        for name in self.recyclable_objects:
+            self.category_by_name[name] = DONATABLE if name in self.donation_objects else RECYCLABLE
+        
+        self.category_by_class = None
+        if self.class_names:
+            self.category_by_class = np.full(max(self.class_names) + 1, GENERAL, dtype=np.int8)
+            for class_id, name in self.class_names.items():
+                self.category_by_class[class_id] = self.category_by_name.get(name, GENERAL)
+    
+    def load(self, warmup=True, backoff=False):
+        """
+        Load YOLOv8 once (thread-safe) and optionally run a warm-up inference.
+        A model loaded earlier without warm-up (e.g. before fork) is warmed up now.
+        With backoff, a recent failed load raises DetectionError instead of
+        being retried before its retry delay is over.
+        """
+        with self._load_lock:
+            if self.model is not None:
+                if warmup and self.warmup_ms is None:
+                    self.warm_up()
+                return self.model
+            if backoff:
+                self._raise_if_backing_off()
             
+            started = time.perf_counter()
+            try:
+                from ultralytics import YOLO
+                
+                if not os.path.exists(self.model_name):
+                    logger.warning("Model not found, downloading", extra={"model": self.model_name})
+                
+                model = YOLO(prepare_model(self.model_name, self.backend), task='detect')
+                self.load_seconds = round(time.perf_counter() - started, 3)
+                logger.info("YOLOv8 model loaded", extra={"load_seconds": self.load_seconds})
+                
+                self.build_category_tables(model.names)
+                self.model = model
+                self.load_error = None
+                self.load_failures = 0
+                self._retry_at = None
+                if warmup:
+                    self.warm_up()
+            except Exception as e:
+                self.load_error = str(e)
+                if self.model is None:
+                    self.load_failures += 1
+                    delay = min(LOAD_RETRY_SECONDS * 2 ** (self.load_failures - 1), LOAD_RETRY_MAX_SECONDS)
+                    self._retry_at = time.monotonic() + delay
+                logger.error("Could not load YOLOv8 model: %s", e)
+                raise
+            
+            return self.model
+    
+    def load_async(self, warmup=True):
+        """Start loading the model in a background thread"""
+        def run():
+            try:
+                self.load(warmup)
+            except Exception:
+                pass  # recorded in load_error
+        
+        thread = threading.Thread(target=run, name="ecowise-model-loader", daemon=True)
+        thread.start()
+        return thread
+    
+    def warm_up(self, size=640):
+        """Run one inference on a synthetic image so first requests aren't slow"""
+        started = time.perf_counter()
+        self.model(np.zeros((size, size, 3), dtype=np.uint8), conf=self.conf, verbose=False)
+        self.warmup_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info("Model warm-up finished", extra={"warmup_ms": self.warmup_ms})
+        return self.warmup_ms
+    
+    def ensure_loaded(self):
+        """The model, loading it if needed; fails fast while a failed load is backing off"""
+        if self.model is not None:
+            return self.model
+        # Checked before queueing on the load lock, too
+        self._raise_if_backing_off()
+        return self.load(backoff=True)
+    
+    def _raise_if_backing_off(self):
+        retry_at = self._retry_at
+        if retry_at is not None and time.monotonic() < retry_at:
+            raise DetectionError(f"Model unavailable (retrying in {retry_at - time.monotonic():.0f}s): "
+                                 f"{self.load_error}")
+    
+    def is_ready(self):
+        return self.model is not None and self.warmup_ms is not None
+    
+    def status(self):
+        return {
+            "model": self.model_name,
+            "backend": self.backend,
+            "model_loaded": self.model is not None,
+            "load_seconds": self.load_seconds,
+            "warmup_ms": self.warmup_ms,
+            "load_error": self.load_error,
+            "load_failures": self.load_failures
+        }
+    
+    def detect_objects(self, image):
+        """
+        Detect objects in an image using YOLOv8 with improved sensitivity.
+        Accepts a file path or an in-memory DecodedImage.
+        Raises DetectionError if the model is unavailable or inference fails.
+        """
+        try:
             # Run detection with lower confidence threshold for better detection
-            results = self.model(image_path, conf=0.20)
+            model = self.ensure_loaded()
+            with DETECT_STAGE_SECONDS.time(stage='inference'):
+                results = model(self._model_input(image), conf=self.conf, verbose=False)
             
             detected_items = []
             
             # Process results
-            for result in results:
-                boxes = result.boxes
-                names = result.names
-                
-                for box in boxes:
-                    class_id = int(box.cls[0])
-                    confidence = float(box.conf[0])
-                    object_name = names[class_id]
-                    
-                    # Include detections with confidence > 0.20
-                    if confidence > 0.20:
-                        detected_items.append({
-                            'name': object_name,
-                            'confidence': confidence,
-                            'bbox': box.xyxy[0].tolist()
-                        })
-                        print(f"   📌 Detected: {object_name} (confidence: {confidence:.2f})")
-            
-            print(f"✅ Total detected: {len(detected_items)} objects")
-            if detected_items:
-                print(f"   🎯 Objects: {[item['name'] for item in detected_items]}")
-            else:
-                print(f"   ⚠️ No objects detected above confidence threshold")
+            with DETECT_STAGE_SECONDS.time(stage='postprocess'):
+                for result in results:
+                    detected_items.extend(self._extract_detections(result, image))
             
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Detected %d objects in %s", len(detected_items), self._describe(image),
+                             extra={"objects": [item['name'] for item in detected_items]})
             return detected_items
             
         except Exception as e:
-            print(f"❌ AI Detection Error: {e}")
+            # Not the same as "no objects": callers must not cache this
+            logger.error("AI detection error: %s", e)
+            raise DetectionError(str(e)) from e
+    
+    def detect_batch(self, images):
+        """
+        Detect objects in several images with one batched YOLOv8 call.
+        Returns one list of detections per image, in input order.
+        Raises DetectionError if the model is unavailable or inference fails.
+        """
+        if not images:
+            return []
+        
+        try:
+            model = self.ensure_loaded()
+            with DETECT_STAGE_SECONDS.time(stage='inference'):
+                results = model([self._model_input(image) for image in images], conf=self.conf, verbose=False)
+            with DETECT_STAGE_SECONDS.time(stage='postprocess'):
+                detections = [
+                    self._extract_detections(result, image)
+                    for result, image in zip(results, images)
+                ]
+            logger.debug("Detected objects in batch of %d images", len(images))
+            return detections
+        except Exception as e:
+            logger.error("AI batch detection error: %s", e)
+            raise DetectionError(str(e)) from e
+    
+    @staticmethod
+    def _model_input(image):
+        """YOLO takes paths or arrays; DecodedImage wraps an array"""
+        return getattr(image, 'array', image)
+    
+    @staticmethod
+    def _describe(image):
+        if hasattr(image, 'original_size'):
+            width, height = image.original_size
+            return f"in-memory image {width}x{height}"
+        return image
+    
+    def _extract_detections(self, result, image=None):
+        """
+        Convert one YOLOv8 result into EcoWise detection dicts.
+        Works on whole box arrays; boxes on a preprocessed DecodedImage are
+        mapped back to original pixels.
+        """
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return []
+        
+        boxes = boxes.cpu().numpy()
+        confidences = boxes.conf
+        keep = confidences > self.conf
+        if not keep.any():
             return []
+        
+        class_ids = boxes.cls[keep].astype(np.int64)
+        confidences = confidences[keep].astype(np.float64)
+        bboxes = boxes.xyxy[keep].astype(np.float64)
+        if hasattr(image, 'to_original_array'):
+            bboxes = image.to_original_array(bboxes)
+        
+        names = result.names
+        return [
+            {'name': names[class_id], 'class_id': class_id, 'confidence': confidence, 'bbox': bbox}
+            for class_id, confidence, bbox in zip(class_ids.tolist(), confidences.tolist(), bboxes.tolist())
+        ]
+    
+    def _category_codes(self, detected_objects, names):
+        """
+        Category code per detection: category_by_class indexed with the class
+        ids, and a name lookup only for detections without a usable id
+        (history rows and cache entries written before ids were kept)
+        """
+        class_ids = np.fromiter(
+            (obj.get('class_id', -1) for obj in detected_objects),
+            dtype=np.int64, count=len(names))
+        codes = np.full(len(names), -1, dtype=np.int8)
+        table = self.category_by_class
+        if table is not None:
+            known = (class_ids >= 0) & (class_ids < len(table))
+            codes[known] = table[class_ids[known]]
+        for i in np.flatnonzero(codes < 0).tolist():
+            codes[i] = self.category_by_name.get(names[i], GENERAL)
+        return codes
     
     def get_recommendation(self, detected_objects):
         """
@@ -94,38 +318,24 @@ class EcoWiseAI:
                 }
             }
         
-        recyclable = []
-        donatable = []
-        general = []
-        eco_points = 0
+        names = [obj['name'] for obj in detected_objects]
+        codes = self._category_codes(detected_objects, names)
+        confidence_pcts = np.clip((np.fromiter(
+            (obj['confidence'] for obj in detected_objects),
+            dtype=np.float64, count=len(names)) * 100).astype(np.int64), 0, 100).tolist()
+        eco_points = int(CATEGORY_POINTS[codes].sum())
         
-        for obj in detected_objects:
-            obj_name = obj['name']
-            confidence = obj['confidence']
-            confidence_pct = int(confidence * 100)
-            
-            if obj_name in self.recyclable_objects:
-                if obj_name in self.donation_objects:
-                    donatable.append({
-                        "item": obj_name,
-                        "action": f"Donate to local NGO or charity ({confidence_pct}% confidence)",
-                        "points": 15
-                    })
-                    eco_points += 15
-                else:
-                    recyclable.append({
-                        "item": obj_name,
-                        "action": f"Recycle at nearest recycling center ({confidence_pct}% confidence)",
-                        "points": 10
-                    })
-                    eco_points += 10
-            else:
-                general.append({
-                    "item": obj_name,
-                    "action": f"Check local waste guidelines ({confidence_pct}% confidence)",
-                    "points": 5
-                })
-                eco_points += 5
+        categories = {}
+        for code, key in enumerate(CATEGORY_KEYS):
+            points = int(CATEGORY_POINTS[code])
+            actions = ACTION_TEXT[code]
+            categories[key] = [
+                {"item": names[i], "action": actions[confidence_pcts[i]], "points": points}
+                for i in np.flatnonzero(codes == code).tolist()
+            ]
+        recyclable = categories['recyclable']
+        donatable = categories['donatable']
+        general = categories['general']
         
         # Build recommendations list
         recommendations = []
@@ -156,4 +366,4 @@ class EcoWiseAI:
         }
 
 # Create global AI instance
-ai_engine = EcoWiseAI()
\ No newline at end of file
+ai_engine = EcoWiseAI(backend=os.environ.get('ECOWISE_BACKEND', 'pytorch'))
\ No newline at end of file
@@ -1,27 +1,218 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, send_file, stream_with_context
 from flask_cors import CORS
+import atexit
+import hashlib
+import io
+import logging
 import os
 import json
-from ai_service import ai_engine
+import time
+import numpy as np
+from datetime import datetime, timezone
+from ai_service import DetectionError, ai_engine
+from batch_upload import ZIP_MIMETYPES, iter_multipart_images, iter_zip_images
+from batching import BatchingScheduler, ConcurrencyLimit
+from camera_stream import CameraSessionLimit, CameraSessionManager, iter_multipart_frames
 from database import db
-from werkzeug.utils import secure_filename
+from detection_cache import DetectionCache
+from geo_index import DEFAULT_CENTERS_FILE, CenterCatalog, read_origins_csv
+from image_decoding import decode_upload
+from inference_pool import ProcessInferencePool
+from jobs import DetectionJobQueue, JobQueueFull, FINISHED_STATUSES
+from logging_config import configure_logging
+from near_duplicates import NearDuplicateIndex, perceptual_hash
+from metrics import CONTENT_TYPE, DETECT_STAGE_SECONDS, DETECTED_OBJECTS, HTTP_REQUEST_SECONDS, registry
+from upload_store import UploadStore
+from write_behind import PointsWriteBuffer
+
+# ECOWISE_LOG_LEVEL / ECOWISE_LOG_FORMAT ('text' or 'json')
+configure_logging()
+logger = logging.getLogger('ecowise')
 
 app = Flask(__name__)
 CORS(app)
 
 # Configuration
-UPLOAD_FOLDER = 'uploads'
+# Next to this file, whatever directory the server is started from
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# History paging for /user/<username>/history
+app.config['HISTORY_PAGE_SIZE'] = int(os.environ.get('ECOWISE_HISTORY_PAGE_SIZE', 5))
+app.config['HISTORY_MAX_PAGE_SIZE'] = 100
+
+# Preprocessing: uploads are downscaled so their longest side fits this, then
+# letterboxed into a few fixed input shapes (see image_decoding.shape_buckets)
+app.config['MAX_IMAGE_SIDE'] = int(os.environ.get('ECOWISE_MAX_IMAGE_SIDE', 640))
+
+# Web worker processes and request threads per worker (set by serve.py; the
+# development server is one process)
+app.config['WEB_WORKERS'] = max(1, int(os.environ.get('ECOWISE_WEB_WORKERS', 1)))
+app.config['WEB_THREADS'] = max(1, int(os.environ.get('ECOWISE_WEB_THREADS', 16)))
+
+# Inference mode:
+#   'batch'   - micro-batching: concurrent /detect calls share one YOLOv8 forward pass
+#   'process' - N forked worker processes sharing the preloaded model copy-on-write
+# The process pool must be forked before any other threads are started. Every
+# web worker has its own pool, so the cores are shared out between them.
+app.config['INFERENCE_MODE'] = os.environ.get('ECOWISE_INFERENCE_MODE', 'batch')
+app.config['INFERENCE_WORKERS'] = int(os.environ.get('ECOWISE_INFERENCE_WORKERS', max(1, (os.cpu_count() or 1) // app.config['WEB_WORKERS'])))
+app.config['BATCH_MAX_SIZE'] = int(os.environ.get('ECOWISE_BATCH_MAX_SIZE', 8))
+app.config['BATCH_MAX_WAIT_MS'] = float(os.environ.get('ECOWISE_BATCH_MAX_WAIT_MS', 15))
+if app.config['INFERENCE_MODE'] == 'process':
+    # Workers need the weights before fork; each one warms up on its own
+    ai_engine.load(warmup=False)
+    detector = ProcessInferencePool(
+        ai_engine,
+        app.config['INFERENCE_WORKERS'],
+        threads_per_worker=max(1, (os.cpu_count() or 1) // (app.config['INFERENCE_WORKERS'] * app.config['WEB_WORKERS']))
+    )
+    atexit.register(detector.shutdown)
+else:
+    # Load and warm up YOLOv8 in the background; /health/ready reports progress
+    ai_engine.load_async(warmup=True)
+    detector = BatchingScheduler(ai_engine, app.config['BATCH_MAX_SIZE'], app.config['BATCH_MAX_WAIT_MS'])
+
+# How many request threads may wait on the detector (/detect, /detect/batch)
+# and how many may hold a stream open (SSE, streamed camera frames, job
+# long-polls). Requests past either limit get a 503 straight away, so at least
+# a quarter of the threads keep cheap endpoints such as /user/<username>,
+# /recycling-centers and /health fast while inference or streams are saturated
+app.config['DETECT_MAX_CONCURRENCY'] = int(os.environ.get('ECOWISE_DETECT_MAX_CONCURRENCY', max(1, app.config['WEB_THREADS'] // 2)))
+app.config['STREAM_MAX_CONCURRENCY'] = int(os.environ.get('ECOWISE_STREAM_MAX_CONCURRENCY', max(1, app.config['WEB_THREADS'] // 4)))
+if app.config['DETECT_MAX_CONCURRENCY'] + app.config['STREAM_MAX_CONCURRENCY'] >= app.config['WEB_THREADS']:
+    logger.warning("Detect and stream limits leave no request threads for other endpoints",
+                   extra={"web_threads": app.config['WEB_THREADS']})
+detect_slots = ConcurrencyLimit(app.config['DETECT_MAX_CONCURRENCY'])
+stream_slots = ConcurrencyLimit(app.config['STREAM_MAX_CONCURRENCY'])
+
+# /detect/batch: images go through the detector GROUP_SIZE at a time
+app.config['BATCH_UPLOAD_GROUP_SIZE'] = int(os.environ.get('ECOWISE_BATCH_UPLOAD_GROUP_SIZE', app.config['BATCH_MAX_SIZE']))
+app.config['BATCH_UPLOAD_MAX_IMAGES'] = int(os.environ.get('ECOWISE_BATCH_UPLOAD_MAX_IMAGES', 1000))
+app.config['BATCH_UPLOAD_MAX_IMAGE_BYTES'] = 20 * 1024 * 1024
+
+# Keeping originals is optional and happens off the request path. They are
+# stored once per content under UPLOAD_FOLDER/originals (by SHA-256) with a
+# thumbnail for the history UI; least recently used originals are evicted
+# beyond UPLOAD_MAX_BYTES or after UPLOAD_MAX_AGE_DAYS (thumbnails stay while
+# history refers to them), and unreferenced uploads after the grace period.
+# At most UPLOAD_MAX_PENDING_BYTES of images wait to be written; uploads past
+# that are answered as usual but not kept
+app.config['SAVE_UPLOADS'] = os.environ.get('ECOWISE_SAVE_UPLOADS', '1') == '1'
+app.config['UPLOAD_MAX_BYTES'] = int(os.environ.get('ECOWISE_UPLOAD_MAX_BYTES', 2 * 1024 ** 3))
+app.config['UPLOAD_MAX_AGE_DAYS'] = float(os.environ.get('ECOWISE_UPLOAD_MAX_AGE_DAYS', 30))
+app.config['UPLOAD_UNREFERENCED_GRACE_SECONDS'] = int(os.environ.get('ECOWISE_UPLOAD_UNREFERENCED_GRACE_SECONDS', 3600))
+app.config['THUMBNAIL_SIZE'] = int(os.environ.get('ECOWISE_THUMBNAIL_SIZE', 128))
+app.config['UPLOAD_MAX_PENDING_BYTES'] = int(os.environ.get('ECOWISE_UPLOAD_MAX_PENDING_BYTES', 256 * 1024 ** 2))
+upload_store = UploadStore(
+    app.config['UPLOAD_FOLDER'],
+    db,
+    app.config['UPLOAD_MAX_BYTES'],
+    app.config['UPLOAD_MAX_AGE_DAYS'] * 86400,
+    app.config['UPLOAD_UNREFERENCED_GRACE_SECONDS'],
+    app.config['THUMBNAIL_SIZE'],
+    max_pending_bytes=app.config['UPLOAD_MAX_PENDING_BYTES']
+)
+
+# Detection cache: identical uploads skip decoding and inference
+app.config['CACHE_MEMORY_ENTRIES'] = int(os.environ.get('ECOWISE_CACHE_MEMORY_ENTRIES', 1024))
+app.config['CACHE_TTL_SECONDS'] = int(os.environ.get('ECOWISE_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+app.config['CACHE_DB_ENTRIES'] = int(os.environ.get('ECOWISE_CACHE_DB_ENTRIES', 50000))
+detection_cache = DetectionCache(
+    db,
+    app.config['CACHE_MEMORY_ENTRIES'],
+    app.config['CACHE_TTL_SECONDS'],
+    app.config['CACHE_DB_ENTRIES']
+)
+
+# Near-duplicate uploads: an upload whose perceptual hash is within
+# NEAR_DUPLICATE_DISTANCE bits (of 64) of one the same user sent in the last
+# NEAR_DUPLICATE_TTL_SECONDS reuses those detections and earns no points.
+# On the sample images, JPEG recompression, halving the size and a 2% crop
+# move the hash by at most 4 bits, a 5% crop by 12-16 and unrelated photos by
+# 30 or more, so 6 only catches the same photo sent again. Uploads without a
+# username (the shared ANONYMOUS_USERNAME) are never compared with each other.
+app.config['NEAR_DUPLICATES'] = os.environ.get('ECOWISE_NEAR_DUPLICATES', '1') == '1'
+app.config['NEAR_DUPLICATE_DISTANCE'] = int(os.environ.get('ECOWISE_NEAR_DUPLICATE_DISTANCE', 6))
+app.config['NEAR_DUPLICATE_TTL_SECONDS'] = int(os.environ.get('ECOWISE_NEAR_DUPLICATE_TTL_SECONDS', 3600))
+app.config['NEAR_DUPLICATE_MAX_PER_USER'] = int(os.environ.get('ECOWISE_NEAR_DUPLICATE_MAX_PER_USER', 64))
+NEAR_DUPLICATE = 'near_duplicate'
+ANONYMOUS_USERNAME = 'EcoStudent'
+DETECTION_FAILED = "Detection failed, try again later"
+near_duplicates = None
+if app.config['NEAR_DUPLICATES']:
+    near_duplicates = NearDuplicateIndex(
+        app.config['NEAR_DUPLICATE_DISTANCE'],
+        app.config['NEAR_DUPLICATE_TTL_SECONDS'],
+        app.config['NEAR_DUPLICATE_MAX_PER_USER']
+    )
+
+# Recycling centers are loaded once into a spatial grid, an id lookup and
+# pre-serialized (and pre-gzipped) /recycling-centers bodies; edits to the
+# file are picked up within CENTERS_CHECK_SECONDS
+app.config['CENTERS_FILE'] = os.environ.get('ECOWISE_CENTERS_FILE', DEFAULT_CENTERS_FILE)
+app.config['CENTERS_CHECK_SECONDS'] = float(os.environ.get('ECOWISE_CENTERS_CHECK_SECONDS', 5))
+app.config['CENTERS_MAX_AGE'] = int(os.environ.get('ECOWISE_CENTERS_MAX_AGE', 3600))
+app.config['NEARBY_DEFAULT_K'] = int(os.environ.get('ECOWISE_NEARBY_DEFAULT_K', 20))
+app.config['NEARBY_MAX_K'] = 500
+app.config['BULK_MAX_ORIGINS'] = int(os.environ.get('ECOWISE_BULK_MAX_ORIGINS', 100000))
+center_catalog = CenterCatalog(app.config['CENTERS_FILE'], app.config['CENTERS_CHECK_SECONDS'])
+
+# Optional write-behind for /user/<username>/update: deltas are coalesced per
+# user and flushed in one transaction every WRITE_BEHIND_FLUSH_MS (or once
+# WRITE_BEHIND_MAX_PENDING deltas are queued); reads include pending deltas
+app.config['WRITE_BEHIND'] = os.environ.get('ECOWISE_WRITE_BEHIND', '0') == '1'
+app.config['WRITE_BEHIND_FLUSH_MS'] = float(os.environ.get('ECOWISE_WRITE_BEHIND_FLUSH_MS', 200))
+app.config['WRITE_BEHIND_MAX_PENDING'] = int(os.environ.get('ECOWISE_WRITE_BEHIND_MAX_PENDING', 500))
+points_buffer = None
+if app.config['WRITE_BEHIND']:
+    points_buffer = PointsWriteBuffer(db, app.config['WRITE_BEHIND_FLUSH_MS'], app.config['WRITE_BEHIND_MAX_PENDING'])
+    atexit.register(points_buffer.close)
+
+def read_user(username, reader=None):
+    """db.get_user (or another call returning the user) plus any buffered deltas"""
+    reader = reader or (lambda: db.get_user(username))
+    if points_buffer is None:
+        return reader()
+    return points_buffer.read(username, reader)
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
 
-print("🚀 EcoWise Server Starting...")
-print("✅ Database: SQLite (ecowise.db)")
-print("✅ AI: YOLOv8 Service")
-print("📍 Access at: http://localhost:5000")
+def save_upload_async(image_key, image_bytes):
+    """
+    Persist the upload in the content-addressed store when SAVE_UPLOADS is on.
+    Returns the key history rows should reference, or None (not kept, also
+    when the store's write queue is full).
+    """
+    if not app.config['SAVE_UPLOADS'] or not upload_store.save_async(image_key, image_bytes):
+        return None
+    return image_key
+
+def thumbnail_url(image_key):
+    """URL of a stored upload's thumbnail (it may still be generating)"""
+    # A plain path: detection jobs build responses outside any request context
+    return f"/uploads/{image_key}/thumbnail" if image_key else None
+
+logger.info("EcoWise server starting", extra={"database": "sqlite", "inference_mode": app.config['INFERENCE_MODE']})
+
+@app.before_request
+def start_request_timer():
+    request.environ['ecowise.started'] = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    started = request.environ.get('ecowise.started')
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint or 'unmatched',
+            method=request.method,
+            status=response.status_code
+        )
+    return response
 
 @app.route('/')
 def home():
@@ -34,80 +225,576 @@ def home():
         "features": ["object_detection", "user_profiles", "recycling_history", "eco_points"]
     })
 
-@app.route('/detect', methods=['POST'])
-def detect_objects():
-    try:
-        if 'image' not in request.files:
-            return jsonify({"error": "No image file"}), 400
-        
-        file = request.files['image']
-        username = request.form.get('username', 'EcoStudent')
-        
-        if file.filename == '':
-            return jsonify({"error": "No file selected"}), 400
-        
-        print(f"📸 Processing: {file.filename}")
+def find_duplicate(username, cache_key, image_hash=None):
+    """Detections of the user's recent upload this one duplicates, or None"""
+    if near_duplicates is None or username is None:
+        return None
+    return near_duplicates.find(username, cache_key, image_hash)
+
+def remember_upload(username, cache_key, image_hash, detected_objects):
+    if near_duplicates is not None and username is not None:
+        near_duplicates.add(username, cache_key, image_hash, detected_objects)
+
+def points_for(analysis_result, cache_tier):
+    """(eco_points, items) to award; re-submitted near-duplicates earn nothing"""
+    if cache_tier == NEAR_DUPLICATE:
+        return 0, 0
+    return analysis_result['eco_points'], analysis_result['detected_count']
+
+def detect_uploads(uploads, username=None):
+    """
+    Cache lookup, in-memory decode and inference for [(image_bytes, filename)].
+    Cache misses go to the detector together so they can share batches.
+    With a username other than ANONYMOUS_USERNAME, near-duplicates of that
+    user's recent uploads reuse their detections (cache tier 'near_duplicate').
+    Returns one (detected_objects, cache_tier, error, image_key) per upload;
+    image_key is the stored upload's SHA-256, or None when it isn't kept.
+    error is DETECTION_FAILED when the detector itself failed.
+    """
+    if username == ANONYMOUS_USERNAME:
+        username = None  # shared by everyone who didn't give a name
+    results = [None] * len(uploads)
+    digests = [None] * len(uploads)
+    misses = []
+    for i, (image_bytes, filename) in enumerate(uploads):
+        # Look up previous results for identical image bytes
+        with DETECT_STAGE_SECONDS.time(stage='cache_lookup'):
+            digests[i] = hashlib.sha256(image_bytes).hexdigest()
+            cache_key = DetectionCache.key_for_digest(digests[i], ai_engine.model_id, ai_engine.conf)
+            detected_objects, cache_tier = find_duplicate(username, cache_key), NEAR_DUPLICATE
+            if detected_objects is None:
+                detected_objects, cache_tier = detection_cache.get(cache_key)
+        if detected_objects is not None:
+            logger.debug("Cache hit", extra={"tier": cache_tier, "upload": filename})
+            if cache_tier != NEAR_DUPLICATE:
+                remember_upload(username, cache_key, None, detected_objects)
+            results[i] = (detected_objects, cache_tier, None)
+            continue
         
-        # Save file securely
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        # Decode straight from the request buffer (no save-then-reload)
+        try:
+            with DETECT_STAGE_SECONDS.time(stage='decode'):
+                image = decode_upload(image_bytes, app.config['MAX_IMAGE_SIDE'])
+        except Exception as e:
+            logger.warning("Could not decode %s: %s", filename, e)
+            results[i] = (None, None, "Invalid image file")
+            continue
         
+        # Same item re-photographed, recompressed or slightly cropped
+        phash = None
+        if near_duplicates is not None and username is not None:
+            with DETECT_STAGE_SECONDS.time(stage='phash'):
+                phash = perceptual_hash(image)
+            detected_objects = find_duplicate(username, cache_key, phash)
+            if detected_objects is not None:
+                logger.debug("Near-duplicate upload", extra={"upload": filename, "username": username})
+                remember_upload(username, cache_key, phash, detected_objects)
+                results[i] = (detected_objects, NEAR_DUPLICATE, None)
+                continue
+        misses.append((i, cache_key, image, phash))
+    
+    if misses:
         # REAL AI detection using YOLOv8
-        detected_objects = ai_engine.detect_objects(file_path)
+        # The 'detector' stage includes queueing for a batch or worker; the
+        # model itself is timed as 'inference' and 'postprocess'
+        try:
+            with DETECT_STAGE_SECONDS.time(stage='detector'):
+                detections = detector.detect_batch([image for _, _, image, _ in misses])
+        except DetectionError as e:
+            logger.error("Detection failed for %d uploads: %s", len(misses), e)
+            detections = [None] * len(misses)
+        for (i, cache_key, _, phash), detected_objects in zip(misses, detections):
+            if detected_objects is None:
+                # Never cached or remembered, so the next attempt runs the model again
+                results[i] = (None, None, DETECTION_FAILED)
+                continue
+            detection_cache.put(cache_key, detected_objects)
+            remember_upload(username, cache_key, phash, detected_objects)
+            results[i] = (detected_objects, None, None)
+    
+    # Every decodable upload is kept (written once per distinct content)
+    for i, (detected_objects, cache_tier, error) in enumerate(results):
+        image_key = None if error else save_upload_async(digests[i], uploads[i][0])
+        results[i] = (detected_objects, cache_tier, error, image_key)
+        for obj in detected_objects or ():
+            DETECTED_OBJECTS.inc(name=obj['name'])
+    return results
+
+def run_detection(image_bytes, filename, username):
+    """
+    Full detection pipeline shared by /detect and the job workers:
+    cache lookup, in-memory decode, inference, recommendations and DB writes.
+    Raises ValueError for uploads that cannot be decoded and DetectionError
+    when the detector fails.
+    """
+    detected_objects, cache_tier, error, image_key = detect_uploads([(image_bytes, filename)], username)[0]
+    if error == DETECTION_FAILED:
+        raise DetectionError(error)
+    if error:
+        raise ValueError(error)
+    
+    with DETECT_STAGE_SECONDS.time(stage='recommendation'):
         analysis_result = ai_engine.get_recommendation(detected_objects)
+    eco_points, items = points_for(analysis_result, cache_tier)
+    
+    # Save to database in one transaction; returns the updated user info
+    user_info = read_user(username, lambda: db.record_detection(
+        username, 
+        filename, 
+        detected_objects, 
+        eco_points,
+        items,
+        analysis_result['recommendations'],
+        image_hash=image_key
+    ))
+    
+    logger.debug("Analysis complete", extra={"upload": filename, "objects": len(detected_objects)})
+    
+    return {
+        "success": True,
+        "filename": filename,
+        "detected_objects": detected_objects,
+        "recommendations": analysis_result["recommendations"],
+        "eco_points": eco_points,
+        "objects_detected": analysis_result["detected_count"],
+        "carbon_saved_kg": eco_points * 0.3, # Estimate
+        "user_stats": user_info,
+        "duplicate": cache_tier == NEAR_DUPLICATE,
+        "thumbnail_url": thumbnail_url(image_key),
+        "cache": {"hit": cache_tier is not None, "tier": cache_tier}
+    }
+
+def detector_busy():
+    return jsonify({"error": "Detector is busy, retry shortly or use /detect/jobs"}), 503, {"Retry-After": "2"}
+
+def event_stream(events):
+    """SSE response holding a stream slot until it is closed, or a 503 if none is free"""
+    if not stream_slots.try_acquire():
+        return jsonify({"error": "Too many open streams, retry shortly"}), 503, {"Retry-After": "5"}
+    response = Response(events, mimetype='text/event-stream', headers={"Cache-Control": "no-cache"})
+    response.call_on_close(stream_slots.release)
+    return response
+
+def read_upload():
+    """Return (file, username, error_response) for the multipart upload"""
+    if 'image' not in request.files:
+        return None, None, (jsonify({"error": "No image file"}), 400)
+    
+    file = request.files['image']
+    username = request.form.get('username') or ANONYMOUS_USERNAME
+    
+    if file.filename == '':
+        return None, None, (jsonify({"error": "No file selected"}), 400)
+    
+    return file, username, None
+
+@app.route('/detect', methods=['POST'])
+def detect_objects():
+    try:
+        # Receiving and parsing the multipart body happens on first access
+        with DETECT_STAGE_SECONDS.time(stage='upload'):
+            file, username, error = read_upload()
+            image_bytes = file.read() if file else None
+        if error:
+            return error
         
-        # Save to database
-        db.update_user_points(username, analysis_result['eco_points'], analysis_result['detected_count'])
-        db.add_recycling_history(
-            username, 
-            file.filename, 
-            detected_objects, 
-            analysis_result['eco_points'],
-            analysis_result['recommendations']
-        )
+        if not detect_slots.try_acquire():
+            return detector_busy()
+        try:
+            return jsonify(run_detection(image_bytes, file.filename, username))
+        finally:
+            detect_slots.release()
         
-        # Get updated user info
-        user_info = db.get_user(username)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except DetectionError as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        logger.exception("Error in /detect: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+def iter_batch_images(fields):
+    """(filename, image_bytes) from the /detect/batch body, read as a stream"""
+    max_bytes = app.config['BATCH_UPLOAD_MAX_IMAGE_BYTES']
+    if request.mimetype == 'multipart/form-data':
+        boundary = request.mimetype_params.get('boundary')
+        if not boundary:
+            raise ValueError("Missing multipart boundary")
+        return iter_multipart_images(request.stream, boundary, fields, max_bytes)
+    if request.mimetype in ZIP_MIMETYPES:
+        return iter_zip_images(request.stream, max_bytes)
+    raise ValueError("Send images as multipart/form-data or a zip archive")
+
+@app.route('/detect/batch', methods=['POST'])
+def detect_batch():
+    """
+    Detect objects in many images (multipart files and/or zip archives, or a
+    raw zip body). Streams one NDJSON line per image as soon as its batch is
+    done; all points are committed in one transaction after the last image.
+    """
+    fields = {}
+    try:
+        images = iter_batch_images(fields)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    batch_size = app.config['BATCH_UPLOAD_GROUP_SIZE']
+    max_images = app.config['BATCH_UPLOAD_MAX_IMAGES']
+    
+    def batch_username():
+        return fields.get('username') or request.args.get('username') or ANONYMOUS_USERNAME
+    
+    def run_group(group, offset, records):
+        for i, ((image_bytes, filename), (detected_objects, cache_tier, error, image_key)) in enumerate(
+                zip(group, detect_uploads(group, batch_username()))):
+            line = {"index": offset + i, "filename": filename}
+            if error:
+                line.update(type="error", error=error)
+            else:
+                with DETECT_STAGE_SECONDS.time(stage='recommendation'):
+                    analysis_result = ai_engine.get_recommendation(detected_objects)
+                eco_points, items = points_for(analysis_result, cache_tier)
+                records.append((
+                    filename,
+                    detected_objects,
+                    eco_points,
+                    items,
+                    analysis_result['recommendations'],
+                    image_key
+                ))
+                line.update(
+                    type="result",
+                    detected_objects=detected_objects,
+                    recommendations=analysis_result['recommendations'],
+                    eco_points=eco_points,
+                    objects_detected=analysis_result['detected_count'],
+                    duplicate=cache_tier == NEAR_DUPLICATE,
+                    thumbnail_url=thumbnail_url(image_key),
+                    cache={"hit": cache_tier is not None, "tier": cache_tier}
+                )
+            yield json.dumps(line) + "\n"
+    
+    def lines():
+        records, group, count = [], [], 0
+        try:
+            for filename, image_bytes in images:
+                if count >= max_images:
+                    yield json.dumps({"type": "error", "error": f"Only the first {max_images} images were processed"}) + "\n"
+                    break
+                group.append((image_bytes, os.path.basename(filename)))
+                count += 1
+                if len(group) == batch_size:
+                    yield from run_group(group, count - len(group), records)
+                    group = []
+            if group:
+                yield from run_group(group, count - len(group), records)
+        except ValueError as e:
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
         
-        print(f"✅ Analysis complete: {len(detected_objects)} objects detected")
+        username = batch_username()
+        user_info = None
+        if records:
+            user_info = read_user(username, lambda: db.record_detections(username, records))
+        logger.info("Batch complete", extra={"images": count, "recorded": len(records), "username": username})
+        yield json.dumps({
+            "type": "summary",
+            "images": count,
+            "recorded": len(records),
+            "eco_points": sum(record[2] for record in records),
+            "objects_detected": sum(record[3] for record in records),
+            "user_stats": user_info
+        }) + "\n"
+    
+    if not detect_slots.try_acquire():
+        return detector_busy()
+    # Held until the stream is closed, whether or not it was read to the end
+    response = Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+    response.call_on_close(detect_slots.release)
+    return response
+
+@app.route('/detect/jobs', methods=['POST'])
+def create_detection_job():
+    """Accept an upload and return a job id immediately"""
+    try:
+        file, username, error = read_upload()
+        if error:
+            return error
+        
+        job_id = detection_jobs.submit(username, file.filename, file.read())
+        logger.debug("Queued detection job", extra={"job_id": job_id, "upload": file.filename})
         
         return jsonify({
             "success": True,
-            "filename": file.filename,
-            "detected_objects": detected_objects,
-            "recommendations": analysis_result["recommendations"],
-            "eco_points": analysis_result["eco_points"],
-            "objects_detected": analysis_result["detected_count"],
-            "carbon_saved_kg": analysis_result["eco_points"] * 0.3, # Estimate
-            "user_stats": user_info
-        })
+            "job_id": job_id,
+            "status": "pending",
+            "status_url": f"/detect/jobs/{job_id}",
+            "events_url": f"/detect/jobs/{job_id}/events"
+        }), 202
         
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
     except Exception as e:
-        print(f"❌ Error in /detect: {e}")
+        logger.exception("Error in /detect/jobs: %s", e)
         return jsonify({"error": str(e)}), 500
 
+@app.route('/detect/jobs/<job_id>')
+def get_detection_job(job_id):
+    """Poll a job; ?wait=<seconds> long-polls until it finishes"""
+    try:
+        wait = min(request.args.get('wait', 0, type=float), app.config['JOB_MAX_WAIT_SECONDS'])
+        # Without a free stream slot the poll answers with the current state
+        if wait > 0 and stream_slots.try_acquire():
+            try:
+                job = detection_jobs.wait(job_id, wait)
+            finally:
+                stream_slots.release()
+        else:
+            job = detection_jobs.get(job_id)
+        
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        return jsonify(job)
+    except Exception as e:
+        logger.exception("Error in /detect/jobs/<id>: %s", e)
+        return jsonify({"error": "Database error"}), 500
+
+@app.route('/detect/jobs/<job_id>/events')
+def stream_detection_job(job_id):
+    """Server-sent events: one 'status' event per change until the job finishes"""
+    job = detection_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    
+    def events(job):
+        yield f"event: status\ndata: {json.dumps(job)}\n\n"
+        while job and job['status'] not in FINISHED_STATUSES:
+            changed = detection_jobs.wait(job_id, 15, known_status=job['status'])
+            if changed and changed['status'] == job['status']:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: status\ndata: {json.dumps(changed)}\n\n"
+            job = changed
+    
+    return event_stream(events(job))
+
+def detect_camera_frame(image_bytes):
+    """Decode one camera frame in memory and run it through the detector"""
+    try:
+        image = decode_upload(image_bytes, app.config['MAX_IMAGE_SIDE'])
+    except Exception:
+        raise ValueError("Invalid camera frame")
+    return detector.detect_objects(image)
+
+def award_camera_objects(username, session_id, detections):
+    """Record points for objects a camera session's tracker has just confirmed"""
+    analysis_result = ai_engine.get_recommendation(detections)
+    user_info = read_user(username, lambda: db.record_detection(
+        username,
+        f"camera-{session_id}",
+        detections,
+        analysis_result['eco_points'],
+        analysis_result['detected_count'],
+        analysis_result['recommendations']
+    ))
+    return {
+        "objects": [d['name'] for d in detections],
+        "eco_points": analysis_result['eco_points'],
+        "recommendations": analysis_result['recommendations'],
+        "user_stats": user_info
+    }
+
+@app.route('/camera/sessions', methods=['POST'])
+def create_camera_session():
+    """Open a live camera session; frames go to frames_url, results come from events_url"""
+    data = request.get_json(silent=True) or {}
+    username = data.get('username', request.form.get('username', ANONYMOUS_USERNAME))
+    try:
+        session = camera_sessions.create(username)
+    except CameraSessionLimit as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "10"}
+    
+    logger.info("Camera session opened", extra={"session_id": session.id, "username": username})
+    return jsonify({
+        "success": True,
+        "session_id": session.id,
+        "frames_url": f"/camera/sessions/{session.id}/frames",
+        "events_url": f"/camera/sessions/{session.id}/events"
+    }), 201
+
+@app.route('/camera/sessions/<session_id>/frames', methods=['POST'])
+def push_camera_frames(session_id):
+    """
+    Send frames to a session: a multipart/x-mixed-replace (or multipart/mixed)
+    body streamed with one JPEG per part, a raw image body, or a regular
+    multipart form with an 'image' file for a single frame.
+    """
+    session = camera_sessions.get(session_id)
+    if not session:
+        return jsonify({"error": "Camera session not found"}), 404
+    
+    try:
+        mimetype = request.mimetype
+        if mimetype in ('multipart/x-mixed-replace', 'multipart/mixed'):
+            boundary = request.mimetype_params.get('boundary')
+            if not boundary:
+                return jsonify({"error": "Missing multipart boundary"}), 400
+            # A streamed body holds this thread for as long as the camera sends
+            if not stream_slots.try_acquire():
+                return jsonify({"error": "Too many open streams, send single frames"}), 503, {"Retry-After": "5"}
+            try:
+                for frame in iter_multipart_frames(request.stream, boundary, app.config['CAMERA_MAX_FRAME_BYTES']):
+                    session.submit_frame(frame)
+            finally:
+                stream_slots.release()
+        elif 'image' in request.files:
+            session.submit_frame(request.files['image'].read())
+        else:
+            frame = request.get_data()
+            if not frame:
+                return jsonify({"error": "No frame data"}), 400
+            session.submit_frame(frame)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 413
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    
+    return jsonify(session.summary())
+
+@app.route('/camera/sessions/<session_id>/events')
+def stream_camera_events(session_id):
+    """Server-sent events: one 'frame' event per processed frame until the session closes"""
+    session = camera_sessions.get(session_id)
+    if not session:
+        return jsonify({"error": "Camera session not found"}), 404
+    
+    def events(session):
+        seq = 0
+        while True:
+            batch = session.events_after(seq, 15)
+            if not batch:
+                if session.closed:
+                    break
+                yield ": keep-alive\n\n"
+                continue
+            for seq, event in batch:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        yield f"event: closed\ndata: {json.dumps(session.summary())}\n\n"
+    
+    return event_stream(events(session))
+
+@app.route('/camera/sessions/<session_id>', methods=['GET', 'DELETE'])
+def camera_session(session_id):
+    """Session counters; DELETE closes the session and returns its final summary"""
+    if request.method == 'DELETE':
+        summary = camera_sessions.close(session_id)
+    else:
+        session = camera_sessions.get(session_id)
+        summary = session.summary() if session else None
+    if summary is None:
+        return jsonify({"error": "Camera session not found"}), 404
+    return jsonify(summary)
+
+@app.route('/detect/stats')
+def detect_stats():
+    """Inference scheduler, detection cache and job queue statistics"""
+    stats = detector.stats()
+    stats["concurrency"] = detect_slots.stats()
+    stats["streams"] = stream_slots.stats()
+    stats["cache"] = detection_cache.stats()
+    stats["jobs"] = detection_jobs.stats()
+    stats["camera"] = camera_sessions.stats()
+    stats["uploads"] = upload_store.stats()
+    if near_duplicates is not None:
+        stats["near_duplicates"] = near_duplicates.stats()
+    if points_buffer is not None:
+        stats["write_behind"] = points_buffer.stats()
+    return jsonify(stats)
+
+# Gauges and counters read from the components' stats() when /metrics is scraped
+def detector_stat(batch_key, process_key):
+    stats = detector.stats()
+    return stats[batch_key] if stats['mode'] == 'batch' else stats[process_key]
+
+registry.callback('ecowise_detector_queue_depth', 'Images waiting for a batch or worker',
+                  lambda: detector_stat('queue_depth', 'in_flight'))
+registry.callback('ecowise_detector_images_total', 'Images run through the detector',
+                  lambda: detector_stat('images_processed', 'completed'), type='counter')
+registry.callback('ecowise_detect_requests_active', 'Detection requests waiting on the detector',
+                  lambda: detect_slots.stats()['active'])
+registry.callback('ecowise_detect_requests_rejected_total', 'Detection requests turned away with 503 at the concurrency limit',
+                  lambda: detect_slots.stats()['rejected'], type='counter')
+registry.callback('ecowise_streams_open', 'SSE, camera frame and long-poll streams holding a request thread',
+                  lambda: stream_slots.stats()['active'])
+registry.callback('ecowise_streams_rejected_total', 'Streams turned away with 503 at the stream limit',
+                  lambda: stream_slots.stats()['rejected'], type='counter')
+registry.callback('ecowise_detection_cache_lookups_total', 'Detection cache lookups by result',
+                  lambda: {(tier,): detection_cache.stats()[tier] for tier in ('memory_hits', 'db_hits', 'misses')},
+                  ['result'], type='counter')
+registry.callback('ecowise_detection_cache_memory_entries', 'Detections held in the in-memory cache',
+                  lambda: detection_cache.stats()['memory_entries'])
+registry.callback('ecowise_near_duplicate_hits_total', 'Uploads answered from a near-duplicate of the same user',
+                  lambda: {(kind,): near_duplicates.stats()[f"{kind}_hits"] for kind in ('exact', 'near')}
+                  if near_duplicates else {}, ['match'], type='counter')
+registry.callback('ecowise_detection_jobs_outstanding', 'Detection jobs queued or running',
+                  lambda: detection_jobs.stats()['outstanding'])
+registry.callback('ecowise_camera_sessions_open', 'Open live camera sessions',
+                  lambda: camera_sessions.stats()['open_sessions'])
+registry.callback('ecowise_camera_frames_dropped_total', 'Camera frames dropped while inference was busy',
+                  lambda: camera_sessions.stats()['frames_dropped'], type='counter')
+registry.callback('ecowise_upload_original_bytes', 'Bytes of original uploads kept on disk',
+                  lambda: db.upload_storage_stats()['original_bytes'])
+registry.callback('ecowise_uploads_dropped_total', 'Uploads not kept because the upload write queue was full',
+                  lambda: upload_store.stats()['dropped'], type='counter')
+registry.callback('ecowise_write_behind_pending_deltas', 'Point deltas waiting for the next flush',
+                  lambda: points_buffer.stats()['pending_deltas'] if points_buffer else None)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of the metrics above and in metrics.py"""
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
 @app.route('/user/<username>')
 def get_user(username):
     try:
-        user = db.get_user(username)
+        user = read_user(username)
         if user:
             return jsonify(user)
         else:
             return jsonify({"error": "User not found"}), 404
     except Exception as e:
-        print(f"❌ Error in /user: {e}")
+        logger.exception("Error in /user: %s", e)
         return jsonify({"error": "Database error"}), 500
 
 @app.route('/user/<username>/history')
 def get_user_history(username):
+    """Paged history: ?limit=<page size>&cursor=<next_cursor from the previous page>"""
     try:
-        history = db.get_user_history(username, 5)
-        return jsonify({"history": history})
+        limit = request.args.get('limit', app.config['HISTORY_PAGE_SIZE'], type=int)
+        limit = max(1, min(limit, app.config['HISTORY_MAX_PAGE_SIZE']))
+        history, next_cursor = db.get_user_history_page(username, limit, request.args.get('cursor'))
+        for item in history:
+            item['thumbnail_url'] = thumbnail_url(item.pop('image_hash'))
+        return jsonify({"history": history, "next_cursor": next_cursor})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"❌ Error in /user/history: {e}")
+        logger.exception("Error in /user/history: %s", e)
         return jsonify({"error": "Database error"}), 500
 
+@app.route('/uploads/<image_key>/thumbnail')
+def get_upload_thumbnail(image_key):
+    """
+    Thumbnail of a stored upload. The key is the content's SHA-256, so the
+    response never changes and can be cached forever; originals are never served.
+    """
+    path = upload_store.thumbnail_file(image_key)
+    if path is None:
+        # Unknown key, or the thumbnailer hasn't got to it yet
+        return jsonify({"error": "Thumbnail not available"}), 404, {"Retry-After": "2"}
+    response = send_file(path, mimetype='image/jpeg', etag=image_key, max_age=31536000, conditional=True)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 @app.route('/user/<username>/update', methods=['POST'])
 def update_user(username):
     try:
@@ -115,174 +802,61 @@ def update_user(username):
         points = data.get('points', 0)
         items = data.get('items', 0)
         
-        db.update_user_points(username, points, items)
-        user = db.get_user(username)
+        if points_buffer is not None:
+            points_buffer.add(username, points, items)
+        else:
+            db.update_user_points(username, points, items)
+        user = read_user(username)
         
         return jsonify({"success": True, "user": user})
     except Exception as e:
-        print(f"❌ Error in /user/update: {e}")
+        logger.exception("Error in /user/update: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/recycling-centers')
 def get_recycling_centers():
     """Get real recycling centers in Hassan with GPS coordinates"""
-    centers = [
-        {
-            "id": 1,
-            "name": "Hassan City Municipal Waste Center",
-            "type": "recycling",
-            "address": "Near New Bus Stand, B.M. Road, Hassan 573201",
-            "phone": "+91 8172 268 500",
-            "hours": "8:00 AM - 6:00 PM (Mon-Sat)",
-            "services": ["Plastic", "Paper", "Glass", "Metal", "E-waste"],
-            "rating": 4.3,
-            "lat": 13.0072,
-            "lng": 76.1028,
-            "website": "http://hassanmunicipal.gov.in"
-        },
-        {
-            "id": 2,
-            "name": "Hassan Plastic Recycling Unit",
-            "type": "recycling",
-            "address": "Industrial Area, Katihalli, Hassan 573201",
-            "phone": "+91 8172 268 678",
-            "hours": "9:00 AM - 5:00 PM (Mon-Fri)",
-            "services": ["Plastic Bottles", "Containers", "Packaging"],
-            "rating": 4.1,
-            "lat": 13.0156,
-            "lng": 76.1187,
-            "website": ""
-        },
-        {
-            "id": 3,
-            "name": "GreenTech E-Waste Hassan",
-            "type": "recycling",
-            "address": "Near Railway Station, Hassan 573201",
-            "phone": "+91 94488 11223",
-            "hours": "9:30 AM - 6:30 PM (Mon-Sat)",
-            "services": ["Mobile Phones", "Laptops", "Batteries", "Electronics"],
-            "rating": 4.6,
-            "lat": 13.0022,
-            "lng": 76.1088,
-            "website": ""
-        },
-        {
-            "id": 4,
-            "name": "Hassan Paper Recycling Plant",
-            "type": "recycling",
-            "address": "Salagame Road, Hassan 573201",
-            "phone": "+91 8172 266 123",
-            "hours": "8:30 AM - 5:30 PM (Mon-Sat)",
-            "services": ["Newspaper", "Cardboard", "Office Paper", "Books"],
-            "rating": 4.2,
-            "lat": 13.0089,
-            "lng": 76.0923,
-            "website": ""
-        },
-        {
-            "id": 5,
-            "name": "Hassan Glass Collection Center",
-            "type": "recycling",
-            "address": "M.G. Road, Hassan 573201",
-            "phone": "+91 99000 22334",
-            "hours": "10:00 AM - 4:00 PM (Tue-Sun)",
-            "services": ["Glass Bottles", "Jars", "Containers"],
-            "rating": 4.0,
-            "lat": 13.0055,
-            "lng": 76.1012,
-            "website": ""
-        },
-        {
-            "id": 6,
-            "name": "Hassan Metal Scrap Center",
-            "type": "recycling",
-            "address": "H.N. Pura Road, Hassan 573201",
-            "phone": "+91 8172 277 890",
-            "hours": "8:00 AM - 5:00 PM (Mon-Fri)",
-            "services": ["Aluminum", "Copper", "Steel", "Brass"],
-            "rating": 4.4,
-            "lat": 13.0123,
-            "lng": 76.1045,
-            "website": ""
-        },
-        {
-            "id": 7,
-            "name": "Hassan Clothes Donation Center",
-            "type": "donation",
-            "address": "Near Malnad College, Hassan 573201",
-            "phone": "+91 80502 33445",
-            "hours": "9:00 AM - 5:00 PM (Mon-Sat)",
-            "services": ["Clothing", "Shoes", "Blankets"],
-            "rating": 4.7,
-            "lat": 13.0167,
-            "lng": 76.0998,
-            "website": ""
-        },
-        {
-            "id": 8,
-            "name": "Hassan Book Bank",
-            "type": "donation",
-            "address": "College Road, Hassan 573201",
-            "phone": "+91 98455 11223",
-            "hours": "10:00 AM - 4:00 PM (Wed-Sun)",
-            "services": ["Textbooks", "Novels", "Children Books"],
-            "rating": 4.8,
-            "lat": 13.0092,
-            "lng": 76.1067,
-            "website": ""
-        },
-        {
-            "id": 9,
-            "name": "Hassan Furniture Reuse Center",
-            "type": "donation",
-            "address": "K.R. Puram, Hassan 573201",
-            "phone": "+91 8172 228 456",
-            "hours": "9:30 AM - 5:30 PM (Tue-Sat)",
-            "services": ["Furniture", "Home Items", "Utensils"],
-            "rating": 4.5,
-            "lat": 13.0134,
-            "lng": 76.1001,
-            "website": ""
-        },
-        {
-            "id": 10,
-            "name": "Hassan Medical Waste Facility",
-            "type": "special",
-            "address": "Near HIMS Hospital, Hassan 573201",
-            "phone": "+91 8172 229 432",
-            "hours": "24/7 Emergency Service",
-            "services": ["Medical Waste", "Syringes", "Medicines"],
-            "rating": 4.9,
-            "lat": 13.0056,
-            "lng": 76.1034,
-            "website": ""
-        }
-    ]
-    return jsonify(centers)
+    centers = center_catalog.current()
+    gzipped = 'gzip' in request.accept_encodings
+    etag = centers.gzip_etag if gzipped else centers.etag
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={app.config['CENTERS_MAX_AGE']}",
+        "Vary": "Accept-Encoding"
+    }
+    
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=headers)
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return Response(centers.gzip_bytes, mimetype='application/json', headers=headers)
+    return Response(centers.json_bytes, mimetype='application/json', headers=headers)
 
 @app.route('/user-location', methods=['POST'])
 def get_user_location():
     """Get user's current location and find nearby centers"""
     try:
-        data = request.json
-        user_lat = data.get('lat')
-        user_lng = data.get('lng')
+        data = request.get_json(silent=True) or {}
+        user_lat = data.get('lat', request.args.get('lat', type=float))
+        user_lng = data.get('lng', request.args.get('lng', type=float))
         
-        if not user_lat or not user_lng:
+        if user_lat is None or user_lng is None:
             return jsonify({"error": "Location coordinates required"}), 400
         
-        # Get all centers
-        centers_response = get_recycling_centers()
-        centers = centers_response.get_json()
+        # Optional limits: the k nearest centers and/or those within radius_km
+        k = data.get('k', request.args.get('k', app.config['NEARBY_DEFAULT_K'], type=int))
+        radius_km = data.get('radius_km', request.args.get('radius_km', type=float))
+        k = min(max(int(k), 0), app.config['NEARBY_MAX_K'])
+        if radius_km is not None:
+            radius_km = float(radius_km)
         
-        # Calculate distances and sort by proximity
-        for center in centers:
-            distance = calculate_distance(user_lat, user_lng, center['lat'], center['lng'])
+        index = center_catalog.current().index
+        centers = []
+        for position, distance in index.nearest(float(user_lat), float(user_lng), k, radius_km):
+            center = dict(index.centers[position])
             center['distance_km'] = round(distance, 2)
             center['distance'] = f"{round(distance, 2)} km"
-        
-        # Sort by distance
-        centers.sort(key=lambda x: x['distance_km'])
+            centers.append(center)
         
         return jsonify({
             "user_location": {"lat": user_lat, "lng": user_lng},
@@ -293,27 +867,69 @@ def get_user_location():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-def calculate_distance(lat1, lng1, lat2, lng2):
-    """Calculate distance between two coordinates in kilometers using Haversine formula"""
-    from math import radians, sin, cos, sqrt, atan2
+def read_bulk_origins():
+    """(lats, lngs, ids) from a CSV upload ('file') or a JSON body"""
+    if 'file' in request.files:
+        stream = io.TextIOWrapper(request.files['file'].stream, encoding='utf-8-sig', newline='')
+        return read_origins_csv(stream)
+    
+    data = request.get_json(silent=True) or {}
+    if 'origins' in data:
+        origins = data['origins']
+        lats = [origin['lat'] for origin in origins]
+        lngs = [origin['lng'] for origin in origins]
+        ids = [origin.get('id') for origin in origins]
+    else:
+        lats, lngs, ids = data.get('lats', []), data.get('lngs', []), data.get('ids')
+    if len(lats) != len(lngs):
+        raise ValueError("lats and lngs must have the same length")
+    return np.asarray(lats, dtype=np.float64), np.asarray(lngs, dtype=np.float64), ids
+
+@app.route('/recycling-centers/nearest', methods=['POST'])
+def bulk_nearest_centers():
+    """Top-k nearest centers for many origins, streamed back as NDJSON"""
+    try:
+        lats, lngs, ids = read_bulk_origins()
+    except (KeyError, TypeError, ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": f"Invalid origins: {e}"}), 400
     
-    R = 6371  # Earth radius in km
+    if len(lats) == 0:
+        return jsonify({"error": "Location coordinates required"}), 400
+    if len(lats) > app.config['BULK_MAX_ORIGINS']:
+        return jsonify({"error": f"At most {app.config['BULK_MAX_ORIGINS']} origins per request"}), 413
+    if not (np.all(np.abs(lats) <= 90) and np.all(np.abs(lngs) <= 180)):
+        return jsonify({"error": "Coordinates out of range"}), 400
     
-    lat1_rad = radians(lat1)
-    lat2_rad = radians(lat2)
-    delta_lat = radians(lat2 - lat1)
-    delta_lng = radians(lng2 - lng1)
+    k = min(max(request.args.get('k', 1, type=int), 1), app.config['NEARBY_MAX_K'])
+    radius_km = request.args.get('radius_km', type=float)
     
-    a = sin(delta_lat/2) * sin(delta_lat/2) + cos(lat1_rad) * cos(lat2_rad) * sin(delta_lng/2) * sin(delta_lng/2)
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
+    index = center_catalog.current().index
     
-    return R * c
+    def lines():
+        for i, positions, distances in index.nearest_many(lats, lngs, k, radius_km):
+            line = {
+                "index": i,
+                "lat": float(lats[i]),
+                "lng": float(lngs[i]),
+                "nearest": [
+                    {
+                        "id": index.centers[position]['id'],
+                        "name": index.centers[position]['name'],
+                        "distance_km": round(float(distance), 2)
+                    }
+                    for position, distance in zip(positions, distances)
+                ]
+            }
+            if ids is not None:
+                line["id"] = ids[i]
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+    
+    return Response(lines(), mimetype='application/x-ndjson')
 
 @app.route('/get-directions/<int:center_id>')
 def get_directions(center_id):
     """Get detailed directions to a specific recycling center"""
-    centers = get_recycling_centers().get_json()
-    center = next((c for c in centers if c['id'] == center_id), None)
+    center = center_catalog.current().by_id.get(center_id)
     
     if not center:
         return jsonify({"error": "Center not found"}), 404
@@ -372,30 +988,54 @@ def generate_landmarks(center):
 
 @app.route('/leaderboard')
 def get_leaderboard():
-    """Get top users by eco points"""
+    """Get top users by eco points (?limit=N, default 10)"""
+    try:
+        limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+        return jsonify(db.leaderboard.top(limit))
+    except Exception as e:
+        logger.exception("Error in /leaderboard: %s", e)
+        return jsonify({"error": "Server error"}), 500
+
+@app.route('/leaderboard/<username>')
+def get_leaderboard_rank(username):
+    """Get a user's rank plus neighbours above and below (?window=N, default 2)"""
     try:
-        # For demo purposes, return mock leaderboard
-        leaderboard = [
-            {"username": "EcoChampion", "eco_points": 450, "level": "Eco Champion"},
-            {"username": "GreenWarrior", "eco_points": 320, "level": "Eco Warrior"},
-            {"username": "EcoStudent", "eco_points": 150, "level": "Eco Warrior"},
-            {"username": "EarthFriend", "eco_points": 180, "level": "Eco Friend"},
-            {"username": "RecycleMaster", "eco_points": 280, "level": "Eco Warrior"}
-        ]
-        return jsonify(leaderboard)
+        window = max(0, min(request.args.get('window', 2, type=int), 50))
+        ranking = db.leaderboard.around(username, window)
+        if not ranking:
+            return jsonify({"error": "User not found"}), 404
+        return jsonify(ranking)
     except Exception as e:
-        print(f"❌ Error in /leaderboard: {e}")
+        logger.exception("Error in /leaderboard/<username>: %s", e)
         return jsonify({"error": "Server error"}), 500
 
 @app.route('/health')
+@app.route('/health/live')
 def health_check():
-    """Health check endpoint"""
+    """Liveness: the process is up and serving requests"""
     return jsonify({
-        "status": "healthy",
+        "status": "alive",
         "service": "EcoWise Backend",
-        "timestamp": "2024-01-01T00:00:00Z"
+        "timestamp": datetime.now(timezone.utc).isoformat()
     })
 
+@app.route('/health/ready')
+def readiness_check():
+    """Readiness: model loaded and warmed up, database reachable"""
+    model_ready = detector.ready()
+    db_reachable = db.ping()
+    ready = model_ready and db_reachable
+    
+    return jsonify({
+        "status": "ready" if ready else "not_ready",
+        "service": "EcoWise Backend",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "model_ready": model_ready,
+        "model": ai_engine.status(),
+        "inference_mode": app.config['INFERENCE_MODE'],
+        "database_reachable": db_reachable
+    }), 200 if ready else 503
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -405,6 +1045,32 @@ def not_found(error):
 def internal_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
+# Background detection jobs (POST /detect/jobs); unfinished jobs resume on
+# startup. serve.py passes its start time to every web worker, so jobs still
+# running in a sibling worker are not taken over
+app.config['SERVER_STARTED_AT'] = float(os.environ.get('ECOWISE_SERVER_STARTED_AT', time.time()))
+app.config['JOB_WORKERS'] = int(os.environ.get('ECOWISE_JOB_WORKERS', 4))
+app.config['JOB_MAX_PENDING'] = int(os.environ.get('ECOWISE_JOB_MAX_PENDING', 256))
+app.config['JOB_MAX_WAIT_SECONDS'] = 30
+detection_jobs = DetectionJobQueue(db, run_detection, app.config['JOB_WORKERS'], app.config['JOB_MAX_PENDING'])
+detection_jobs.resume_pending(app.config['SERVER_STARTED_AT'])
+
+# Live camera sessions: inference on every Nth frame (adaptive, at most
+# CAMERA_MAX_DETECT_EVERY) with object tracking in between
+app.config['CAMERA_MAX_SESSIONS'] = int(os.environ.get('ECOWISE_CAMERA_MAX_SESSIONS', 16))
+app.config['CAMERA_IDLE_TIMEOUT'] = float(os.environ.get('ECOWISE_CAMERA_IDLE_TIMEOUT', 60))
+app.config['CAMERA_MAX_DETECT_EVERY'] = int(os.environ.get('ECOWISE_CAMERA_MAX_DETECT_EVERY', 8))
+app.config['CAMERA_MAX_FRAME_BYTES'] = 10 * 1024 * 1024
+camera_sessions = CameraSessionManager(
+    detect_camera_frame,
+    award_camera_objects,
+    app.config['CAMERA_MAX_SESSIONS'],
+    app.config['CAMERA_IDLE_TIMEOUT'],
+    app.config['CAMERA_MAX_DETECT_EVERY']
+)
+atexit.register(camera_sessions.shutdown)
+
 if __name__ == '__main__':
-    print("🌱 Starting EcoWise Server...")
+    # Development server; run serve.py in production
+    logger.info("Serving on http://localhost:5000")
     app.run(debug=True, port=5000, host='0.0.0.0')
\ No newline at end of file
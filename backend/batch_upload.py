@@ -0,0 +1,206 @@
+"""
+Streaming readers for bulk /detect/batch uploads
+Images are pulled one at a time out of a multipart body or a zip archive as
+the request is read, so nothing is extracted to disk and only the current
+image is held in memory.
+"""
+
+import io
+import os
+import struct
+import zlib
+
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
+ZIP_MIMETYPES = ('application/zip', 'application/x-zip-compressed')
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_LOCAL_HEADER_SIGNATURE = 0x04034b50
+_DATA_DESCRIPTOR_SIGNATURE = 0x08074b50
+_FLAG_DATA_DESCRIPTOR = 0x08
+_ZIP64_EXTRA = 0x0001
+_STORED, _DEFLATED = 0, 8
+
+
+def is_image_name(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+
+def iter_multipart_images(stream, boundary, fields, max_image_bytes, chunk_size=65536):
+    """
+    Yield (filename, image_bytes) for every file part of a multipart/form-data
+    body. Zip files among the parts are expanded in memory. Plain form fields
+    are stored in `fields` as they are read.
+    """
+    decoder = MultipartDecoder(boundary.encode('latin-1'), max_form_memory_size=64 * 1024)
+    part, data = None, bytearray()
+
+    while True:
+        chunk = stream.read(chunk_size)
+        decoder.receive_data(chunk or None)
+        event = decoder.next_event()
+        while not isinstance(event, (NeedData, Epilogue)):
+            if isinstance(event, (Field, File)):
+                part, data = event, bytearray()
+            elif isinstance(event, Data):
+                data += event.data
+                if len(data) > max_image_bytes:
+                    raise ValueError(f"{part.filename or part.name} is larger than {max_image_bytes} bytes")
+                if not event.more_data:
+                    yield from _finish_part(part, bytes(data), fields, max_image_bytes)
+                    part, data = None, bytearray()
+            event = decoder.next_event()
+        if isinstance(event, Epilogue) or not chunk:
+            return
+
+
+def _finish_part(part, data, fields, max_image_bytes):
+    if isinstance(part, Field):
+        fields[part.name] = data.decode('utf-8', 'replace')
+    elif part.filename.lower().endswith('.zip'):
+        yield from iter_zip_images(io.BytesIO(data), max_image_bytes)
+    elif part.filename:
+        yield part.filename, data
+
+
+class _ZipStream:
+    """Forward-only reader with pushback for bytes a decompressor read too far"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._pushback = b''
+
+    def read(self, size):
+        if self._pushback:
+            data, self._pushback = self._pushback[:size], self._pushback[size:]
+            return data
+        return self._stream.read(size)
+
+    def unread(self, data):
+        self._pushback = data + self._pushback
+
+    def read_exact(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.read(size - len(data))
+            if not chunk:
+                raise ValueError("Zip archive is truncated")
+            data += chunk
+        return bytes(data)
+
+
+def iter_zip_images(stream, max_image_bytes, chunk_size=65536):
+    """
+    Yield (filename, image_bytes) for image entries of a zip archive by walking
+    its local file headers front to back; the central directory at the end is
+    never needed, so the archive can be read straight from the request.
+    Stored and deflated entries are supported.
+    """
+    stream = _ZipStream(stream)
+    while True:
+        header = stream.read(_LOCAL_HEADER.size)
+        if len(header) < 4 or struct.unpack_from('<I', header)[0] != _LOCAL_HEADER_SIGNATURE:
+            return  # central directory (or end of data): no more entries
+        if len(header) < _LOCAL_HEADER.size:
+            header += stream.read_exact(_LOCAL_HEADER.size - len(header))
+
+        (_, _, flags, method, _, _, _, compressed_size, size,
+         name_length, extra_length) = _LOCAL_HEADER.unpack(header)
+        filename = stream.read_exact(name_length).decode('utf-8', 'replace')
+        extra = stream.read_exact(extra_length)
+        zip64 = False
+        if compressed_size == 0xFFFFFFFF or size == 0xFFFFFFFF:
+            zip64, size, compressed_size = _zip64_sizes(extra, size, compressed_size)
+
+        wanted = (is_image_name(filename) and not filename.endswith('/')
+                  and not os.path.basename(filename).startswith('.')
+                  and not filename.startswith('__MACOSX/'))
+        has_descriptor = flags & _FLAG_DATA_DESCRIPTOR
+
+        if method == _DEFLATED and (has_descriptor or wanted):
+            data = _inflate(stream, None if has_descriptor else compressed_size,
+                            max_image_bytes if wanted else None, chunk_size)
+        elif not has_descriptor:
+            if wanted and method == _STORED:
+                if compressed_size > max_image_bytes:
+                    raise ValueError(f"{filename} is larger than {max_image_bytes} bytes")
+                data = stream.read_exact(compressed_size)
+            else:
+                _skip(stream, compressed_size, chunk_size)
+                data = None
+        else:
+            raise ValueError(f"Cannot stream zip entry {filename}: stored with a data descriptor")
+
+        if has_descriptor:
+            _skip_descriptor(stream, zip64)
+        if wanted and data is not None:
+            yield filename, data
+
+
+def _zip64_sizes(extra, size, compressed_size):
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, length = struct.unpack_from('<HH', extra, offset)
+        if header_id == _ZIP64_EXTRA:
+            values = extra[offset + 4:offset + 4 + length]
+            position = 0
+            if size == 0xFFFFFFFF:
+                size = struct.unpack_from('<Q', values, position)[0]
+                position += 8
+            if compressed_size == 0xFFFFFFFF:
+                compressed_size = struct.unpack_from('<Q', values, position)[0]
+            return True, size, compressed_size
+        offset += 4 + length
+    return True, size, compressed_size
+
+
+def _inflate(stream, compressed_size, max_bytes, chunk_size):
+    """
+    Decompress one deflated entry. With compressed_size None the end is found
+    by the decompressor and any bytes read past it are pushed back.
+    Returns None when max_bytes is None (entry skipped).
+    """
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    output = bytearray() if max_bytes is not None else None
+    remaining = compressed_size
+
+    while not decompressor.eof:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        if size == 0:
+            break
+        chunk = stream.read(size)
+        if not chunk:
+            raise ValueError("Zip archive is truncated")
+        if remaining is not None:
+            remaining -= len(chunk)
+
+        if output is None:
+            decompressor.decompress(chunk)
+            continue
+        # Cap the output so a tiny entry can't expand into gigabytes
+        output += decompressor.decompress(chunk, max_bytes + 1 - len(output))
+        while decompressor.unconsumed_tail and len(output) <= max_bytes:
+            output += decompressor.decompress(decompressor.unconsumed_tail, max_bytes + 1 - len(output))
+        if len(output) > max_bytes:
+            raise ValueError(f"Zip entry is larger than {max_bytes} bytes")
+
+    if decompressor.unused_data:
+        stream.unread(decompressor.unused_data)
+    return bytes(output) if output is not None else None
+
+
+def _skip(stream, size, chunk_size):
+    while size > 0:
+        chunk = stream.read(min(chunk_size, size))
+        if not chunk:
+            raise ValueError("Zip archive is truncated")
+        size -= len(chunk)
+
+
+def _skip_descriptor(stream, zip64):
+    """crc32 + sizes after the data, optionally preceded by a signature"""
+    first = stream.read_exact(4)
+    if struct.unpack('<I', first)[0] != _DATA_DESCRIPTOR_SIGNATURE:
+        stream.unread(first)
+    stream.read_exact(4 + (16 if zip64 else 8))
@@ -0,0 +1,164 @@
+"""
+Micro-batching scheduler for EcoWise AI
+Collects concurrent /detect requests and runs them as one YOLOv8 batch
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingDetection:
+    """A single image waiting for its slot in a batch"""
+
+    def __init__(self, image):
+        self.image = image
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchingScheduler:
+    def __init__(self, engine, max_batch_size=8, max_wait_ms=15):
+        self.engine = engine
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._stats_lock = threading.Lock()
+
+        # Stats exposed through stats()
+        self._batch_size_histogram = {size: 0 for size in range(1, self.max_batch_size + 1)}
+        self._batches_run = 0
+        self._images_processed = 0
+        self._total_wait = 0.0
+        self._max_wait_seen = 0.0
+
+        self._worker = threading.Thread(target=self._run, name="ecowise-batcher", daemon=True)
+        self._worker.start()
+        logger.info("Batching scheduler ready", extra={"max_batch_size": self.max_batch_size, "max_wait_ms": max_wait_ms})
+
+    def detect_objects(self, image):
+        """Queue an image (path or DecodedImage) and block until its batch has been processed"""
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images):
+        """
+        Queue several images at once; they share batches with concurrent requests.
+        Re-raises the engine's error if their batch failed.
+        """
+        pending = [_PendingDetection(image) for image in images]
+        with self._cond:
+            self._queue.extend(pending)
+            self._cond.notify()
+        for item in pending:
+            item.done.wait()
+        for item in pending:
+            if item.error is not None:
+                raise item.error
+        return [item.result for item in pending]
+
+    def get_recommendation(self, detected_objects):
+        return self.engine.get_recommendation(detected_objects)
+
+    def ready(self):
+        return self.engine.is_ready()
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self):
+        """Queue depth, batch-size histogram and wait time summary"""
+        with self._stats_lock:
+            images = self._images_processed
+            return {
+                "mode": "batch",
+                "queue_depth": self.queue_depth(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+                "batches_run": self._batches_run,
+                "images_processed": images,
+                "batch_size_histogram": dict(self._batch_size_histogram),
+                "avg_wait_ms": round(self._total_wait / images * 1000, 3) if images else 0.0,
+                "max_wait_ms_seen": round(self._max_wait_seen * 1000, 3)
+            }
+
+    def _next_batch(self):
+        """Wait for the first request, then gather more until full or the wait window closes"""
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+
+            deadline = self._queue[0].enqueued_at + self.max_wait
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            count = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(count)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+
+            results, error = None, None
+            try:
+                results = self.engine.detect_batch([p.image for p in batch])
+            except Exception as e:
+                logger.error("Batch inference failed: %s", e)
+                error = e
+
+            with self._stats_lock:
+                self._batches_run += 1
+                self._images_processed += len(batch)
+                self._batch_size_histogram[len(batch)] += 1
+                for pending in batch:
+                    waited = started - pending.enqueued_at
+                    self._total_wait += waited
+                    self._max_wait_seen = max(self._max_wait_seen, waited)
+
+            for index, pending in enumerate(batch):
+                if error is not None:
+                    pending.error = error
+                else:
+                    pending.result = results[index]
+                pending.done.set()
+
+
+class ConcurrencyLimit:
+    """
+    Caps how many request threads may wait on the detector at once, so a
+    saturated detector can't tie up every thread; callers past the limit are
+    turned away instead of queueing.
+    """
+
+    def __init__(self, max_concurrent):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self._lock = threading.Lock()
+        self._active = 0
+        self._rejected = 0
+
+    def try_acquire(self):
+        with self._lock:
+            if self._active >= self.max_concurrent:
+                self._rejected += 1
+                return False
+            self._active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._active -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"max_concurrent": self.max_concurrent, "active": self._active, "rejected": self._rejected}
@@ -0,0 +1,543 @@
+"""
+Offline benchmark and load-test suite for EcoWise
+Everything runs locally in a throwaway working directory (its own SQLite
+file, no uploads kept) and needs no network:
+
+    detector  - EcoWiseAI latency/throughput on uploads/ per batch and image size
+    db        - EcoWiseDB reads, writes and a mix from concurrent threads
+    geo       - /user-location nearest and radius queries on 10 to 1M synthetic centers
+    http      - load generator against app.py, served in-process or at --http-url
+
+--fake-detector swaps YOLOv8 for FakeDetector, a deterministic stand-in with
+a configurable latency, so the HTTP and detector suites run without a model.
+Results are JSON; pass an earlier run as --baseline to flag regressions:
+
+    python benchmarks.py db geo --output before.json
+    python benchmarks.py db geo --baseline before.json --tolerance 0.15
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+import numpy as np
+
+from logging_config import configure_logging
+from simple_ai import SimpleEcoWiseAI
+
+SUITES = ('detector', 'db', 'geo', 'http')
+# Metrics checked against a baseline (p99 of a few hundred calls is too noisy)
+LOWER_IS_BETTER = ('p50_ms', 'p95_ms', 'build_ms')
+HIGHER_IS_BETTER = ('throughput_per_s',)
+# Keywords SimpleEcoWiseAI.detect_from_filename recognises
+FAKE_KEYWORDS = ('bottle', 'mobile', 'book', 'shirt', 'can', 'glass')
+# Synthetic centers and origins are spread over India
+GEO_BOUNDS = ((8.0, 35.0), (68.0, 97.0))
+HTTP_MIX = (('detect', 4), ('user', 3), ('user-location', 2), ('leaderboard', 1))
+
+logger = logging.getLogger(__name__)
+
+
+class FakeDetector(SimpleEcoWiseAI):
+    """
+    Drop-in for EcoWiseAI without a model. Objects come from
+    SimpleEcoWiseAI.detect_from_filename: file paths use their name, decoded
+    images a name derived from a checksum of their pixels, so the same image
+    always gives the same objects. Each call sleeps latency_ms plus
+    per_image_ms per image to stand in for inference.
+    """
+
+    def __init__(self, latency_ms=20.0, per_image_ms=5.0):
+        from ai_service import EcoWiseAI
+
+        super().__init__()
+        self.latency = latency_ms / 1000.0
+        self.per_image = per_image_ms / 1000.0
+        self.model = self
+        self.model_name = 'fake'
+        self.backend = 'fake'
+        self.model_id = f"fake[{latency_ms}+{per_image_ms}ms]"
+        self.conf = 0.20
+        self.warmup_ms = 0.0
+        # Recommendations follow the real rules
+        self._recommender = EcoWiseAI()
+
+    def load(self, warmup=True):
+        return self
+
+    def load_async(self, warmup=True):
+        return None
+
+    def ensure_loaded(self):
+        return self
+
+    def warm_up(self, size=640):
+        return self.warmup_ms
+
+    def is_ready(self):
+        return True
+
+    def status(self):
+        return {"model": self.model_name, "backend": self.backend, "model_loaded": True,
+                "load_seconds": 0.0, "warmup_ms": self.warmup_ms, "load_error": None}
+
+    def detect_objects(self, image):
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images):
+        time.sleep(self.latency + self.per_image * len(images))
+        return [self._detect(image) for image in images]
+
+    def get_recommendation(self, detected_objects):
+        return self._recommender.get_recommendation(detected_objects)
+
+    def _detect(self, image):
+        if isinstance(image, str):
+            name, (width, height) = os.path.basename(image), (640, 640)
+        else:
+            checksum = zlib.crc32(np.ascontiguousarray(image.array[::8, ::8]).tobytes())
+            count = 1 + checksum % 3
+            name = '-'.join(FAKE_KEYWORDS[(checksum >> (4 * i)) % len(FAKE_KEYWORDS)] for i in range(count))
+            width, height = image.original_size
+
+        objects = self.detect_from_filename(name)
+        # Side-by-side boxes so the camera tracker sees distinct objects
+        step = width / len(objects)
+        return [
+            {'name': obj['name'], 'confidence': obj['confidence'],
+             'bbox': [i * step, 0.0, (i + 1) * step, float(height)]}
+            for i, obj in enumerate(objects)
+        ]
+
+
+def summarize(latencies, elapsed, items=None):
+    """Latency percentiles (ms) and throughput for a list of per-call seconds"""
+    latencies = np.asarray(latencies, dtype=np.float64) * 1000
+    items = len(latencies) if items is None else items
+    if not len(latencies):
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "count": int(len(latencies)),
+        "mean_ms": round(float(latencies.mean()), 4),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "throughput_per_s": round(items / elapsed, 2) if elapsed > 0 else None
+    }
+
+
+def run_threads(threads, count, operation):
+    """
+    Call operation(i) for i in range(count) spread over `threads` threads.
+    Returns (per-call seconds, wall seconds, errors).
+    """
+    latencies, errors = [], []
+    lock = threading.Lock()
+    counter = iter(range(count))
+
+    def worker():
+        local, failures = [], []
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            started = time.perf_counter()
+            try:
+                operation(i)
+            except Exception as e:
+                failures.append(str(e))
+            local.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(local)
+            errors.extend(failures)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return latencies, time.perf_counter() - started, errors
+
+
+def bench_detector(engine, image_paths, batch_sizes, image_sizes, iterations):
+    from image_decoding import decode_upload
+
+    images = []
+    for path in image_paths:
+        with open(path, 'rb') as f:
+            images.append(f.read())
+    if not images:
+        return [{"suite": "detector", "case": "skipped", "reason": "no sample images"}]
+
+    engine.load(warmup=False)
+    results = []
+    for size in image_sizes:
+        started = time.perf_counter()
+        latencies = []
+        for image_bytes in images * iterations:
+            decode_started = time.perf_counter()
+            decode_upload(image_bytes, size)
+            latencies.append(time.perf_counter() - decode_started)
+        results.append({"suite": "detector", "case": f"decode size={size}",
+                        **summarize(latencies, time.perf_counter() - started)})
+
+        decoded = [decode_upload(image_bytes, size) for image_bytes in images]
+        engine.detect_batch(decoded[:1])  # warm-up at this input size
+        for batch_size in batch_sizes:
+            batches = [[decoded[(i * batch_size + j) % len(decoded)] for j in range(batch_size)]
+                       for i in range(iterations)]
+            latencies = []
+            started = time.perf_counter()
+            for batch in batches:
+                call_started = time.perf_counter()
+                if batch_size == 1:
+                    engine.detect_objects(batch[0])
+                else:
+                    engine.detect_batch(batch)
+                latencies.append(time.perf_counter() - call_started)
+            elapsed = time.perf_counter() - started
+            results.append({"suite": "detector", "case": f"detect size={size} batch={batch_size}",
+                            **summarize(latencies, elapsed, items=iterations * batch_size)})
+    return results
+
+
+def bench_db(db_threads, operations, users=50):
+    from database import EcoWiseDB
+
+    db = EcoWiseDB(f"bench-{uuid.uuid4().hex[:8]}.db")
+    usernames = [f"bench-user-{i}" for i in range(users)]
+    with db.pool.connection() as conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (username, email) VALUES (?, ?)",
+            [(name, f"{name}@example.com") for name in usernames])
+        conn.commit()
+    db.leaderboard.invalidate()
+
+    detected = [{'name': 'bottle', 'confidence': 0.9, 'bbox': [0.0, 0.0, 10.0, 10.0]}]
+
+    def read(i):
+        username = usernames[i % users]
+        db.get_user(username)
+        db.get_user_history_page(username, limit=5)
+
+    def write(i):
+        db.record_detection(usernames[i % users], f"bench-{i}.jpg", detected, 10, 1, ["Recycle it"])
+
+    def mixed(i):
+        (write if i % 5 == 0 else read)(i)
+
+    results = []
+    for threads in db_threads:
+        for case, operation in (('read', read), ('write', write), ('mixed', mixed)):
+            latencies, elapsed, errors = run_threads(threads, operations, operation)
+            results.append({"suite": "db", "case": f"{case} threads={threads}",
+                            "errors": len(errors), **summarize(latencies, elapsed)})
+    db.pool.close_all()
+    return results
+
+
+def synthetic_centers(count, rng):
+    (lat_min, lat_max), (lng_min, lng_max) = GEO_BOUNDS
+    lats = rng.uniform(lat_min, lat_max, count)
+    lngs = rng.uniform(lng_min, lng_max, count)
+    return [{'id': i, 'name': f"Center {i}", 'lat': float(lat), 'lng': float(lng)}
+            for i, (lat, lng) in enumerate(zip(lats, lngs))]
+
+
+def bench_geo(sizes, queries, rng):
+    from geo_index import CenterIndex
+
+    (lat_min, lat_max), (lng_min, lng_max) = GEO_BOUNDS
+    origins = list(zip(rng.uniform(lat_min, lat_max, queries), rng.uniform(lng_min, lng_max, queries)))
+    results = []
+    for size in sizes:
+        centers = synthetic_centers(size, rng)
+        started = time.perf_counter()
+        index = CenterIndex(centers)
+        build_ms = round((time.perf_counter() - started) * 1000, 3)
+
+        # /user-location defaults (k=20), then a 5 km radius search
+        for case, k, radius_km in (('knn k=20', 20, None), ('radius 5km', 20, 5.0)):
+            latencies = []
+            started = time.perf_counter()
+            for lat, lng in origins:
+                query_started = time.perf_counter()
+                index.nearest(float(lat), float(lng), k, radius_km)
+                latencies.append(time.perf_counter() - query_started)
+            results.append({"suite": "geo", "case": f"{case} centers={size}", "build_ms": build_ms,
+                            **summarize(latencies, time.perf_counter() - started)})
+    return results
+
+
+def multipart_body(fields, filename, image_bytes):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n'.encode() + image_bytes + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def distinct_uploads(image_paths, count):
+    """
+    count JPEGs blended with a different coarse pattern each, so neither the
+    detection cache nor the near-duplicate index recognises them
+    """
+    from PIL import Image
+    import io
+
+    uploads = []
+    for i in range(count):
+        image = Image.open(image_paths[i % len(image_paths)]).convert('RGB')
+        blocks = np.random.default_rng(i).integers(0, 256, (8, 8, 3), dtype=np.uint8)
+        pattern = Image.fromarray(blocks).resize(image.size, Image.Resampling.NEAREST)
+        image = Image.blend(image, pattern, 0.7)
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=95)
+        uploads.append((f"bench-{i}.jpg", buffer.getvalue()))
+    return uploads
+
+
+def serve_app(engine):
+    """Import app.py with `engine` in place of the YOLOv8 engine and serve it on a free port"""
+    from werkzeug.serving import make_server
+
+    if engine is not None:
+        import ai_service
+        ai_service.ai_engine = engine
+    # app.py configures logging for stdout on import; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        import app as ecowise
+    quiet_logging()
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    server = make_server('127.0.0.1', 0, ecowise.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="ecowise-bench-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def bench_http(url, image_paths, requests_count, concurrency, distinct_images, rng):
+    uploads = distinct_uploads(image_paths, distinct_images) if image_paths else []
+    names, weights = zip(*HTTP_MIX)
+    mix = random.Random(int(rng.integers(1 << 31)))
+    plan = mix.choices(names, weights, k=requests_count)
+    if not uploads:
+        plan = [name for name in plan if name != 'detect']
+    locations = [(13.0 + mix.uniform(-0.05, 0.05), 76.1 + mix.uniform(-0.05, 0.05)) for _ in plan]
+
+    def build(i):
+        endpoint = plan[i]
+        if endpoint == 'detect':
+            filename, image_bytes = uploads[i % len(uploads)]
+            body, content_type = multipart_body({'username': 'EcoStudent'}, filename, image_bytes)
+            return urllib.request.Request(f"{url}/detect", body, {'Content-Type': content_type})
+        if endpoint == 'user':
+            return urllib.request.Request(f"{url}/user/EcoStudent")
+        if endpoint == 'user-location':
+            lat, lng = locations[i]
+            body = json.dumps({'lat': lat, 'lng': lng}).encode()
+            return urllib.request.Request(f"{url}/user-location", body, {'Content-Type': 'application/json'})
+        return urllib.request.Request(f"{url}/leaderboard")
+
+    requests = [build(i) for i in range(len(plan))]
+    timings = {name: [] for name in names}
+    failures = {name: 0 for name in names}
+    lock = threading.Lock()
+
+    def call(i):
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(requests[i], timeout=60) as response:
+                response.read()
+            failed = False
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - started
+        with lock:
+            timings[plan[i]].append(elapsed)
+            failures[plan[i]] += failed
+
+    latencies, elapsed, _ = run_threads(concurrency, len(plan), call)
+    results = [{"suite": "http", "case": f"all concurrency={concurrency}",
+                "errors": sum(failures.values()), **summarize(latencies, elapsed)}]
+    for name in names:
+        if timings[name]:
+            results.append({"suite": "http", "case": f"{name} concurrency={concurrency}",
+                            "errors": failures[name], **summarize(timings[name], elapsed)})
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta_ms=0.5):
+    """
+    Cases whose latency rose or throughput fell by more than tolerance.
+    Latency changes under min_delta_ms are treated as noise.
+    """
+    previous = {(r['suite'], r['case']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get((result['suite'], result['case']))
+        if before is None:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            if metric in LOWER_IS_BETTER and abs(new - old) < min_delta_ms:
+                continue
+            change = (new - old) / old
+            worse = change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance
+            if worse:
+                regressions.append({"suite": result['suite'], "case": result['case'], "metric": metric,
+                                    "baseline": old, "current": new, "change": round(change, 4)})
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def quiet_logging():
+    """Warnings and up (unless ECOWISE_LOG_LEVEL says otherwise) on stderr, so stdout stays valid JSON"""
+    configure_logging(level=os.environ.get('ECOWISE_LOG_LEVEL', 'WARNING'), stream=sys.stderr)
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+def main():
+    from inference_backends import calibration_images
+
+    parser = argparse.ArgumentParser(description="Run EcoWise benchmarks and report JSON")
+    parser.add_argument('suites', nargs='*', metavar='suite',
+                        help=f"any of {', '.join(SUITES)} (default: all)")
+    parser.add_argument('--images', default='uploads', help="directory of sample images")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fake-detector', action='store_true', help="use FakeDetector instead of YOLOv8")
+    parser.add_argument('--fake-latency-ms', type=float, default=20.0)
+    parser.add_argument('--fake-per-image-ms', type=float, default=5.0)
+    parser.add_argument('--batch-sizes', type=int_list, default=[1, 4, 8])
+    parser.add_argument('--image-sizes', type=int_list, default=[320, 640])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--db-threads', type=int_list, default=[1, 4, 8])
+    parser.add_argument('--db-operations', type=int, default=2000)
+    parser.add_argument('--geo-sizes', type=int_list, default=[10, 1000, 100000, 1000000])
+    parser.add_argument('--geo-queries', type=int, default=500)
+    parser.add_argument('--http-url', help="benchmark a running server instead of app.py in-process")
+    parser.add_argument('--http-requests', type=int, default=500)
+    parser.add_argument('--http-concurrency', type=int, default=8)
+    parser.add_argument('--http-distinct-images', type=int, default=100)
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--baseline', help="earlier JSON report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="relative slowdown flagged as a regression (default 0.10)")
+    parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                        help="ignore latency changes smaller than this (default 0.5)")
+    args = parser.parse_args()
+    unknown = sorted(set(args.suites) - set(SUITES))
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(unknown)}")
+    suites = args.suites or SUITES
+    quiet_logging()
+
+    image_paths = [os.path.abspath(path) for path in calibration_images(args.images)]
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    rng = np.random.default_rng(args.seed)
+    commit = git_commit()
+
+    # Run in a scratch directory so app.py and EcoWiseDB don't touch ecowise.db
+    workspace = tempfile.mkdtemp(prefix='ecowise-bench-')
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    os.environ.setdefault('ECOWISE_CENTERS_FILE', os.path.join(backend_dir, 'data', 'recycling_centers.json'))
+    os.environ.setdefault('ECOWISE_SAVE_UPLOADS', '0')
+    os.chdir(workspace)
+
+    engine = None
+    if args.fake_detector:
+        engine = FakeDetector(args.fake_latency_ms, args.fake_per_image_ms)
+
+    results = []
+    for suite in SUITES:
+        if suite not in suites:
+            continue
+        print(f"⏱️ Running {suite} benchmarks...", file=sys.stderr)
+        try:
+            if suite == 'detector':
+                if engine is None:
+                    from ai_service import ai_engine
+                    engine = ai_engine
+                results += bench_detector(engine, image_paths, args.batch_sizes, args.image_sizes, args.iterations)
+            elif suite == 'db':
+                results += bench_db(args.db_threads, args.db_operations)
+            elif suite == 'geo':
+                results += bench_geo(args.geo_sizes, args.geo_queries, rng)
+            else:
+                url, server = args.http_url, None
+                if url is None:
+                    server, url = serve_app(engine)
+                results += bench_http(url.rstrip('/'), image_paths, args.http_requests,
+                                      args.http_concurrency, args.http_distinct_images, rng)
+                if server is not None:
+                    server.shutdown()
+        except Exception as e:
+            logger.error("%s benchmarks failed: %s", suite, e)
+            results.append({"suite": suite, "case": "skipped", "reason": str(e)})
+
+    report = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "git_commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "detector": engine.model_id if engine is not None else None,
+            "args": {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')}
+        },
+        "results": results
+    }
+    if baseline is not None:
+        report["baseline_commit"] = baseline.get("meta", {}).get("git_commit")
+        report["regressions"] = compare(results, baseline, args.tolerance, args.min_delta_ms)
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    for regression in report.get("regressions", []):
+        print(f"❌ {regression['suite']} {regression['case']}: {regression['metric']} "
+              f"{regression['baseline']} -> {regression['current']} ({regression['change']:+.1%})", file=sys.stderr)
+    if report.get("regressions"):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+"""
+Live camera detection sessions for EcoWise
+A client streams frames into a session; only the newest unprocessed frame is
+kept, so frames that arrive while inference is busy are dropped instead of
+queueing up. Inference runs on every Nth frame (N adapts to inference time
+versus frame rate) and a tracker carries objects across the frames in
+between, so each physical object earns points once. Sessions that stop
+receiving frames are closed by a background reaper.
+"""
+
+import logging
+import math
+import threading
+import time
+import uuid
+from collections import deque
+
+from tracking import IoUTracker
+
+logger = logging.getLogger(__name__)
+
+
+class CameraSessionLimit(Exception):
+    """Raised when the maximum number of live camera sessions is open"""
+
+
+class _PartStream:
+    """
+    Reads a request body without asking it for more bytes than needed: WSGI
+    input streams block until a read is completely filled, so over-reading
+    would hold a finished frame back until the next one arrives.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._pushback = b''
+
+    def read(self, size):
+        if self._pushback:
+            data, self._pushback = self._pushback[:size], self._pushback[size:]
+            return data
+        return self._stream.read(size)
+
+    def unread(self, data):
+        self._pushback = data + self._pushback
+
+    def read_line(self, limit=1024):
+        """One header/delimiter line, read byte by byte"""
+        line = bytearray()
+        while len(line) < limit:
+            byte = self.read(1)
+            if not byte:
+                break
+            line += byte
+            if byte == b'\n':
+                break
+        return bytes(line)
+
+    def read_exact(self, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = self.read(size - len(data))
+            if not chunk:
+                raise ValueError("Frame stream ended mid-frame")
+            data += chunk
+        return bytes(data)
+
+
+def iter_multipart_frames(stream, boundary, max_frame_bytes=10 * 1024 * 1024, chunk_size=4096):
+    """
+    Yield part bodies from a multipart stream (multipart/x-mixed-replace or
+    multipart/mixed) as each part arrives, without buffering the whole request.
+    Parts with a Content-Length header are read exactly, so a frame is handed
+    on as soon as its last byte arrives; other parts are scanned for the next
+    boundary chunk_size bytes at a time.
+    """
+    stream = _PartStream(stream)
+    delimiter = b'--' + boundary.encode('latin-1')
+    closing = delimiter + b'--'
+
+    # Preamble, up to the first delimiter
+    while True:
+        line = stream.read_line()
+        if not line or line.rstrip() == closing:
+            return
+        if line.rstrip() == delimiter:
+            break
+
+    while True:
+        headers = {}
+        while True:
+            line = stream.read_line()
+            if not line:
+                return
+            line = line.rstrip(b'\r\n')
+            if not line:
+                break
+            name, _, value = line.partition(b':')
+            headers[name.strip().lower()] = value.strip()
+
+        length = headers.get(b'content-length')
+        if length is not None:
+            size = int(length)
+            if size > max_frame_bytes:
+                raise ValueError(f"Frame larger than {max_frame_bytes} bytes")
+            frame = stream.read_exact(size)
+            # CRLF, then the next delimiter line
+            line = stream.read_line()
+            while line and line.rstrip() not in (delimiter, closing):
+                line = stream.read_line()
+        else:
+            frame, line = _scan_to_delimiter(stream, delimiter, max_frame_bytes, chunk_size)
+
+        yield frame
+        if not line or line.rstrip() == closing:
+            return
+
+
+def _scan_to_delimiter(stream, delimiter, max_frame_bytes, chunk_size):
+    """Read a part body of unknown length; returns (body, delimiter line)"""
+    separator = b'\r\n' + delimiter
+    buffer = bytearray()
+    scan_from = 0
+    while True:
+        end = buffer.find(separator, scan_from)
+        if end >= 0:
+            break
+        if len(buffer) > max_frame_bytes:
+            raise ValueError(f"Frame larger than {max_frame_bytes} bytes")
+        scan_from = max(0, len(buffer) - len(separator))
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return bytes(buffer), b''
+        buffer += chunk
+
+    # Whatever follows the delimiter line is the start of the next part
+    stream.unread(bytes(buffer[end + 2:]))
+    return bytes(buffer[:end]), stream.read_line()
+
+
+class CameraSession:
+    def __init__(self, session_id, username, detect, award, min_detect_every=1,
+                 max_detect_every=8, tracker=None, event_history=64):
+        """
+        detect(image_bytes) returns the detection dicts for one frame.
+        award(username, session_id, detections) records points for newly
+        confirmed objects and returns a JSON-ready summary.
+        """
+        self.id = session_id
+        self.username = username
+        self.detect = detect
+        self.award = award
+        self.min_detect_every = max(1, int(min_detect_every))
+        self.max_detect_every = max(self.min_detect_every, int(max_detect_every))
+        self.tracker = tracker or IoUTracker()
+
+        self.created_at = time.monotonic()
+        self.last_frame_at = self.created_at
+        self.detect_every = self.min_detect_every
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.frames_processed = 0
+        self.frames_inferred = 0
+        self.objects_counted = 0
+        self.points_awarded = 0
+        self.closed = False
+
+        self._cond = threading.Condition()
+        self._latest = None               # newest frame not yet picked up
+        self._frame_interval = None       # EMA of seconds between frames
+        self._inference_seconds = None    # EMA of inference time
+        self._since_inference = 0
+        self._events = deque(maxlen=event_history)
+        self._seq = 0
+
+        self._worker = threading.Thread(target=self._run, name=f"ecowise-camera-{session_id[:8]}", daemon=True)
+        self._worker.start()
+
+    def submit_frame(self, image_bytes):
+        """Offer a frame; replaces (drops) any frame still waiting for the worker"""
+        now = time.monotonic()
+        with self._cond:
+            if self.closed:
+                raise RuntimeError("Camera session is closed")
+            if self.frames_received:
+                gap = now - self.last_frame_at
+                self._frame_interval = gap if self._frame_interval is None else \
+                    0.8 * self._frame_interval + 0.2 * gap
+            self.last_frame_at = now
+            self.frames_received += 1
+            if self._latest is not None:
+                self.frames_dropped += 1
+            self._latest = (self.frames_received, image_bytes)
+            self._cond.notify_all()
+
+    def events_after(self, seq, timeout):
+        """Events newer than seq, waiting up to timeout for the first one"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._seq <= seq and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return [(s, event) for s, event in self._events if s > seq]
+
+    def close(self, timeout=10):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self._worker.join(timeout)
+        if self._worker.is_alive():
+            logger.warning("Camera session worker still busy after close", extra={"session_id": self.id})
+        return self.summary()
+
+    def summary(self):
+        with self._cond:
+            return {
+                "session_id": self.id,
+                "username": self.username,
+                "closed": self.closed,
+                "frames_received": self.frames_received,
+                "frames_dropped": self.frames_dropped,
+                "frames_processed": self.frames_processed,
+                "frames_inferred": self.frames_inferred,
+                "detect_every": self.detect_every,
+                "objects_counted": self.objects_counted,
+                "points_awarded": self.points_awarded
+            }
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._latest is None and not self.closed:
+                    self._cond.wait()
+                if self._latest is None:
+                    return  # closed and nothing left to process
+                frame_number, image_bytes = self._latest
+                self._latest = None
+
+            try:
+                event = self._process(frame_number, image_bytes)
+            except Exception as e:
+                event = {"type": "error", "frame": frame_number, "error": str(e)}
+            self._publish(event)
+
+    def _process(self, frame_number, image_bytes):
+        self.frames_processed += 1
+        self._since_inference += 1
+
+        if self._since_inference < self.detect_every:
+            # Cheap frame: move existing tracks along without running the model
+            self.tracker.predict()
+            return self._frame_event(frame_number, inferred=False)
+
+        started = time.perf_counter()
+        detections = self.detect(image_bytes)
+        elapsed = time.perf_counter() - started
+        self._inference_seconds = elapsed if self._inference_seconds is None else \
+            0.8 * self._inference_seconds + 0.2 * elapsed
+        self._since_inference = 0
+        self.frames_inferred += 1
+        self._adapt()
+
+        confirmed = self.tracker.update(detections)
+        event = self._frame_event(frame_number, inferred=True)
+        if confirmed:
+            counted = [{"name": t.name, "confidence": t.confidence, "bbox": t.bbox.tolist()} for t in confirmed]
+            award = self.award(self.username, self.id, counted)
+            self.objects_counted += len(confirmed)
+            self.points_awarded += award.get("eco_points", 0)
+            event["awarded"] = award
+        return event
+
+    def _adapt(self):
+        """Run the model about as often as it can keep up with the frame rate"""
+        if not self._frame_interval:
+            return
+        every = math.ceil(self._inference_seconds / self._frame_interval)
+        self.detect_every = min(max(every, self.min_detect_every), self.max_detect_every)
+
+    def _frame_event(self, frame_number, inferred):
+        return {
+            "type": "frame",
+            "frame": frame_number,
+            "inferred": inferred,
+            "detect_every": self.detect_every,
+            "frames_dropped": self.frames_dropped,
+            "tracks": self.tracker.active()
+        }
+
+    def _publish(self, event):
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, event))
+            self._cond.notify_all()
+
+
+class CameraSessionManager:
+    def __init__(self, detect, award, max_sessions=16, idle_timeout=60, max_detect_every=8):
+        self.detect = detect
+        self.award = award
+        self.max_sessions = max(1, int(max_sessions))
+        self.idle_timeout = idle_timeout
+        self.max_detect_every = max_detect_every
+
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._reaper = None
+        self._stopped = threading.Event()
+
+    def create(self, username):
+        self.reap_idle()
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                raise CameraSessionLimit(f"{len(self._sessions)} camera sessions already open")
+            session_id = uuid.uuid4().hex
+            session = CameraSession(session_id, username, self.detect, self.award,
+                                    max_detect_every=self.max_detect_every)
+            self._sessions[session_id] = session
+            # Started with the first session, not at import (before fork)
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap_periodically, name="ecowise-camera-reaper",
+                                                daemon=True)
+                self._reaper.start()
+        return session
+
+    def get(self, session_id):
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def close(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        return session.close() if session else None
+
+    def reap_idle(self):
+        """Close sessions that have not received a frame for idle_timeout seconds"""
+        now = time.monotonic()
+        with self._lock:
+            idle = [s for s in self._sessions.values() if now - s.last_frame_at > self.idle_timeout]
+            for session in idle:
+                del self._sessions[session.id]
+        for session in idle:
+            session.close()
+        return len(idle)
+
+    def shutdown(self):
+        """Stop the reaper and close every open session"""
+        self._stopped.set()
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+        if self._reaper is not None:
+            self._reaper.join()
+
+    def _reap_periodically(self):
+        # Abandoned sessions are closed within about a quarter of idle_timeout
+        # of expiring, even if no new session is ever created
+        interval = max(1.0, self.idle_timeout / 4)
+        while not self._stopped.wait(interval):
+            try:
+                closed = self.reap_idle()
+                if closed:
+                    logger.info("Closed idle camera sessions", extra={"sessions": closed})
+            except Exception as e:
+                logger.error("Camera session reaper failed: %s", e)
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "open_sessions": len(sessions),
+            "max_sessions": self.max_sessions,
+            "frames_received": sum(s.frames_received for s in sessions),
+            "frames_dropped": sum(s.frames_dropped for s in sessions),
+            "frames_inferred": sum(s.frames_inferred for s in sessions)
+        }
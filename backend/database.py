@@ -4,69 +4,329 @@ No extra installations needed!
 """
 
 import sqlite3
-import os
-from datetime import datetime
+import base64
+import json
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from leaderboard import Leaderboard
+from metrics import DB_QUERY_SECONDS
+from detection_codec import (decode_detections, decode_recommendations,
+                             encode_detections, encode_recommendations)
+
+logger = logging.getLogger(__name__)
+
+CARBON_KG_PER_ITEM = 2  # estimate: 2kg per item
+
+def level_for_points(eco_points):
+    """Python mirror of the level CASE used in the UPDATE statements"""
+    if eco_points >= 500:
+        return 'Eco Champion'
+    if eco_points >= 200:
+        return 'Eco Warrior'
+    if eco_points >= 100:
+        return 'Eco Friend'
+    return 'Eco Beginner'
+
+def encode_history_cursor(processed_at, history_id):
+    """Opaque keyset cursor for the last row of a history page"""
+    raw = json.dumps([processed_at, history_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_history_cursor(cursor):
+    """Inverse of encode_history_cursor; raises ValueError for malformed cursors"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        processed_at, history_id = json.loads(raw)
+        return processed_at, int(history_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid history cursor") from e
+
+class ConnectionPool:
+    """
+    Reusable SQLite connections shared by Flask threads.
+    A thread keeps the same connection for nested calls; idle connections
+    go back to a LIFO stack so the most recently used (warmest) is reused.
+    """
+    
+    PRAGMAS = (
+        'PRAGMA journal_mode = WAL',
+        'PRAGMA synchronous = NORMAL',
+        'PRAGMA busy_timeout = 5000',
+        'PRAGMA cache_size = -16000',
+        'PRAGMA temp_store = MEMORY'
+    )
+    
+    def __init__(self, db_path, max_idle=8, statement_cache_size=256):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.statement_cache_size = statement_cache_size
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._opened = 0
+    
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=5,
+            check_same_thread=False,
+            cached_statements=self.statement_cache_size
+        )
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self._opened += 1
+        return conn
+    
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            # Nested call on the same thread: reuse the connection it holds
+            yield held
+            return
+        
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            if self._idle.qsize() < self.max_idle:
+                self._idle.put(conn)
+            else:
+                conn.close()
+    
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+    
+    def stats(self):
+        return {"opened": self._opened, "idle": self._idle.qsize()}
 
 class EcoWiseDB:
-    def __init__(self):
-        self.db_path = 'ecowise.db'
+    def __init__(self, db_path='ecowise.db'):
+        self.db_path = db_path
+        self.pool = ConnectionPool(self.db_path)
+        self.leaderboard = Leaderboard(self.get_leaderboard_rows)
         self.init_database()
     
     def init_database(self):
         """Initialize database tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE,
-                eco_points INTEGER DEFAULT 0,
-                level TEXT DEFAULT 'Eco Beginner',
-                items_recycled INTEGER DEFAULT 0,
-                carbon_saved_kg REAL DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Recycling history table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS recycling_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                filename TEXT NOT NULL,
-                detected_objects TEXT,
-                eco_points_earned INTEGER,
-                recommendations TEXT,
-                processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Users table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT UNIQUE NOT NULL,
+                    email TEXT UNIQUE,
+                    eco_points INTEGER DEFAULT 0,
+                    level TEXT DEFAULT 'Eco Beginner',
+                    items_recycled INTEGER DEFAULT 0,
+                    carbon_saved_kg REAL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Recycling history table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS recycling_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    filename TEXT NOT NULL,
+                    detected_objects TEXT,
+                    eco_points_earned INTEGER,
+                    recommendations TEXT,
+                    processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            ''')
+            
+            # Detection result cache (content-addressed by image hash)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS detection_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    detections TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_detection_cache_last_used
+                ON detection_cache (last_used_at)
+            ''')
+            
+            # Leaderboard rebuilds read users in eco_points order
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_users_eco_points
+                ON users (eco_points DESC, username)
+            ''')
+            
+            # History pages are read per user, newest first (keyset pagination)
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_history_user_processed
+                ON recycling_history (user_id, processed_at DESC, id DESC)
+            ''')
+            
+            # Content-addressed uploads (see upload_store); refcount counts the
+            # recycling_history rows whose image_hash points here
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS upload_blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    refcount INTEGER NOT NULL DEFAULT 0,
+                    original INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_upload_blobs_last_used
+                ON upload_blobs (last_used_at)
+            ''')
+            
+            # Asynchronous detection jobs (image kept until the job finishes)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS detection_jobs (
+                    id TEXT PRIMARY KEY,
+                    username TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    image BLOB,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_detection_jobs_status
+                ON detection_jobs (status, created_at)
+            ''')
+            
+            # Insert default user if not exists
+            cursor.execute('''
+                INSERT OR IGNORE INTO users (username, email, eco_points, level, items_recycled, carbon_saved_kg)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', ('EcoStudent', 'eco@example.com', 150, 'Eco Warrior', 15, 45.5))
+            
+            conn.commit()
         
-        # Insert default user if not exists
-        cursor.execute('''
-            INSERT OR IGNORE INTO users (username, email, eco_points, level, items_recycled, carbon_saved_kg)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', ('EcoStudent', 'eco@example.com', 150, 'Eco Warrior', 15, 45.5))
-        
-        conn.commit()
-        conn.close()
-        print("✅ Database initialized successfully!")
+        self.run_migrations()
+        logger.info("Database initialized", extra={"path": self.db_path})
+    
+    # Schema/data version stored in PRAGMA user_version
+    SCHEMA_VERSION = 2
+    
+    def run_migrations(self):
+        """
+        Apply one-time migrations for databases created by older versions.
+        They run in one write transaction that re-reads user_version first,
+        so processes starting together on the same file apply them once.
+        """
+        migrated = 0
+        with self.pool.connection() as conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= self.SCHEMA_VERSION:
+                return
+            
+            conn.execute('BEGIN IMMEDIATE')
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            
+            if version < 1:
+                migrated = self.migrate_history_encoding()
+                logger.info("Migrated history rows to compact encoding", extra={"rows": migrated})
+            
+            if version < 2:
+                # History rows point at their upload in the content-addressed store
+                columns = {row[1] for row in conn.execute('PRAGMA table_info(recycling_history)')}
+                if 'image_hash' not in columns:
+                    conn.execute('ALTER TABLE recycling_history ADD COLUMN image_hash TEXT')
+                    logger.info("Added image_hash to recycling history")
+            
+            conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+            conn.commit()
+            
+            if migrated:
+                # Reclaim the space freed by the smaller rows. It fails while
+                # other processes hold the file open, which only costs space
+                try:
+                    conn.execute('VACUUM')
+                except sqlite3.OperationalError as e:
+                    logger.warning("Skipped VACUUM after migration: %s", e)
     
+    def migrate_history_encoding(self, batch_size=500):
+        """
+        Rewrite str()-encoded history rows with the compact detection_codec
+        format. Runs in the caller's transaction (see run_migrations).
+        """
+        migrated = 0
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            while True:
+                cursor.execute('''
+                    SELECT id, detected_objects, recommendations
+                    FROM recycling_history
+                    WHERE typeof(detected_objects) = 'text' OR typeof(recommendations) = 'text'
+                    LIMIT ?
+                ''', (batch_size,))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                
+                cursor.executemany('''
+                    UPDATE recycling_history
+                    SET detected_objects = ?, recommendations = ?
+                    WHERE id = ?
+                ''', [
+                    (encode_detections(decode_detections(detected)),
+                     encode_recommendations(decode_recommendations(recommendations)),
+                     history_id)
+                    for history_id, detected, recommendations in rows
+                ])
+                migrated += len(rows)
+        return migrated
+    
+    def ping(self):
+        """Check that the database file can be opened and queried"""
+        try:
+            with self.pool.connection() as conn:
+                conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error as e:
+            logger.error("Database ping failed: %s", e)
+            return False
+    
+    @DB_QUERY_SECONDS.time(operation='get_user')
     def get_user(self, username):
         """Get user by username"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM users WHERE username = ?
-        ''', (username,))
-        
-        user = cursor.fetchone()
-        conn.close()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT * FROM users WHERE username = ?
+            ''', (username,))
+            
+            user = cursor.fetchone()
         
+        return self._user_from_row(user)
+    
+    @staticmethod
+    def _user_from_row(user):
         if user:
             return {
                 'id': user[0],
@@ -80,88 +340,545 @@ class EcoWiseDB:
             }
         return None
     
+    @DB_QUERY_SECONDS.time(operation='update_user_points')
     def update_user_points(self, username, points_earned, items_count):
         """Update user's points and stats after recycling"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Calculate carbon saved (estimate: 2kg per item)
-        carbon_saved = items_count * 2
-        
-        cursor.execute('''
-            UPDATE users 
-            SET eco_points = eco_points + ?,
-                items_recycled = items_recycled + ?,
-                carbon_saved_kg = carbon_saved_kg + ?
-            WHERE username = ?
-        ''', (points_earned, items_count, carbon_saved, username))
-        
-        # Update level based on points
-        cursor.execute('''
-            UPDATE users 
-            SET level = CASE
-                WHEN eco_points >= 500 THEN 'Eco Champion'
-                WHEN eco_points >= 200 THEN 'Eco Warrior' 
-                WHEN eco_points >= 100 THEN 'Eco Friend'
-                ELSE 'Eco Beginner'
-            END
-            WHERE username = ?
-        ''', (username,))
-        
-        conn.commit()
-        conn.close()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Calculate carbon saved (estimate: 2kg per item)
+            carbon_saved = items_count * CARBON_KG_PER_ITEM
+            
+            cursor.execute('''
+                UPDATE users 
+                SET eco_points = eco_points + ?,
+                    items_recycled = items_recycled + ?,
+                    carbon_saved_kg = carbon_saved_kg + ?
+                WHERE username = ?
+            ''', (points_earned, items_count, carbon_saved, username))
+            
+            # Update level based on points
+            cursor.execute('''
+                UPDATE users 
+                SET level = CASE
+                    WHEN eco_points >= 500 THEN 'Eco Champion'
+                    WHEN eco_points >= 200 THEN 'Eco Warrior' 
+                    WHEN eco_points >= 100 THEN 'Eco Friend'
+                    ELSE 'Eco Beginner'
+                END
+                WHERE username = ?
+                RETURNING eco_points, level
+            ''', (username,))
+            updated = cursor.fetchone()
+            
+            # Applied while this transaction still holds the write lock, so
+            # concurrent updates reach the leaderboard in commit order
+            if updated:
+                self.leaderboard.apply(username, updated[0], updated[1])
+            conn.commit()
         return True
     
-    def add_recycling_history(self, username, filename, detected_objects, points_earned, recommendations):
+    @DB_QUERY_SECONDS.time(operation='apply_point_deltas')
+    def apply_point_deltas(self, deltas):
+        """
+        Apply [(username, points, items)] point/stat increments in a single
+        transaction (used by the write-behind buffer). Returns rows updated.
+        """
+        updated = []
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            
+            for username, points, items in deltas:
+                cursor.execute('''
+                    UPDATE users 
+                    SET eco_points = eco_points + :points,
+                        items_recycled = items_recycled + :items,
+                        carbon_saved_kg = carbon_saved_kg + :carbon,
+                        level = CASE
+                            WHEN eco_points + :points >= 500 THEN 'Eco Champion'
+                            WHEN eco_points + :points >= 200 THEN 'Eco Warrior' 
+                            WHEN eco_points + :points >= 100 THEN 'Eco Friend'
+                            ELSE 'Eco Beginner'
+                        END
+                    WHERE username = :username
+                    RETURNING eco_points, level
+                ''', {
+                    'points': points,
+                    'items': items,
+                    'carbon': items * CARBON_KG_PER_ITEM,
+                    'username': username
+                })
+                row = cursor.fetchone()
+                if row:
+                    updated.append((username, row[0], row[1]))
+            
+            # Before commit, in write-lock order (see update_user_points)
+            for username, eco_points, level in updated:
+                self.leaderboard.apply(username, eco_points, level)
+            conn.commit()
+        return len(updated)
+    
+    @DB_QUERY_SECONDS.time(operation='record_detection')
+    def record_detection(self, username, filename, detected_objects, points_earned, items_count, recommendations,
+                         image_hash=None):
+        """
+        Record a /detect result atomically: points, level and stats update plus
+        the history insert (and its upload reference) in one transaction.
+        Returns the updated user, or None (and writes nothing) if the user
+        does not exist.
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Take the write lock up front so the two statements can't deadlock
+            cursor.execute('BEGIN IMMEDIATE')
+            
+            # Level is computed from the new total in the same statement
+            cursor.execute('''
+                UPDATE users 
+                SET eco_points = eco_points + :points,
+                    items_recycled = items_recycled + :items,
+                    carbon_saved_kg = carbon_saved_kg + :carbon,
+                    level = CASE
+                        WHEN eco_points + :points >= 500 THEN 'Eco Champion'
+                        WHEN eco_points + :points >= 200 THEN 'Eco Warrior' 
+                        WHEN eco_points + :points >= 100 THEN 'Eco Friend'
+                        ELSE 'Eco Beginner'
+                    END
+                WHERE username = :username
+                RETURNING id, username, email, eco_points, level, items_recycled, carbon_saved_kg, created_at
+            ''', {
+                'points': points_earned,
+                'items': items_count,
+                'carbon': items_count * CARBON_KG_PER_ITEM,
+                'username': username
+            })
+            user = cursor.fetchone()
+            
+            if not user:
+                conn.rollback()
+                return None
+            
+            cursor.execute('''
+                INSERT INTO recycling_history (user_id, filename, detected_objects, eco_points_earned, recommendations,
+                                               image_hash)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user[0], filename, encode_detections(detected_objects), points_earned,
+                  encode_recommendations(recommendations), image_hash))
+            self._reference_uploads(cursor, [image_hash])
+            
+            # Before commit, in write-lock order (see update_user_points)
+            self.leaderboard.apply(user[1], user[3], user[4])
+            conn.commit()
+        return self._user_from_row(user)
+    
+    @DB_QUERY_SECONDS.time(operation='record_detections')
+    def record_detections(self, username, results):
+        """
+        Record many /detect results in one transaction: a single points and
+        stats update for their totals plus one history row per result.
+        results is [(filename, detected_objects, points_earned, items_count,
+        recommendations, image_hash)]. Returns the updated user, or None (and writes
+        nothing) if the user does not exist.
+        """
+        points_earned = sum(result[2] for result in results)
+        items_count = sum(result[3] for result in results)
+        
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            
+            cursor.execute('''
+                UPDATE users 
+                SET eco_points = eco_points + :points,
+                    items_recycled = items_recycled + :items,
+                    carbon_saved_kg = carbon_saved_kg + :carbon,
+                    level = CASE
+                        WHEN eco_points + :points >= 500 THEN 'Eco Champion'
+                        WHEN eco_points + :points >= 200 THEN 'Eco Warrior' 
+                        WHEN eco_points + :points >= 100 THEN 'Eco Friend'
+                        ELSE 'Eco Beginner'
+                    END
+                WHERE username = :username
+                RETURNING id, username, email, eco_points, level, items_recycled, carbon_saved_kg, created_at
+            ''', {
+                'points': points_earned,
+                'items': items_count,
+                'carbon': items_count * CARBON_KG_PER_ITEM,
+                'username': username
+            })
+            user = cursor.fetchone()
+            
+            if not user:
+                conn.rollback()
+                return None
+            
+            cursor.executemany('''
+                INSERT INTO recycling_history (user_id, filename, detected_objects, eco_points_earned, recommendations,
+                                               image_hash)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [
+                (user[0], filename, encode_detections(detected_objects), points,
+                 encode_recommendations(recommendations), image_hash)
+                for filename, detected_objects, points, _, recommendations, image_hash in results
+            ])
+            self._reference_uploads(cursor, [result[5] for result in results])
+            
+            # Before commit, in write-lock order (see update_user_points)
+            self.leaderboard.apply(user[1], user[3], user[4])
+            conn.commit()
+        return self._user_from_row(user)
+    
+    @DB_QUERY_SECONDS.time(operation='get_leaderboard_rows')
+    def get_leaderboard_rows(self):
+        """All users ordered by eco_points, used to (re)build the leaderboard cache"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT username, eco_points, level
+                FROM users
+                ORDER BY eco_points DESC, username
+            ''')
+            
+            rows = cursor.fetchall()
+        return rows
+    
+    @DB_QUERY_SECONDS.time(operation='add_recycling_history')
+    def add_recycling_history(self, username, filename, detected_objects, points_earned, recommendations,
+                              image_hash=None):
         """Add recycling activity to history"""
         user = self.get_user(username)
         if not user:
             return False
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Convert objects and recommendations to strings for storage
-        detected_str = str(detected_objects)
-        recommendations_str = str(recommendations)
-        
-        cursor.execute('''
-            INSERT INTO recycling_history (user_id, filename, detected_objects, eco_points_earned, recommendations)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user['id'], filename, detected_str, points_earned, recommendations_str))
-        
-        conn.commit()
-        conn.close()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Compact binary encoding (see detection_codec)
+            detected_blob = encode_detections(detected_objects)
+            recommendations_blob = encode_recommendations(recommendations)
+            
+            cursor.execute('''
+                INSERT INTO recycling_history (user_id, filename, detected_objects, eco_points_earned, recommendations,
+                                               image_hash)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (user['id'], filename, detected_blob, points_earned, recommendations_blob, image_hash))
+            self._reference_uploads(cursor, [image_hash])
+            
+            conn.commit()
         return True
     
     def get_user_history(self, username, limit=5):
         """Get user's recent recycling history"""
-        user = self.get_user(username)
-        if not user:
-            return []
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT filename, detected_objects, eco_points_earned, processed_at
-            FROM recycling_history 
-            WHERE user_id = ?
-            ORDER BY processed_at DESC
-            LIMIT ?
-        ''', (user['id'], limit))
+        history, _ = self.get_user_history_page(username, limit)
+        return history
+    
+    @DB_QUERY_SECONDS.time(operation='get_user_history_page')
+    def get_user_history_page(self, username, limit=5, cursor=None):
+        """
+        Get one page of a user's history, newest first, using keyset pagination.
+        Returns (history, next_cursor); next_cursor is None on the last page.
+        Cursors are opaque strings from a previous call (see encode_history_cursor).
+        """
+        with self.pool.connection() as conn:
+            db_cursor = conn.cursor()
+            
+            if cursor is None:
+                db_cursor.execute('''
+                    SELECT h.id, h.filename, h.detected_objects, h.eco_points_earned, h.processed_at,
+                           h.recommendations, h.image_hash
+                    FROM users u
+                    JOIN recycling_history h ON h.user_id = u.id
+                    WHERE u.username = ?
+                    ORDER BY h.processed_at DESC, h.id DESC
+                    LIMIT ?
+                ''', (username, limit + 1))
+            else:
+                processed_at, last_id = decode_history_cursor(cursor)
+                db_cursor.execute('''
+                    SELECT h.id, h.filename, h.detected_objects, h.eco_points_earned, h.processed_at,
+                           h.recommendations, h.image_hash
+                    FROM users u
+                    JOIN recycling_history h ON h.user_id = u.id
+                    WHERE u.username = ?
+                      AND (h.processed_at, h.id) < (?, ?)
+                    ORDER BY h.processed_at DESC, h.id DESC
+                    LIMIT ?
+                ''', (username, processed_at, last_id, limit + 1))
+            
+            rows = db_cursor.fetchall()
         
         history = []
-        for row in cursor.fetchall():
+        for row in rows[:limit]:
             history.append({
-                'filename': row[0],
-                'detected_objects': row[1],
-                'points_earned': row[2],
-                'processed_at': row[3]
+                'id': row[0],
+                'filename': row[1],
+                'detected_objects': decode_detections(row[2]),
+                'points_earned': row[3],
+                'processed_at': row[4],
+                'recommendations': decode_recommendations(row[5]),
+                'image_hash': row[6]
             })
         
-        conn.close()
-        return history
+        next_cursor = None
+        if len(rows) > limit and history:
+            next_cursor = encode_history_cursor(history[-1]['processed_at'], history[-1]['id'])
+        return history, next_cursor
+
+    @DB_QUERY_SECONDS.time(operation='get_cached_detection')
+    def get_cached_detection(self, cache_key, ttl_seconds):
+        """Get cached detections for an image hash key, or None if missing/expired"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            now = time.time()
+            
+            cursor.execute('''
+                SELECT detections FROM detection_cache
+                WHERE cache_key = ? AND created_at >= ?
+            ''', (cache_key, now - ttl_seconds))
+            row = cursor.fetchone()
+            
+            if row:
+                cursor.execute('''
+                    UPDATE detection_cache SET last_used_at = ? WHERE cache_key = ?
+                ''', (now, cache_key))
+                conn.commit()
+            
+        return json.loads(row[0]) if row else None
+    
+    @DB_QUERY_SECONDS.time(operation='put_cached_detection')
+    def put_cached_detection(self, cache_key, detections):
+        """Store detections for an image hash key"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            now = time.time()
+            
+            cursor.execute('''
+                INSERT OR REPLACE INTO detection_cache (cache_key, detections, created_at, last_used_at)
+                VALUES (?, ?, ?, ?)
+            ''', (cache_key, json.dumps(detections), now, now))
+            
+            conn.commit()
+        return True
+    
+    @DB_QUERY_SECONDS.time(operation='evict_detection_cache')
+    def evict_detection_cache(self, ttl_seconds, max_entries):
+        """Drop expired entries, then least recently used ones above max_entries"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                DELETE FROM detection_cache WHERE created_at < ?
+            ''', (time.time() - ttl_seconds,))
+            expired = cursor.rowcount
+            
+            cursor.execute('''
+                DELETE FROM detection_cache WHERE cache_key IN (
+                    SELECT cache_key FROM detection_cache
+                    ORDER BY last_used_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+            ''', (max_entries,))
+            overflow = cursor.rowcount
+            
+            conn.commit()
+        return expired + overflow
+
+    @staticmethod
+    def _reference_uploads(cursor, image_hashes):
+        """Count new history references to stored uploads (inside the caller's transaction)"""
+        now = time.time()
+        cursor.executemany('''
+            INSERT INTO upload_blobs (sha256, refcount, created_at, last_used_at)
+            VALUES (?, 1, ?, ?)
+            ON CONFLICT (sha256) DO UPDATE SET
+                refcount = refcount + 1,
+                last_used_at = excluded.last_used_at
+        ''', [(image_hash, now, now) for image_hash in image_hashes if image_hash])
+    
+    @DB_QUERY_SECONDS.time(operation='put_upload_blob')
+    def put_upload_blob(self, sha256, size, store_original):
+        """
+        Record that an upload's original is on disk. store_original() writes
+        the file; it runs inside the write transaction, so no other process
+        can evict the original between the write and the row update.
+        Returns what store_original returned.
+        """
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            stored = store_original()
+            now = time.time()
+            conn.execute('''
+                INSERT INTO upload_blobs (sha256, size, original, created_at, last_used_at)
+                VALUES (?, ?, 1, ?, ?)
+                ON CONFLICT (sha256) DO UPDATE SET
+                    size = excluded.size,
+                    original = 1,
+                    last_used_at = excluded.last_used_at
+            ''', (sha256, size, now, now))
+            conn.commit()
+        return stored
+    
+    @DB_QUERY_SECONDS.time(operation='delete_unreferenced_uploads')
+    def delete_unreferenced_uploads(self, grace_seconds, remove_files):
+        """
+        Forget uploads no history row has referenced for grace_seconds and
+        call remove_files(sha256) for each before the transaction commits
+        (see put_upload_blob). Returns their hashes.
+        """
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = conn.execute('''
+                    DELETE FROM upload_blobs
+                    WHERE refcount <= 0 AND last_used_at < ?
+                    RETURNING sha256
+                ''', (time.time() - grace_seconds,)).fetchall()
+                for row in rows:
+                    remove_files(row[0])
+            finally:
+                # Rows are gone whether or not every file could be removed
+                conn.commit()
+        return [row[0] for row in rows]
+    
+    @DB_QUERY_SECONDS.time(operation='evict_upload_originals')
+    def evict_upload_originals(self, max_bytes, max_age_seconds, remove_original):
+        """
+        Mark originals evicted, least recently used first, until the rest fit
+        in max_bytes, plus any unused for max_age_seconds, and call
+        remove_original(sha256) for each before the transaction commits (see
+        put_upload_blob). Returns their hashes.
+        """
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('''
+                UPDATE upload_blobs SET original = 0
+                WHERE sha256 IN (
+                    SELECT sha256 FROM (
+                        SELECT sha256, last_used_at,
+                               SUM(size) OVER (ORDER BY last_used_at DESC, sha256 DESC) AS kept_bytes
+                        FROM upload_blobs
+                        WHERE original = 1
+                    )
+                    WHERE kept_bytes > ? OR last_used_at < ?
+                )
+                RETURNING sha256
+            ''', (max_bytes, time.time() - max_age_seconds)).fetchall()
+            try:
+                for row in rows:
+                    remove_original(row[0])
+            finally:
+                conn.commit()
+        return [row[0] for row in rows]
+    
+    def upload_storage_stats(self):
+        with self.pool.connection() as conn:
+            uploads, originals, original_bytes, references = conn.execute('''
+                SELECT COUNT(*), COALESCE(SUM(original), 0),
+                       COALESCE(SUM(CASE WHEN original = 1 THEN size END), 0), COALESCE(SUM(refcount), 0)
+                FROM upload_blobs
+            ''').fetchone()
+        return {"uploads": uploads, "originals": originals, "original_bytes": original_bytes,
+                "references": references}
+    
+    @DB_QUERY_SECONDS.time(operation='create_detection_job')
+    def create_detection_job(self, job_id, username, filename, image_bytes):
+        """Persist a new pending detection job together with its image"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            now = time.time()
+            
+            cursor.execute('''
+                INSERT INTO detection_jobs (id, username, filename, image, status, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 'pending', ?, ?)
+            ''', (job_id, username, filename, sqlite3.Binary(image_bytes), now, now))
+            
+            conn.commit()
+        return True
+    
+    @DB_QUERY_SECONDS.time(operation='get_detection_job')
+    def get_detection_job(self, job_id):
+        """Get job status and result (without the image)"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT id, username, filename, status, result, error, created_at, updated_at
+                FROM detection_jobs WHERE id = ?
+            ''', (job_id,))
+            
+            row = cursor.fetchone()
+        
+        if row:
+            return {
+                'id': row[0],
+                'username': row[1],
+                'filename': row[2],
+                'status': row[3],
+                'result': json.loads(row[4]) if row[4] else None,
+                'error': row[5],
+                'created_at': row[6],
+                'updated_at': row[7]
+            }
+        return None
+    
+    @DB_QUERY_SECONDS.time(operation='get_detection_job_image')
+    def get_detection_job_image(self, job_id):
+        """Get the stored upload for a job that has not finished yet"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT image FROM detection_jobs WHERE id = ?
+            ''', (job_id,))
+            
+            row = cursor.fetchone()
+        return bytes(row[0]) if row and row[0] is not None else None
+    
+    @DB_QUERY_SECONDS.time(operation='set_detection_job_status')
+    def set_detection_job_status(self, job_id, status, result=None, error=None):
+        """Update job status; finished jobs drop their stored image"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            finished = status in ('done', 'failed')
+            
+            cursor.execute('''
+                UPDATE detection_jobs
+                SET status = ?,
+                    result = ?,
+                    error = ?,
+                    image = CASE WHEN ? THEN NULL ELSE image END,
+                    updated_at = ?
+                WHERE id = ?
+            ''', (status, json.dumps(result) if result is not None else None, error,
+                  finished, time.time(), job_id))
+            
+            conn.commit()
+        return True
+    
+    @DB_QUERY_SECONDS.time(operation='claim_unfinished_detection_jobs')
+    def claim_unfinished_detection_jobs(self, started_before):
+        """
+        Reset jobs left pending or running by a process that stopped before
+        started_before and return their ids, oldest first. The update also
+        bumps updated_at, so when several workers start together each job is
+        claimed by exactly one of them.
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE detection_jobs
+                SET status = 'pending', updated_at = ?
+                WHERE status IN ('pending', 'running') AND updated_at < ?
+                RETURNING id, created_at
+            ''', (time.time(), started_before))
+            
+            rows = cursor.fetchall()
+            conn.commit()
+        return [job_id for job_id, _ in sorted(rows, key=lambda row: row[1])]
 
 # Create global database instance
 db = EcoWiseDB()
\ No newline at end of file
@@ -0,0 +1,75 @@
+"""
+Two-tier detection result cache for EcoWise
+Tier 1: in-process LRU, Tier 2: detection_cache table in ecowise.db
+Keys are a hash of the image bytes plus model name and confidence threshold
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class DetectionCache:
+    def __init__(self, database, max_memory_entries=1024, ttl_seconds=7 * 24 * 3600,
+                 max_db_entries=50000, evict_every=100):
+        self.db = database
+        self.max_memory_entries = max(1, int(max_memory_entries))
+        self.ttl_seconds = ttl_seconds
+        self.max_db_entries = max_db_entries
+        self.evict_every = max(1, int(evict_every))
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+        self._stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+    @staticmethod
+    def make_key(image_bytes, model_name, conf):
+        return DetectionCache.key_for_digest(hashlib.sha256(image_bytes).hexdigest(), model_name, conf)
+
+    @staticmethod
+    def key_for_digest(digest, model_name, conf):
+        """Cache key from an upload's SHA-256 hex digest (shared with the upload store)"""
+        return f"{model_name}:{conf:.4f}:{digest}"
+
+    def get(self, cache_key):
+        """Return (detections, tier) on a hit, or (None, None) on a miss"""
+        with self._lock:
+            detections = self._memory.get(cache_key)
+            if detections is not None:
+                self._memory.move_to_end(cache_key)
+                self._stats["memory_hits"] += 1
+                return detections, "memory"
+
+        detections = self.db.get_cached_detection(cache_key, self.ttl_seconds)
+        with self._lock:
+            if detections is None:
+                self._stats["misses"] += 1
+                return None, None
+            self._stats["db_hits"] += 1
+            self._remember(cache_key, detections)
+        return detections, "database"
+
+    def put(self, cache_key, detections):
+        with self._lock:
+            self._remember(cache_key, detections)
+            self._puts_since_evict += 1
+            run_eviction = self._puts_since_evict >= self.evict_every
+            if run_eviction:
+                self._puts_since_evict = 0
+
+        self.db.put_cached_detection(cache_key, detections)
+        if run_eviction:
+            self.db.evict_detection_cache(self.ttl_seconds, self.max_db_entries)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        return stats
+
+    def _remember(self, cache_key, detections):
+        self._memory[cache_key] = detections
+        self._memory.move_to_end(cache_key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
@@ -0,0 +1,141 @@
+"""
+Compact, versioned encoding of detections for recycling_history
+Replaces the old str() reprs with small BLOBs that decode back to JSON-ready data
+
+Detections (version 1), little-endian:
+    uint8 version | uint16 count | count x record
+    record = uint8 class_id | uint8 confidence (x/255) | 4 x uint16 bbox pixels
+    class_id 255 is followed by uint8 length + UTF-8 name for non-COCO labels
+
+Detections (version 2): the version 1 layout with version 2, followed by a
+compact UTF-8 JSON object {record index: {key: value}} holding any keys other
+than name/class_id/confidence/bbox (e.g. type/action/points on rows written by the
+first EcoWise versions), so re-encoding old rows loses nothing
+
+Recommendations (version 1):
+    uint8 version | compact UTF-8 JSON list
+"""
+
+import ast
+import json
+import struct
+
+DETECTIONS_V1 = 1
+DETECTIONS_V2 = 2
+RECOMMENDATIONS_V1 = 1
+
+_HEADER = struct.Struct('<BH')
+_RECORD = struct.Struct('<BBHHHH')
+_CUSTOM_CLASS = 255
+_MAX_COORD = 0xFFFF
+# class_id is the detecting model's own id; records store the COCO id of the name
+_RECORD_KEYS = frozenset(('name', 'class_id', 'confidence', 'bbox'))
+
+# YOLOv8 (COCO) class ids, in model order
+COCO_CLASSES = (
+    'person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck', 'boat',
+    'traffic light', 'fire hydrant', 'stop sign', 'parking meter', 'bench', 'bird', 'cat',
+    'dog', 'horse', 'sheep', 'cow', 'elephant', 'bear', 'zebra', 'giraffe', 'backpack',
+    'umbrella', 'handbag', 'tie', 'suitcase', 'frisbee', 'skis', 'snowboard', 'sports ball',
+    'kite', 'baseball bat', 'baseball glove', 'skateboard', 'surfboard', 'tennis racket',
+    'bottle', 'wine glass', 'cup', 'fork', 'knife', 'spoon', 'bowl', 'banana', 'apple',
+    'sandwich', 'orange', 'broccoli', 'carrot', 'hot dog', 'pizza', 'donut', 'cake', 'chair',
+    'couch', 'potted plant', 'bed', 'dining table', 'toilet', 'tv', 'laptop', 'mouse',
+    'remote', 'keyboard', 'cell phone', 'microwave', 'oven', 'toaster', 'sink',
+    'refrigerator', 'book', 'clock', 'vase', 'scissors', 'teddy bear', 'hair drier',
+    'toothbrush'
+)
+CLASS_IDS = {name: class_id for class_id, name in enumerate(COCO_CLASSES)}
+
+
+def _coord(value):
+    return min(max(int(round(value)), 0), _MAX_COORD)
+
+
+def encode_detections(detected_objects):
+    """
+    Pack [{'name', 'confidence', 'bbox'}, ...] into a version 1 BLOB, or a
+    version 2 BLOB when some detections carry other keys as well. Legacy
+    entries without a confidence or bbox are stored with 0 for them.
+    """
+    extras = {}
+    for index, obj in enumerate(detected_objects):
+        other = {key: value for key, value in obj.items() if key not in _RECORD_KEYS}
+        if other:
+            extras[str(index)] = other
+
+    parts = [_HEADER.pack(DETECTIONS_V2 if extras else DETECTIONS_V1, len(detected_objects))]
+    for obj in detected_objects:
+        class_id = CLASS_IDS.get(obj['name'], _CUSTOM_CLASS)
+        confidence = min(max(int(round((obj.get('confidence') or 0) * 255)), 0), 255)
+        x1, y1, x2, y2 = obj.get('bbox') or (0, 0, 0, 0)
+        parts.append(_RECORD.pack(class_id, confidence, _coord(x1), _coord(y1), _coord(x2), _coord(y2)))
+        if class_id == _CUSTOM_CLASS:
+            name = obj['name'].encode('utf-8')[:255]
+            parts.append(struct.pack('<B', len(name)) + name)
+    if extras:
+        parts.append(json.dumps(extras, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    return b''.join(parts)
+
+
+def decode_detections(value):
+    """
+    Decode a stored detected_objects value into a list of dicts.
+    Accepts version 1 and 2 BLOBs and legacy str() reprs from older rows.
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return _parse_legacy(value)
+
+    data = bytes(value)
+    version, count = _HEADER.unpack_from(data, 0)
+    if version not in (DETECTIONS_V1, DETECTIONS_V2):
+        raise ValueError(f"Unsupported detections encoding version {version}")
+
+    offset = _HEADER.size
+    detections = []
+    for _ in range(count):
+        class_id, confidence, x1, y1, x2, y2 = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        if class_id == _CUSTOM_CLASS:
+            length = data[offset]
+            name = data[offset + 1:offset + 1 + length].decode('utf-8')
+            offset += 1 + length
+        else:
+            name = COCO_CLASSES[class_id]
+        detections.append({
+            'name': name,
+            'confidence': round(confidence / 255, 3),
+            'bbox': [x1, y1, x2, y2]
+        })
+    if version == DETECTIONS_V2:
+        for index, other in json.loads(data[offset:].decode('utf-8')).items():
+            detections[int(index)].update(other)
+    return detections
+
+
+def encode_recommendations(recommendations):
+    payload = json.dumps(list(recommendations), ensure_ascii=False, separators=(',', ':'))
+    return bytes([RECOMMENDATIONS_V1]) + payload.encode('utf-8')
+
+
+def decode_recommendations(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return _parse_legacy(value)
+
+    data = bytes(value)
+    if data[0] != RECOMMENDATIONS_V1:
+        raise ValueError(f"Unsupported recommendations encoding version {data[0]}")
+    return json.loads(data[1:].decode('utf-8'))
+
+
+def _parse_legacy(text):
+    """Rows written before version 1 hold Python reprs of lists"""
+    try:
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return []
+    return value if isinstance(value, list) else []
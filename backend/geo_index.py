@@ -0,0 +1,318 @@
+"""
+Recycling center data and spatial index for EcoWise
+Centers are loaded once from data/recycling_centers.json into a lat/lng grid;
+nearest and radius queries only compute (vectorized) haversine distances for
+centers in nearby grid cells, unless there are so few centers that scanning
+all of them is cheaper. Bulk queries for many origins rank all centers with
+chunked matrix products instead.
+"""
+
+import csv
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32  # along a meridian (and along the equator)
+DEFAULT_CENTERS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'recycling_centers.json')
+MATRIX_CHUNK_CELLS = 1 << 21  # origin x center matrix entries per chunk (16 MB of float64)
+# A grid cell visit costs about as much as vectorized haversine over this many
+# centers, so a k-nearest search stops growing rings past len(centers) / SCAN_CELL_COST
+# cells and scans every center instead
+SCAN_CELL_COST = 128
+
+
+def haversine_km(lat, lng, lats, lngs):
+    """Distances in km from one point (degrees) to arrays of points (degrees)"""
+    lat1 = np.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlng = np.radians(lngs) - np.radians(lng)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def unit_vectors(lats, lngs):
+    """(n, 3) points on the unit sphere; a larger dot product means a shorter great-circle distance"""
+    lat, lng = np.radians(lats), np.radians(lngs)
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)], axis=-1)
+
+
+def read_origins_csv(lines):
+    """
+    Parse origin coordinates from CSV text lines. A header row naming lat/lng
+    (or latitude/longitude/lon) columns and an optional id column is used when
+    present; otherwise the first two columns are lat, lng.
+    Returns (lats, lngs, ids) where ids is None without an id column.
+    """
+    rows = csv.reader(lines)
+    header = next(rows, None)
+    if header is None:
+        return np.array([]), np.array([]), None
+
+    names = [name.strip().lower() for name in header]
+    lat_col = next((names.index(n) for n in ('lat', 'latitude') if n in names), None)
+    lng_col = next((names.index(n) for n in ('lng', 'lon', 'long', 'longitude') if n in names), None)
+    id_col = names.index('id') if 'id' in names else None
+    first_line = 2
+    if lat_col is None or lng_col is None:
+        rows, lat_col, lng_col, first_line = _prepend(header, rows), 0, 1, 1
+
+    lats, lngs, ids = [], [], []
+    for line_number, row in enumerate(rows, start=first_line):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        try:
+            lats.append(float(row[lat_col]))
+            lngs.append(float(row[lng_col]))
+        except (IndexError, ValueError):
+            raise ValueError(f"Invalid coordinates on CSV line {line_number}")
+        if id_col is not None:
+            ids.append(row[id_col] if id_col < len(row) else None)
+
+    if id_col is None:
+        ids = None
+    return np.array(lats, dtype=np.float64), np.array(lngs, dtype=np.float64), ids
+
+
+def _prepend(row, rows):
+    yield row
+    yield from rows
+
+
+def load_centers(path=DEFAULT_CENTERS_FILE):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class CenterIndex:
+    """Uniform lat/lng grid over recycling centers"""
+
+    def __init__(self, centers, cell_deg=0.1):
+        self.centers = centers
+        self.cell_deg = cell_deg
+        self.lats = np.array([c['lat'] for c in centers], dtype=np.float64)
+        self.lngs = np.array([c['lng'] for c in centers], dtype=np.float64)
+        self._lng_cells = int(round(360 / cell_deg))
+        self._vectors = unit_vectors(self.lats, self.lngs)
+
+        cells = {}
+        for position, (lat, lng) in enumerate(zip(self.lats, self.lngs)):
+            cells.setdefault(self._cell(lat, lng), []).append(position)
+        self._cells = {cell: np.array(ids, dtype=np.int64) for cell, ids in cells.items()}
+
+    def __len__(self):
+        return len(self.centers)
+
+    def nearest(self, lat, lng, k=None, radius_km=None):
+        """
+        Return [(position, distance_km)] sorted by distance: the k nearest
+        centers, optionally limited to radius_km (k=None means no count limit).
+        """
+        if not self.centers or k == 0:
+            return []
+        if radius_km is not None:
+            positions = self._cells_within(lat, lng, radius_km)
+            distances = haversine_km(lat, lng, self.lats[positions], self.lngs[positions])
+            keep = distances <= radius_km
+            return self._top(positions[keep], distances[keep], k)
+        if k is None or k >= len(self.centers):
+            positions = np.arange(len(self.centers))
+            return self._top(positions, haversine_km(lat, lng, self.lats, self.lngs), k)
+        return self._knn(lat, lng, k)
+
+    def nearest_many(self, lats, lngs, k, radius_km=None, chunk_cells=MATRIX_CHUNK_CELLS):
+        """
+        Yield (origin_index, positions, distances_km) per origin, nearest first,
+        for arrays of origins. Centers are ranked on an origin x center matrix
+        of unit-vector dot products (one matrix multiply per chunk of origins,
+        so memory stays bounded); haversine is only computed for the top k.
+        """
+        count = len(self.centers)
+        k = count if k is None else min(k, count)
+        chunk = max(1, chunk_cells // max(count, 1))
+        origins = unit_vectors(lats, lngs)
+
+        for start in range(0, len(lats), chunk):
+            end = min(start + chunk, len(lats))
+            if k == 0:
+                for i in range(start, end):
+                    yield i, np.array([], dtype=np.int64), np.array([])
+                continue
+
+            closeness = origins[start:end] @ self._vectors.T
+            if k < count:
+                nearest = np.argpartition(-closeness, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.broadcast_to(np.arange(count), closeness.shape)
+            distances = haversine_km(lats[start:end, None], lngs[start:end, None],
+                                     self.lats[nearest], self.lngs[nearest])
+            order = np.argsort(distances, axis=1, kind='stable')
+            nearest = np.take_along_axis(nearest, order, axis=1)
+            distances = np.take_along_axis(distances, order, axis=1)
+
+            for row in range(end - start):
+                positions, row_distances = nearest[row], distances[row]
+                if radius_km is not None:
+                    keep = row_distances <= radius_km
+                    positions, row_distances = positions[keep], row_distances[keep]
+                yield start + row, positions, row_distances
+
+    def _knn(self, lat, lng, k):
+        """Grow square rings of cells until the k-th distance is inside the searched area"""
+        row, col = self._cell(lat, lng)
+        max_ring = int(math.ceil(180 / self.cell_deg))
+        max_cells = len(self.centers) // SCAN_CELL_COST
+        positions = []
+
+        for ring in range(max_ring + 1):
+            if (2 * ring + 1) ** 2 > max_cells:
+                break  # scanning every center is cheaper than more rings
+            positions.extend(self._ring(row, col, ring))
+            if len(positions) < k:
+                continue
+
+            candidates = np.array(positions, dtype=np.int64)
+            distances = haversine_km(lat, lng, self.lats[candidates], self.lngs[candidates])
+            kth = np.partition(distances, k - 1)[k - 1]
+            if kth <= self._covered_km(lat, ring):
+                return self._top(candidates, distances, k)
+
+        return self._scan(lat, lng, k)
+
+    def _scan(self, lat, lng, k):
+        """k nearest of all centers: one vectorized haversine pass and a partial sort"""
+        distances = haversine_km(lat, lng, self.lats, self.lngs)
+        candidates = np.argpartition(distances, k - 1)[:k]
+        return self._top(candidates, distances[candidates], k)
+
+    def _covered_km(self, lat, ring):
+        """Radius guaranteed to be fully inside rings 0..ring around lat"""
+        edge_lat = min(abs(lat) + (ring + 1) * self.cell_deg, 89.9)
+        cell_km = self.cell_deg * KM_PER_DEGREE * math.cos(math.radians(edge_lat))
+        return ring * cell_km
+
+    def _cells_within(self, lat, lng, radius_km):
+        dlat = radius_km / KM_PER_DEGREE
+        edge_lat = min(abs(lat) + dlat, 89.9)
+        dlng = min(radius_km / (KM_PER_DEGREE * math.cos(math.radians(edge_lat))), 180)
+
+        row_min, col_min = self._cell(lat - dlat, lng - dlng)
+        row_max, col_max = self._cell(lat + dlat, lng + dlng)
+        if dlng >= 180:
+            col_min, col_max = 0, self._lng_cells - 1  # every longitude
+        elif col_max < col_min:
+            col_max += self._lng_cells  # crosses the antimeridian
+
+        found = []
+        if (row_max - row_min + 1) * (col_max - col_min + 1) > len(self._cells):
+            # Box covers more cells than are occupied: filter the occupied ones
+            for (row, col), ids in self._cells.items():
+                if col < col_min:
+                    col += self._lng_cells
+                if row_min <= row <= row_max and col_min <= col <= col_max:
+                    found.append(ids)
+        else:
+            for row in range(row_min, row_max + 1):
+                for col in range(col_min, col_max + 1):
+                    ids = self._cells.get((row, col % self._lng_cells))
+                    if ids is not None:
+                        found.append(ids)
+        return np.concatenate(found) if found else np.array([], dtype=np.int64)
+
+    def _ring(self, row, col, ring):
+        if ring == 0:
+            cells = [(row, col)]
+        else:
+            cells = [(row - ring, c) for c in range(col - ring, col + ring + 1)]
+            cells += [(row + ring, c) for c in range(col - ring, col + ring + 1)]
+            cells += [(r, col - ring) for r in range(row - ring + 1, row + ring)]
+            cells += [(r, col + ring) for r in range(row - ring + 1, row + ring)]
+
+        positions = []
+        for r, c in cells:
+            ids = self._cells.get((r, c % self._lng_cells))
+            if ids is not None:
+                positions.extend(ids.tolist())
+        return positions
+
+    def _cell(self, lat, lng):
+        return (int(math.floor(lat / self.cell_deg)),
+                int(math.floor(lng / self.cell_deg)) % self._lng_cells)
+
+    @staticmethod
+    def _top(positions, distances, k):
+        order = np.argsort(distances, kind='stable')
+        if k is not None:
+            order = order[:k]
+        return [(int(positions[i]), float(distances[i])) for i in order]
+
+
+class CenterData:
+    """One immutable snapshot of the center list, its index and its serialized forms"""
+
+    def __init__(self, centers, mtime=None):
+        self.centers = centers
+        self.mtime = mtime
+        self.index = CenterIndex(centers)
+        self.by_id = {center['id']: center for center in centers}
+
+        # /recycling-centers response, serialized and compressed once
+        self.json_bytes = json.dumps(centers, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self.gzip_bytes = gzip.compress(self.json_bytes, compresslevel=9, mtime=0)
+        digest = hashlib.sha256(self.json_bytes).hexdigest()[:32]
+        self.etag = digest
+        self.gzip_etag = digest + '-gzip'
+
+
+class CenterCatalog:
+    """
+    Current CenterData for a centers file. The file's mtime is checked at most
+    every check_seconds and a changed file is loaded into a new snapshot, so a
+    request always sees one consistent set of index, lookup and response bytes.
+    """
+
+    def __init__(self, path=DEFAULT_CENTERS_FILE, check_seconds=5):
+        self.path = path
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._checked_at = time.monotonic()
+        self._data = self._load()
+
+    def current(self):
+        if time.monotonic() - self._checked_at > self.check_seconds:
+            self._check()
+        return self._data
+
+    def reload(self):
+        with self._lock:
+            self._data = self._load()
+            self._checked_at = time.monotonic()
+        return self._data
+
+    def _check(self):
+        with self._lock:
+            if time.monotonic() - self._checked_at <= self.check_seconds:
+                return  # another request just checked
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                if mtime != self._data.mtime:
+                    self._data = self._load()
+                    logger.info("Reloaded recycling centers", extra={"centers": len(self._data.centers)})
+            except (OSError, ValueError, KeyError) as e:
+                logger.error("Could not reload recycling centers: %s", e)
+
+    def _load(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        return CenterData(load_centers(self.path), mtime)
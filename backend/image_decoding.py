@@ -0,0 +1,117 @@
+"""
+In-memory image decoding and preprocessing for EcoWise uploads
+Decodes request bytes straight into an array without touching disk, applies
+EXIF orientation and letterboxes into a small set of fixed input shapes
+"""
+
+import io
+import math
+
+import numpy as np
+from PIL import Image
+
+# Default longest model input side; YOLOv8n is trained at 640 px
+MODEL_INPUT_SIZE = 640
+
+# Width:height aspect ratios of the fixed input-shape buckets
+BUCKET_ASPECTS = ((1, 1), (4, 3), (3, 4), (16, 9), (9, 16))
+STRIDE = 32
+PAD_VALUE = 114  # YOLOv8 letterbox grey
+
+EXIF_ORIENTATION = 0x0112
+EXIF_TRANSPOSE = {
+    2: (Image.Transpose.FLIP_LEFT_RIGHT,),
+    3: (Image.Transpose.ROTATE_180,),
+    4: (Image.Transpose.FLIP_TOP_BOTTOM,),
+    5: (Image.Transpose.TRANSPOSE,),
+    6: (Image.Transpose.ROTATE_270,),
+    7: (Image.Transpose.TRANSVERSE,),
+    8: (Image.Transpose.ROTATE_90,),
+}
+
+
+class DecodedImage:
+    """Model-ready pixels plus the mapping back to the original upload"""
+
+    def __init__(self, array, original_size, scale, pad=(0, 0)):
+        self.array = array                  # HxWx3 uint8, BGR channel order (what YOLO expects)
+        self.original_size = original_size  # (width, height) of the upload after EXIF rotation
+        self.scale = scale                  # original pixels per model pixel
+        self.pad = pad                      # (x, y) letterbox padding in model pixels
+
+    def to_original(self, bbox):
+        """Map an [x1, y1, x2, y2] box from model input space to original pixels"""
+        pad_x, pad_y = self.pad
+        width, height = self.original_size
+        x1, y1, x2, y2 = bbox
+        return [
+            min(max((x1 - pad_x) * self.scale, 0.0), width),
+            min(max((y1 - pad_y) * self.scale, 0.0), height),
+            min(max((x2 - pad_x) * self.scale, 0.0), width),
+            min(max((y2 - pad_y) * self.scale, 0.0), height)
+        ]
+
+    def to_original_array(self, bboxes):
+        """Vectorized to_original for an (N, 4) array of boxes"""
+        pad_x, pad_y = self.pad
+        width, height = self.original_size
+        mapped = (np.asarray(bboxes, dtype=np.float64) - (pad_x, pad_y, pad_x, pad_y)) * self.scale
+        return np.clip(mapped, 0.0, (width, height, width, height))
+
+
+def shape_buckets(max_side=MODEL_INPUT_SIZE):
+    """(width, height) input shapes for each bucket aspect, multiples of STRIDE"""
+    buckets = []
+    for aspect_w, aspect_h in BUCKET_ASPECTS:
+        if aspect_w >= aspect_h:
+            width, height = max_side, max_side * aspect_h / aspect_w
+        else:
+            width, height = max_side * aspect_w / aspect_h, max_side
+        buckets.append((int(math.ceil(width / STRIDE) * STRIDE),
+                        int(math.ceil(height / STRIDE) * STRIDE)))
+    return buckets
+
+
+def pick_bucket(size, buckets):
+    """Bucket whose aspect ratio is closest (in log space) to the image's"""
+    width, height = size
+    aspect = math.log(width / height)
+    return min(buckets, key=lambda b: abs(math.log(b[0] / b[1]) - aspect))
+
+
+def decode_upload(image_bytes, max_side=MODEL_INPUT_SIZE):
+    """
+    Decode and preprocess uploaded image bytes into a letterboxed BGR array.
+    JPEGs use DCT draft mode so large photos are decoded at 1/2, 1/4 or 1/8
+    scale while staying at least max_side on each side.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+
+    # Full-resolution upright size, known from the header before decoding
+    original_w, original_h = image.size
+    if orientation in (5, 6, 7, 8):
+        original_w, original_h = original_h, original_w
+    original_size = (original_w, original_h)
+
+    if image.format == 'JPEG':
+        image.draft('RGB', (max_side, max_side))
+    image = image.convert('RGB')
+
+    for method in EXIF_TRANSPOSE.get(orientation, ()):
+        image = image.transpose(method)
+    width, height = image.size
+
+    bucket_w, bucket_h = pick_bucket(original_size, shape_buckets(max_side))
+    ratio = min(bucket_w / width, bucket_h / height)
+    resized_w, resized_h = max(1, round(width * ratio)), max(1, round(height * ratio))
+    if (resized_w, resized_h) != (width, height):
+        image = image.resize((resized_w, resized_h), Image.Resampling.BILINEAR)
+
+    pad_x, pad_y = (bucket_w - resized_w) // 2, (bucket_h - resized_h) // 2
+    canvas = np.full((bucket_h, bucket_w, 3), PAD_VALUE, dtype=np.uint8)
+    canvas[pad_y:pad_y + resized_h, pad_x:pad_x + resized_w] = np.asarray(image)[:, :, ::-1]
+
+    scale = original_size[0] / resized_w
+    return DecodedImage(canvas, original_size, scale, (pad_x, pad_y))
+
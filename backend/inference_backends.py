@@ -0,0 +1,284 @@
+"""
+Pluggable CPU inference backends for EcoWise AI
+
+    pytorch    - yolov8n.pt run eagerly by ultralytics (default)
+    onnx       - exported to ONNX, run with ONNX Runtime
+    onnx-int8  - ONNX statically quantized to int8, calibrated on uploads/
+                 (the sample images and the stored originals)
+    openvino   - exported to OpenVINO IR, run with the OpenVINO runtime
+
+Exported artifacts are loaded back through ultralytics YOLO(), so every
+backend produces the same results objects and the same detection dicts.
+Run this file directly to export a backend and check accuracy parity,
+including batched inference on the exported model:
+
+    python inference_backends.py --backend onnx-int8
+"""
+
+import argparse
+import glob
+import json
+import logging
+import os
+
+import numpy as np
+
+from image_decoding import PAD_VALUE, decode_upload
+from logging_config import configure_logging
+
+BACKENDS = ('pytorch', 'onnx', 'onnx-int8', 'openvino')
+DEFAULT_CALIBRATION_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png', '*.bmp')
+# Leading bytes of the formats uploads are accepted in; stored originals
+# (see upload_store) have no extension, so they are recognized by content
+IMAGE_SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'BM', b'GIF8', b'RIFF')
+MAX_CALIBRATION_IMAGES = 500
+
+logger = logging.getLogger(__name__)
+
+
+def prepare_model(model_path, backend='pytorch', imgsz=640, calibration_dir=DEFAULT_CALIBRATION_DIR):
+    """Return the artifact path YOLO() should load for a backend, exporting it if missing"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+
+    if backend == 'pytorch':
+        return model_path
+    if backend == 'onnx':
+        return export_onnx(model_path, imgsz)
+    if backend == 'onnx-int8':
+        return quantize_onnx_int8(export_onnx(model_path, imgsz), calibration_dir, imgsz)
+    return export_openvino(model_path, imgsz)
+
+
+def _artifact_stem(model_path):
+    """
+    Exports get a dynamic batch axis, since the batching scheduler passes up
+    to BATCH_MAX_SIZE images per call; the name keeps them apart from static
+    batch-1 exports made by earlier versions.
+    """
+    return os.path.splitext(model_path)[0] + '_dynamic'
+
+
+def export_onnx(model_path, imgsz=640):
+    onnx_path = _artifact_stem(model_path) + '.onnx'
+    if not os.path.exists(onnx_path):
+        from ultralytics import YOLO
+        logger.info("Exporting model to ONNX", extra={"model": model_path})
+        exported = YOLO(model_path).export(format='onnx', imgsz=imgsz, simplify=True, dynamic=True)
+        os.replace(exported, onnx_path)
+    return onnx_path
+
+
+def export_openvino(model_path, imgsz=640):
+    openvino_dir = _artifact_stem(model_path) + '_openvino_model'
+    if not os.path.isdir(openvino_dir):
+        from ultralytics import YOLO
+        logger.info("Exporting model to OpenVINO IR", extra={"model": model_path})
+        exported = YOLO(model_path).export(format='openvino', imgsz=imgsz, dynamic=True)
+        os.replace(exported, openvino_dir)
+    return openvino_dir
+
+
+def _is_image(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(8).startswith(IMAGE_SIGNATURES)
+    except OSError:
+        return False
+
+
+def calibration_images(calibration_dir=DEFAULT_CALIBRATION_DIR, limit=MAX_CALIBRATION_IMAGES):
+    """
+    Image files directly in calibration_dir plus the stored originals under
+    calibration_dir/originals, at most limit of them (evenly spread over the
+    sorted paths, so the selection is repeatable)
+    """
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(calibration_dir, pattern)))
+    for directory, _, files in os.walk(os.path.join(calibration_dir, 'originals')):
+        paths.extend(path for path in (os.path.join(directory, name) for name in files) if _is_image(path))
+    paths.sort()
+    if limit and len(paths) > limit:
+        paths = [paths[i * len(paths) // limit] for i in range(limit)]
+    return paths
+
+
+def letterbox_tensor(image_bytes, imgsz=640):
+    """Preprocess like ultralytics does for exported models: square letterbox, RGB, NCHW, 0-1"""
+    decoded = decode_upload(image_bytes, imgsz)
+    height, width = decoded.array.shape[:2]
+    canvas = np.full((imgsz, imgsz, 3), PAD_VALUE, dtype=np.uint8)
+    top, left = (imgsz - height) // 2, (imgsz - width) // 2
+    canvas[top:top + height, left:left + width] = decoded.array
+    rgb = canvas[:, :, ::-1].transpose(2, 0, 1)
+    return np.ascontiguousarray(rgb, dtype=np.float32)[None] / 255.0
+
+
+class UploadCalibrationReader:
+    """Feeds letterboxed upload images to onnxruntime's static quantizer"""
+
+    def __init__(self, input_name, paths, imgsz=640):
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._paths = iter(paths)
+
+    def get_next(self):
+        for path in self._paths:
+            try:
+                with open(path, 'rb') as f:
+                    return {self.input_name: letterbox_tensor(f.read(), self.imgsz)}
+            except Exception as e:
+                logger.warning("Skipping calibration image %s: %s", path, e)
+        return None
+
+
+def quantize_onnx_int8(onnx_path, calibration_dir=DEFAULT_CALIBRATION_DIR, imgsz=640):
+    """Statically quantize an ONNX model to int8 (QDQ) using images from calibration_dir"""
+    int8_path = os.path.splitext(onnx_path)[0] + '_int8.onnx'
+    if os.path.exists(int8_path):
+        return int8_path
+
+    import onnx
+    import onnxruntime
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+
+    paths = calibration_images(calibration_dir)
+    if not paths:
+        raise ValueError(f"No calibration images found in {calibration_dir}")
+
+    input_name = onnxruntime.InferenceSession(
+        onnx_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    logger.info("Quantizing model to int8", extra={"model": onnx_path, "calibration_images": len(paths)})
+    quantize_static(
+        onnx_path,
+        int8_path,
+        UploadCalibrationReader(input_name, paths, imgsz),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True
+    )
+
+    # Keep the ultralytics metadata (class names, stride, imgsz) on the int8 model
+    source = onnx.load(onnx_path)
+    quantized = onnx.load(int8_path)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(source.metadata_props)
+    onnx.save(quantized, int8_path)
+    return int8_path
+
+
+def _box_iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare_detections(reference, candidate, iou_threshold=0.5):
+    """Greedy same-class IoU matching of two detection lists"""
+    unmatched = list(candidate)
+    matches = []
+    for ref in sorted(reference, key=lambda d: -d['confidence']):
+        best, best_iou = None, iou_threshold
+        for cand in unmatched:
+            if cand['name'] == ref['name']:
+                iou = _box_iou(ref['bbox'], cand['bbox'])
+                if iou >= best_iou:
+                    best, best_iou = cand, iou
+        if best is not None:
+            unmatched.remove(best)
+            matches.append((ref, best, best_iou))
+    return matches
+
+
+def check_parity(reference_engine, candidate_engine, image_paths, iou_threshold=0.5, batch_size=8):
+    """
+    Run both engines on the same images and report how closely the candidate
+    backend reproduces the reference detections. The candidate also runs the
+    images batch_size at a time, as the batching scheduler does; images whose
+    batched detections differ from their single-image ones are counted in
+    batch_mismatches.
+    """
+    totals = {"reference": 0, "candidate": 0, "matched": 0}
+    conf_deltas, ious, per_image = [], [], []
+
+    for path in image_paths:
+        reference = reference_engine.detect_objects(path)
+        candidate = candidate_engine.detect_objects(path)
+        matches = compare_detections(reference, candidate, iou_threshold)
+
+        totals["reference"] += len(reference)
+        totals["candidate"] += len(candidate)
+        totals["matched"] += len(matches)
+        conf_deltas.extend(abs(r['confidence'] - c['confidence']) for r, c, _ in matches)
+        ious.extend(iou for _, _, iou in matches)
+        per_image.append({
+            "image": os.path.basename(path),
+            "reference": [d['name'] for d in reference],
+            "candidate": [d['name'] for d in candidate],
+            "matched": len(matches),
+            "single": candidate
+        })
+
+    batch_mismatches = 0
+    for start in range(0, len(image_paths), batch_size):
+        batched = candidate_engine.detect_batch(image_paths[start:start + batch_size])
+        for entry, detections in zip(per_image[start:start + batch_size], batched):
+            single = entry.pop("single")
+            if len(detections) != len(single) or \
+                    len(compare_detections(single, detections, iou_threshold)) != len(single):
+                batch_mismatches += 1
+
+    return {
+        "images": len(image_paths),
+        "recall": totals["matched"] / totals["reference"] if totals["reference"] else 1.0,
+        "precision": totals["matched"] / totals["candidate"] if totals["candidate"] else 1.0,
+        "mean_confidence_delta": float(np.mean(conf_deltas)) if conf_deltas else 0.0,
+        "mean_iou": float(np.mean(ious)) if ious else 0.0,
+        "batch_size": batch_size,
+        "batch_mismatches": batch_mismatches,
+        "per_image": per_image
+    }
+
+
+def main():
+    from ai_service import DetectionError, EcoWiseAI
+
+    parser = argparse.ArgumentParser(description="Export an EcoWise inference backend and check parity")
+    parser.add_argument('--backend', choices=BACKENDS[1:], default='onnx')
+    parser.add_argument('--model', default='yolov8n.pt')
+    parser.add_argument('--images', default=DEFAULT_CALIBRATION_DIR)
+    parser.add_argument('--min-recall', type=float, default=0.9)
+    parser.add_argument('--batch-size', type=int, default=int(os.environ.get('ECOWISE_BATCH_MAX_SIZE', 8)),
+                        help="images per detect_batch call when checking batched inference")
+    args = parser.parse_args()
+    configure_logging()
+
+    reference = EcoWiseAI(args.model, backend='pytorch')
+    candidate = EcoWiseAI(args.model, backend=args.backend)
+    reference.load(warmup=False)
+    candidate.load(warmup=False)
+
+    try:
+        report = check_parity(reference, candidate, calibration_images(args.images), batch_size=args.batch_size)
+    except DetectionError as e:
+        print(f"❌ Parity check failed: {e}")
+        raise SystemExit(1)
+    report["backend"] = args.backend
+    print(json.dumps(report, indent=2))
+
+    if report["recall"] < args.min_recall:
+        print(f"❌ Parity check failed: recall {report['recall']:.2f} < {args.min_recall}")
+        raise SystemExit(1)
+    if report["batch_mismatches"]:
+        print(f"❌ Batched inference differs from single images on {report['batch_mismatches']} images")
+        raise SystemExit(1)
+    print("✅ Parity check passed")
+
+
+if __name__ == '__main__':
+    main()
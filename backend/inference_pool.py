@@ -0,0 +1,310 @@
+"""
+Multi-process inference for EcoWise
+Worker processes are forked after the YOLOv8 model is loaded, so weights are
+shared copy-on-write. Images travel through shared memory, not pickles.
+"""
+
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import connection, resource_tracker, shared_memory
+
+import numpy as np
+
+from ai_service import DetectionError
+from image_decoding import DecodedImage
+
+logger = logging.getLogger(__name__)
+
+
+def limit_torch_threads(num_threads):
+    """Stop each worker's intra-op pool from oversubscribing the cores"""
+    try:
+        import torch
+        torch.set_num_threads(num_threads)
+    except ImportError:
+        pass
+
+
+def _worker_main(engine, conn, num_threads, parent_conns):
+    # A server (e.g. a gunicorn worker) may have installed handlers that only
+    # set a flag; terminate() has to actually stop this process
+    for signum in (signal.SIGTERM, signal.SIGQUIT, signal.SIGHUP):
+        signal.signal(signum, signal.SIG_DFL)
+    # Inherited web-process ends of the pipes: closing them lets recv() see
+    # EOF once the web process is gone
+    for parent_conn in parent_conns:
+        parent_conn.close()
+    limit_torch_threads(num_threads)
+
+    # Warm up here rather than in the parent: running torch before fork can
+    # leave the children with a broken OpenMP thread pool
+    try:
+        engine.warm_up()
+        conn.send(('warm', engine.warmup_ms, None))
+    except Exception as e:
+        conn.send(('warm', None, str(e)))
+    logger.info("Inference worker ready", extra={"pid": os.getpid(), "threads": num_threads})
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break  # the web process is gone
+        if task is None:
+            break
+
+        task_id, payload = task
+        try:
+            if payload[0] == 'path':
+                detections = engine.detect_objects(payload[1])
+            else:
+                _, shm_name, shape, dtype, scale, original_size, pad = payload
+                # Attaching registers the segment again with the web process's
+                # resource tracker, a no-op: the web process owns and unlinks it
+                shm = shared_memory.SharedMemory(name=shm_name)
+                try:
+                    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+                    detections = engine.detect_objects(DecodedImage(array, original_size, scale, pad))
+                    del array
+                finally:
+                    shm.close()
+            conn.send(('done', task_id, detections, None))
+        except Exception as e:
+            conn.send(('done', task_id, None, str(e)))
+
+
+class _Worker:
+    """One inference process, its pipe and the tasks sent to it"""
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.running = set()
+        self.warm = False
+
+
+class ProcessInferencePool:
+    def __init__(self, engine, workers=None, timeout=60, threads_per_worker=None, respawn_delay=1.0):
+        """
+        engine must already hold a loaded (not yet warmed up) model; it is
+        inherited by the forked workers rather than reloaded in each one.
+        threads_per_worker defaults to sharing all cores between this pool's
+        workers; pass less when several pools run side by side.
+        A worker that dies (OOM kill, crash in torch) fails the tasks it held
+        straight away and is replaced, at most once per respawn_delay seconds.
+        """
+        self.engine = engine
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        self.timeout = timeout
+        self.respawn_delay = respawn_delay
+
+        # Every worker has its own pipe: a process killed while holding the
+        # lock of a shared queue would block all the others
+        self._ctx = multiprocessing.get_context('fork')
+        self._threads_per_worker = max(1, int(threads_per_worker or (os.cpu_count() or 1) // self.workers))
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._completed = 0
+        self._restarts = 0
+        self._warmup_ms = []
+        self._closing = False
+        # Started before the first fork so every worker, replacements
+        # included, shares it with this process (see _worker_main)
+        resource_tracker.ensure_running()
+        self._slots = []
+        for _ in range(self.workers):
+            self._slots.append(self._spawn())
+        self._respawn_at = [None] * self.workers
+
+        self._collector = threading.Thread(target=self._collect, name="ecowise-inference-results",
+                                           daemon=True)
+        self._collector.start()
+        logger.info("Process inference pool ready", extra={"workers": self.workers})
+
+    def _spawn(self):
+        conn, child_conn = self._ctx.Pipe()
+        with self._lock:
+            parent_conns = [conn] + [w.conn for w in self._slots if w is not None]
+        process = self._ctx.Process(target=_worker_main,
+                                    args=(self.engine, child_conn, self._threads_per_worker, parent_conns),
+                                    daemon=True)
+        process.start()
+        child_conn.close()
+        return _Worker(process, conn)
+
+    def detect_objects(self, image):
+        """Run detection on a worker process; image is a path or DecodedImage"""
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images):
+        """Spread several images over the workers; returns detections per image, in order"""
+        submitted = []
+        try:
+            for image in images:
+                submitted.append(self._submit(image))
+            deadline = time.monotonic() + self.timeout
+            return [future.result(timeout=max(0.0, deadline - time.monotonic()))
+                    for _, future, _ in submitted]
+        except FutureTimeoutError:
+            raise DetectionError(f"No inference result within {self.timeout}s")
+        finally:
+            for task_id, _, shm in submitted:
+                with self._lock:
+                    self._pending.pop(task_id, None)
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+
+    def _submit(self, image):
+        future = Future()
+        task_id = next(self._ids)
+        shm = None
+
+        if isinstance(image, DecodedImage):
+            array = image.array
+            shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            payload = ('shm', shm.name, array.shape, array.dtype.str,
+                       image.scale, image.original_size, image.pad)
+        else:
+            payload = ('path', image)
+
+        with self._lock:
+            self._pending[task_id] = future
+            # Least loaded live worker (a warm one when there is a choice)
+            alive = [w for w in self._slots if w is not None and w.process.is_alive()]
+            worker = min(alive, key=lambda w: (not w.warm, len(w.running)), default=None)
+            if worker is not None:
+                worker.running.add(task_id)
+        if worker is None:
+            future.set_exception(DetectionError("No inference worker is running"))
+            return task_id, future, shm
+
+        try:
+            with worker.send_lock:
+                worker.conn.send((task_id, payload))
+        except (OSError, ValueError) as e:
+            # Died since the check above; the collector replaces it and fails
+            # the task unless that already happened
+            with self._lock:
+                owned = task_id in worker.running
+                worker.running.discard(task_id)
+            if owned:
+                future.set_exception(DetectionError(f"Inference worker unavailable: {e}"))
+        return task_id, future, shm
+
+    def get_recommendation(self, detected_objects):
+        return self.engine.get_recommendation(detected_objects)
+
+    def ready(self):
+        with self._lock:
+            return all(w is not None and w.warm and w.process.is_alive() for w in self._slots)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": "process",
+                "workers": self.workers,
+                "alive_workers": sum(1 for w in self._slots if w is not None and w.process.is_alive()),
+                "warm_workers": sum(1 for w in self._slots if w is not None and w.warm),
+                "worker_warmup_ms": list(self._warmup_ms),
+                "worker_restarts": self._restarts,
+                "in_flight": len(self._pending),
+                "completed": self._completed
+            }
+
+    def shutdown(self):
+        self._closing = True
+        workers = [w for w in self._slots if w is not None]
+        for worker in workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in workers:
+            worker.process.join(timeout=5)
+
+    def _collect(self):
+        while not self._closing:
+            with self._lock:
+                workers = [w for w in self._slots if w is not None]
+            waitables = [w.conn for w in workers] + [w.process.sentinel for w in workers]
+            ready = set(connection.wait(waitables, timeout=self.respawn_delay))
+
+            for worker in workers:
+                if worker.conn in ready:
+                    self._receive(worker)
+                if worker.process.sentinel in ready and not self._closing:
+                    self._replace(worker)
+            self._respawn_due()
+
+    def _receive(self, worker):
+        """Handle every message waiting on a worker's pipe"""
+        try:
+            while worker.conn.poll():
+                message = worker.conn.recv()
+                if message[0] == 'warm':
+                    _, warmup_ms, error = message
+                    if error is None:
+                        with self._lock:
+                            worker.warm = True
+                            self._warmup_ms.append(warmup_ms)
+                    else:
+                        logger.error("Inference worker warm-up failed: %s", error)
+                    continue
+
+                _, task_id, detections, error = message
+                with self._lock:
+                    owned = task_id in worker.running
+                    worker.running.discard(task_id)
+                    future = self._pending.get(task_id)
+                    self._completed += 1
+                if future is None or not owned:
+                    continue
+                if error is not None:
+                    future.set_exception(DetectionError(f"Inference worker error: {error}"))
+                else:
+                    future.set_result(detections)
+        except (EOFError, OSError):
+            pass  # the worker exited; its sentinel is ready too
+
+    def _replace(self, worker):
+        """Fail a dead worker's tasks and schedule a replacement"""
+        self._receive(worker)  # results it sent before exiting
+        worker.process.join()
+        worker.conn.close()
+        with self._lock:
+            slot = self._slots.index(worker)
+            self._slots[slot] = None
+            self._respawn_at[slot] = time.monotonic()
+            futures = [self._pending.get(task_id) for task_id in worker.running]
+            worker.running.clear()
+        logger.error("Inference worker exited", extra={"pid": worker.process.pid,
+                                                       "exitcode": worker.process.exitcode,
+                                                       "tasks": len(futures)})
+        for future in futures:
+            if future is not None:
+                future.set_exception(DetectionError(
+                    f"Inference worker exited with code {worker.process.exitcode}"))
+
+    def _respawn_due(self):
+        for slot, died_at in enumerate(self._respawn_at):
+            if died_at is None or time.monotonic() - died_at < self.respawn_delay or self._closing:
+                continue
+            # Forked from a process that runs other threads: the child only
+            # touches the engine and its pipe, both safe to use after fork
+            worker = self._spawn()
+            with self._lock:
+                self._slots[slot] = worker
+                self._respawn_at[slot] = None
+                self._restarts += 1
+            logger.warning("Inference worker replaced", extra={"pid": worker.process.pid})
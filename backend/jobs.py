@@ -0,0 +1,133 @@
+"""
+Asynchronous detection jobs for EcoWise
+Uploads are accepted immediately and processed by a bounded worker pool.
+Job state lives in the detection_jobs table so pending work survives restarts.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+FINISHED_STATUSES = ('done', 'failed')
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already waiting for a worker"""
+
+
+class DetectionJobQueue:
+    def __init__(self, database, handler, max_workers=4, max_pending=256):
+        """
+        handler(image_bytes, filename, username) runs the full detection
+        pipeline and returns the JSON-ready result for the job.
+        """
+        self.db = database
+        self.handler = handler
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                            thread_name_prefix='ecowise-job')
+        self._changed = threading.Condition()
+        self._changes = 0  # bumped on every status change, so waiters can read without the lock
+        self._outstanding = 0
+
+    def submit(self, username, filename, image_bytes):
+        """Store a new job and hand it to the worker pool; returns the job id"""
+        with self._changed:
+            if self._outstanding >= self.max_pending:
+                raise JobQueueFull(f"{self._outstanding} detection jobs already queued")
+            self._outstanding += 1
+
+        job_id = uuid.uuid4().hex
+        try:
+            self.db.create_detection_job(job_id, username, filename, image_bytes)
+        except Exception:
+            with self._changed:
+                self._outstanding -= 1
+            raise
+
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    def resume_pending(self, started_before=None):
+        """
+        Re-queue jobs left pending or running by a previous process, i.e. last
+        touched before started_before (default: now). Web workers pass the
+        server's start time so they never take over each other's jobs.
+        """
+        job_ids = self.db.claim_unfinished_detection_jobs(started_before or time.time())
+        for job_id in job_ids:
+            with self._changed:
+                self._outstanding += 1
+            self._executor.submit(self._run, job_id)
+        if job_ids:
+            logger.info("Resumed unfinished detection jobs", extra={"jobs": len(job_ids)})
+        return len(job_ids)
+
+    def get(self, job_id):
+        return self.db.get_detection_job(job_id)
+
+    def wait(self, job_id, timeout, known_status=None):
+        """
+        Block until the job finishes (or, if known_status is given, until
+        its status differs from it) or the timeout expires. Returns the job.
+        """
+        deadline = time.monotonic() + max(0.0, timeout)
+        while True:
+            with self._changed:
+                seen = self._changes
+            # Read without the lock so waiters don't queue up behind each other's queries
+            job = self.db.get_detection_job(job_id)
+            if job is None or job['status'] in FINISHED_STATUSES:
+                return job
+            if known_status is not None and job['status'] != known_status:
+                return job
+            with self._changed:
+                # A change since `seen` may be this job's: read it again
+                # rather than wait for a notification that already happened
+                while self._changes == seen:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return job
+                    self._changed.wait(remaining)
+
+    def stats(self):
+        with self._changed:
+            return {
+                "workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "outstanding": self._outstanding
+            }
+
+    def _set_status(self, job_id, status, result=None, error=None):
+        self.db.set_detection_job_status(job_id, status, result, error)
+        with self._changed:
+            self._changes += 1
+            self._changed.notify_all()
+
+    def _run(self, job_id):
+        try:
+            job = self.db.get_detection_job(job_id)
+            image_bytes = self.db.get_detection_job_image(job_id)
+            if job is None or image_bytes is None:
+                logger.warning("Detection job has no stored image, skipping", extra={"job_id": job_id})
+                if job is not None:
+                    self._set_status(job_id, 'failed', error="Image data missing")
+                return
+
+            self._set_status(job_id, 'running')
+            try:
+                result = self.handler(image_bytes, job['filename'], job['username'])
+                self._set_status(job_id, 'done', result=result)
+            except Exception as e:
+                logger.error("Detection job failed: %s", e, extra={"job_id": job_id})
+                self._set_status(job_id, 'failed', error=str(e))
+        finally:
+            with self._changed:
+                self._outstanding -= 1
+                self._changed.notify_all()
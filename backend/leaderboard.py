@@ -0,0 +1,119 @@
+"""
+In-process leaderboard for EcoWise
+Keeps users sorted by eco_points so top-N and rank lookups are a slice or a
+binary search instead of a full table sort per request.
+"""
+
+import bisect
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Leaderboard:
+    def __init__(self, loader, max_age_seconds=30):
+        """
+        loader() returns (username, eco_points, level) rows for every user.
+        The cache is built from it when cold or after invalidate(). Once it is
+        older than max_age_seconds it keeps serving while a background thread
+        rebuilds it, to pick up writes made by other processes.
+        """
+        self.loader = loader
+        self.max_age_seconds = max_age_seconds
+
+        self._lock = threading.RLock()
+        self._order = None   # sorted [(-eco_points, username)]
+        self._users = {}     # username -> (eco_points, level)
+        self._loaded_at = 0.0
+        self._refreshing = False
+        self._applied_during_refresh = []
+
+    def invalidate(self):
+        with self._lock:
+            self._order = None
+
+    def apply(self, username, eco_points, level):
+        """
+        Move one user to their new score. Call it before the write commits,
+        while the database write lock orders it after any earlier update.
+        """
+        with self._lock:
+            if self._order is None:
+                return  # cold cache; the next read rebuilds it
+            if self._refreshing:
+                self._applied_during_refresh.append((username, eco_points, level))
+            self._move(username, eco_points, level)
+
+    def top(self, limit=10):
+        with self._lock:
+            self._ensure_loaded()
+            return [self._entry(position) for position in range(min(limit, len(self._order)))]
+
+    def around(self, username, window=2):
+        """The user's own entry plus up to `window` neighbours above and below"""
+        with self._lock:
+            self._ensure_loaded()
+            user = self._users.get(username)
+            if user is None:
+                return None
+
+            position = bisect.bisect_left(self._order, (-user[0], username))
+            start = max(0, position - window)
+            end = min(len(self._order), position + window + 1)
+            return {
+                "user": self._entry(position),
+                "neighbours": [self._entry(i) for i in range(start, end)],
+                "total_users": len(self._order)
+            }
+
+    def _ensure_loaded(self):
+        if self._order is None:
+            self._users, self._order = self._build()
+            self._loaded_at = time.monotonic()
+        elif time.monotonic() - self._loaded_at > self.max_age_seconds and not self._refreshing:
+            self._refreshing = True
+            threading.Thread(target=self._refresh, name="ecowise-leaderboard", daemon=True).start()
+
+    def _build(self):
+        users = {username: (points or 0, level) for username, points, level in self.loader()}
+        order = sorted((-points, username) for username, (points, _) in users.items())
+        return users, order
+
+    def _refresh(self):
+        try:
+            users, order = self._build()
+        except Exception as e:
+            logger.error("Leaderboard refresh failed: %s", e)
+            users = None
+        with self._lock:
+            if users is not None:
+                self._users, self._order = users, order
+                # Writes applied while the snapshot was being read still count
+                for update in self._applied_during_refresh:
+                    self._move(*update)
+            self._applied_during_refresh = []
+            self._loaded_at = time.monotonic()
+            self._refreshing = False
+
+    def _move(self, username, eco_points, level):
+        previous = self._users.get(username)
+        if previous is not None:
+            index = bisect.bisect_left(self._order, (-previous[0], username))
+            if index < len(self._order) and self._order[index] == (-previous[0], username):
+                del self._order[index]
+
+        bisect.insort(self._order, (-eco_points, username))
+        self._users[username] = (eco_points, level)
+
+    def _entry(self, position):
+        neg_points, username = self._order[position]
+        # Users with equal points share a rank (1, 2, 2, 4 ...)
+        rank = bisect.bisect_left(self._order, (neg_points, '')) + 1
+        return {
+            "rank": rank,
+            "username": username,
+            "eco_points": -neg_points,
+            "level": self._users[username][1]
+        }
@@ -0,0 +1,62 @@
+"""
+Logging setup for EcoWise
+Modules log through logging.getLogger(__name__) with structured fields in
+`extra`; this renders them as text (key=value) or one JSON object per line.
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+
+# Attributes every LogRecord has; anything else was passed in `extra`
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def _fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RESERVED}
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        text = super().format(record)
+        fields = _fields(record)
+        if fields:
+            text += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=None, fmt=None, stream=None):
+    """
+    Configure the root logger once. level and fmt default to ECOWISE_LOG_LEVEL
+    (INFO) and ECOWISE_LOG_FORMAT ('text' or 'json'); stream to stdout.
+    """
+    level = (level or os.environ.get('ECOWISE_LOG_LEVEL', 'INFO')).upper()
+    fmt = fmt or os.environ.get('ECOWISE_LOG_FORMAT', 'text')
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
@@ -0,0 +1,213 @@
+"""
+Per-user near-duplicate detection for EcoWise uploads
+Each decoded upload gets a 64-bit perceptual hash (pHash: the sign of the
+low-frequency DCT coefficients of a 32x32 grayscale thumbnail), which stays
+within a few bits under recompression, rescaling and small crops. A user's
+recent hashes live in a BK-tree, so a Hamming-radius lookup only visits a
+fraction of them; a match reuses the stored detections instead of running
+inference again.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8   # 8x8 DCT coefficients -> 64-bit hash
+DCT_SIZE = 32   # thumbnail side the DCT runs on
+
+
+def _dct_matrix(size):
+    """Orthonormal DCT-II matrix, so dct(x) = M @ x @ M.T for a square block"""
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(DCT_SIZE)
+_BIT_WEIGHTS = 1 << np.arange(HASH_SIZE * HASH_SIZE - 1, -1, -1, dtype=np.uint64)
+
+
+def perceptual_hash(image):
+    """64-bit pHash of a DecodedImage, ignoring its letterbox padding"""
+    array = image.array
+    pad_x, pad_y = image.pad
+    height, width = array.shape[:2]
+    content = array[pad_y:height - pad_y, pad_x:width - pad_x]
+
+    # BGR -> luma, then an area-averaged 32x32 thumbnail
+    gray = content[:, :, 0] * 0.114 + content[:, :, 1] * 0.587 + content[:, :, 2] * 0.299
+    thumbnail = Image.fromarray(gray.astype(np.float32), mode='F').resize((DCT_SIZE, DCT_SIZE), Image.Resampling.BOX)
+    coefficients = (_DCT @ np.asarray(thumbnail, dtype=np.float64) @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+
+    # Median without the DC term, which only reflects overall brightness
+    median = np.median(coefficients.ravel()[1:])
+    bits = (coefficients.ravel() > median).astype(np.uint64)
+    return int((bits * _BIT_WEIGHTS).sum())
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class _Node:
+    __slots__ = ('hash', 'entry', 'children')
+
+    def __init__(self, image_hash, entry):
+        self.hash = image_hash
+        self.entry = entry
+        self.children = {}  # distance -> _Node
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes with the Hamming metric"""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, image_hash, entry):
+        self.size += 1
+        if self.root is None:
+            self.root = _Node(image_hash, entry)
+            return
+        node = self.root
+        while True:
+            distance = hamming(image_hash, node.hash)
+            child = node.children.get(distance)
+            if child is None:
+                node.children[distance] = _Node(image_hash, entry)
+                return
+            node = child
+
+    def search(self, image_hash, radius):
+        """[(distance, entry)] for every hash within radius"""
+        found = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(image_hash, node.hash)
+            if distance <= radius:
+                found.append((distance, node.entry))
+            # Triangle inequality: only subtrees at distance +- radius can match
+            for child_distance, child in node.children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+class _UserUploads:
+    """One user's recent uploads: a BK-tree plus exact cache-key lookups"""
+
+    def __init__(self):
+        self.tree = BKTree()
+        self.by_key = {}
+        self.entries = []  # oldest first; [added_at, cache_key, hash, detections, live]
+        self.live = 0
+
+
+class NearDuplicateIndex:
+    def __init__(self, max_distance=10, ttl_seconds=3600, max_per_user=64, max_users=10000):
+        self.max_distance = max(0, int(max_distance))
+        self.ttl_seconds = ttl_seconds
+        self.max_per_user = max(1, int(max_per_user))
+        self.max_users = max(1, int(max_users))
+
+        self._lock = threading.Lock()
+        self._users = OrderedDict()  # username -> _UserUploads, least recently used first
+
+        # Stats exposed through stats()
+        self._stats = {"lookups": 0, "exact_hits": 0, "near_hits": 0, "added": 0}
+
+    def find(self, username, cache_key, image_hash=None):
+        """
+        Detections from this user's recent upload with the same bytes, or
+        (when image_hash is given) with a hash within max_distance.
+        Returns None when there is no such upload.
+        """
+        with self._lock:
+            self._stats["lookups"] += 1
+            uploads = self._users.get(username)
+            if uploads is None:
+                return None
+            self._expire(uploads)
+
+            entry = uploads.by_key.get(cache_key)
+            if entry is not None:
+                self._stats["exact_hits"] += 1
+                return entry[3]
+            if image_hash is None:
+                return None
+
+            matches = [(distance, entry) for distance, entry in
+                       uploads.tree.search(image_hash, self.max_distance) if entry[4]]
+            if not matches:
+                return None
+            self._stats["near_hits"] += 1
+            # Closest first, then the most recent
+            return min(matches, key=lambda match: (match[0], -match[1][0]))[1][3]
+
+    def add(self, username, cache_key, image_hash, detections):
+        """Remember an upload; image_hash None means it only matches the same bytes"""
+        with self._lock:
+            uploads = self._users.get(username)
+            if uploads is None:
+                uploads = self._users[username] = _UserUploads()
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(username)
+                self._expire(uploads)
+
+            entry = [time.monotonic(), cache_key, image_hash, detections, True]
+            self._forget(uploads, uploads.by_key.get(cache_key))
+            uploads.by_key[cache_key] = entry
+            uploads.entries.append(entry)
+            uploads.live += 1
+            if image_hash is not None:
+                uploads.tree.add(image_hash, entry)
+            while uploads.live > self.max_per_user:
+                self._forget(uploads, next(e for e in uploads.entries if e[4]))
+            self._compact(uploads)
+            self._stats["added"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["users"] = len(self._users)
+            stats["entries"] = sum(uploads.live for uploads in self._users.values())
+        stats["max_distance"] = self.max_distance
+        return stats
+
+    def _expire(self, uploads):
+        cutoff = time.monotonic() - self.ttl_seconds
+        for entry in uploads.entries:
+            if entry[0] >= cutoff:
+                break
+            self._forget(uploads, entry)
+        self._compact(uploads)
+
+    @staticmethod
+    def _forget(uploads, entry):
+        """Mark an entry dead; the BK-tree keeps it until the next rebuild"""
+        if entry is None or not entry[4]:
+            return
+        entry[4] = False
+        uploads.live -= 1
+        if uploads.by_key.get(entry[1]) is entry:
+            del uploads.by_key[entry[1]]
+
+    @staticmethod
+    def _compact(uploads):
+        """Drop dead entries and rebuild the tree once they outnumber live ones"""
+        if len(uploads.entries) - uploads.live <= max(uploads.live, 8):
+            return
+        uploads.entries = [entry for entry in uploads.entries if entry[4]]
+        uploads.tree = BKTree()
+        for entry in uploads.entries:
+            if entry[2] is not None:
+                uploads.tree.add(entry[2], entry)
@@ -0,0 +1,110 @@
+"""
+Production entry point for the EcoWise API
+Runs app.py under gunicorn with preforked web workers. The YOLOv8 weights are
+loaded once here, before the workers fork, and shared copy-on-write; each
+worker then warms the model up (or forks its inference processes) itself,
+since running torch before fork can break the children's thread pools.
+Requests are served by a pool of threads per worker while inference runs on
+the detector (the batching thread or the inference processes, see
+ECOWISE_INFERENCE_MODE), and /detect and the long-lived streams (SSE, camera
+frames, job long-polls) are capped per worker by ECOWISE_DETECT_MAX_CONCURRENCY
+and ECOWISE_STREAM_MAX_CONCURRENCY, so cheap endpoints always find a free
+thread. The database schema is created and migrated once, here, before fork.
+
+    python serve.py [--bind 0.0.0.0:5000] [--workers 2] [--threads 16]
+
+In-memory state (camera sessions, the near-duplicate index, the memory tier
+of the detection cache, write-behind deltas and /metrics) is per worker, so
+with several workers camera sessions need a proxy that routes them by id.
+"""
+
+import argparse
+import logging
+import os
+import time
+
+from gunicorn.app.base import BaseApplication
+
+from ai_service import ai_engine
+from inference_pool import limit_torch_threads
+from logging_config import configure_logging
+
+logger = logging.getLogger('ecowise.serve')
+
+
+class EcoWiseServer(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Imported in each worker after fork: app.py starts threads (and,
+        # in process mode, inference processes) that must not be forked
+        from app import app
+        return app
+
+
+def post_fork(server, worker):
+    """Split the cores between workers so their torch thread pools don't oversubscribe them"""
+    limit_torch_threads(max(1, (os.cpu_count() or 1) // server.cfg.workers))
+
+
+def prepare_database():
+    """Create and migrate the schema once, so workers don't race on the migrations"""
+    # Importing database opens ecowise.db and runs init_database/run_migrations
+    from database import db
+    # Forked workers must not share the master's sqlite connections
+    db.pool.close_all()
+
+
+def preload_model():
+    """Load (but don't run) the model so forked workers share its weights"""
+    try:
+        ai_engine.load(warmup=False)
+    except Exception:
+        # Recorded in load_error; each worker tries again on its own
+        logger.warning("Model preload failed, workers will load it themselves")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the EcoWise API with gunicorn")
+    parser.add_argument('--bind', default=os.environ.get('ECOWISE_BIND', '0.0.0.0:5000'))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('ECOWISE_WEB_WORKERS', 2)),
+                        help="web worker processes")
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('ECOWISE_WEB_THREADS', 16)),
+                        help="request threads per worker")
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('ECOWISE_WEB_TIMEOUT', 120)),
+                        help="seconds before a stuck worker is restarted")
+    args = parser.parse_args()
+
+    # ecowise.db, the model weights and the data files are relative to backend/
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    configure_logging()
+
+    # Workers read these when they import app.py
+    os.environ['ECOWISE_WEB_WORKERS'] = str(max(1, args.workers))
+    os.environ['ECOWISE_WEB_THREADS'] = str(max(1, args.threads))
+    os.environ['ECOWISE_SERVER_STARTED_AT'] = repr(time.time())
+
+    prepare_database()
+    preload_model()
+    logger.info("Starting EcoWise server", extra={"bind": args.bind, "workers": args.workers, "threads": args.threads,
+                                                  "inference_mode": os.environ.get('ECOWISE_INFERENCE_MODE', 'batch')})
+    EcoWiseServer({
+        'bind': args.bind,
+        'workers': max(1, args.workers),
+        'threads': max(1, args.threads),
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'graceful_timeout': 30,
+        'keepalive': 5,
+        'post_fork': post_fork,
+    }).run()
+
+
+if __name__ == '__main__':
+    main()
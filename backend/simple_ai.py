@@ -2,9 +2,13 @@
 SIMPLE AI Service for EcoWise - Guaranteed Working Version
 """
 
+import logging
+
+logger = logging.getLogger(__name__)
+
 class SimpleEcoWiseAI:
     def __init__(self):
-        print("🤖 Simple EcoWise AI Started!")
+        logger.info("Simple EcoWise AI started")
         
         # Simple object database
         self.object_database = {
@@ -25,7 +29,7 @@ class SimpleEcoWiseAI:
         filename_lower = filename.lower()
         detected_objects = []
         
-        print(f"🔍 Analyzing: {filename_lower}")
+        logger.debug("Analyzing %s", filename_lower)
         
         # Simple keyword matching - works for both file uploads AND camera
         if 'bottle' in filename_lower or 'plastic' in filename_lower or 'capture' in filename_lower:
@@ -92,7 +96,7 @@ class SimpleEcoWiseAI:
                 'points': 5
             })
         
-        print(f"✅ Detected: {[obj['name'] for obj in detected_objects]}")
+        logger.debug("Detected %s", [obj['name'] for obj in detected_objects])
         return detected_objects
     
     def get_recommendation(self, detected_objects):
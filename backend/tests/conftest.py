@@ -0,0 +1,6 @@
+"""Backend modules are flat, so tests import them from the backend directory"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
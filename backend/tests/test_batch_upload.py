@@ -0,0 +1,131 @@
+import io
+import zipfile
+
+import pytest
+
+from batch_upload import iter_multipart_images, iter_zip_images
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(256)) * 4
+JPEG = b'\xff\xd8\xff' + b'\x00' * 2000
+
+
+class _Unseekable(io.RawIOBase):
+    """Write sink without seek/tell, so zipfile falls back to data descriptors"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+
+def _zip(entries, compression=zipfile.ZIP_DEFLATED, streamed=False, force_zip64=False):
+    sink = _Unseekable() if streamed else io.BytesIO()
+    with zipfile.ZipFile(sink, 'w', compression=compression) as archive:
+        for name, data in entries:
+            with archive.open(name, 'w', force_zip64=force_zip64) as entry:
+                entry.write(data)
+    return bytes(sink.buffer) if streamed else sink.getvalue()
+
+
+def _read(archive, max_image_bytes=1 << 20, chunk_size=65536):
+    return list(iter_zip_images(io.BytesIO(archive), max_image_bytes, chunk_size))
+
+
+@pytest.mark.parametrize('compression', [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_reads_images_in_order(compression):
+    archive = _zip([('a.png', PNG), ('photos/b.JPG', JPEG)], compression=compression)
+
+    assert _read(archive) == [('a.png', PNG), ('photos/b.JPG', JPEG)]
+
+
+def test_skips_non_images_hidden_files_and_macos_metadata():
+    archive = _zip([
+        ('notes.txt', b'hello' * 100),
+        ('.hidden.png', PNG),
+        ('__MACOSX/._a.png', b'\x00' * 100),
+        ('folder/', b''),
+        ('a.png', PNG),
+    ])
+
+    assert _read(archive) == [('a.png', PNG)]
+
+
+@pytest.mark.parametrize('force_zip64', [False, True])
+@pytest.mark.parametrize('chunk_size', [7, 65536])
+def test_deflated_entries_with_data_descriptors(force_zip64, chunk_size):
+    entries = [('a.png', PNG), ('skip.txt', b'text' * 500), ('b.jpg', JPEG)]
+    archive = _zip(entries, streamed=True, force_zip64=force_zip64)
+    assert all(info.flag_bits & 0x08 for info in zipfile.ZipFile(io.BytesIO(archive)).infolist())
+
+    assert _read(archive, chunk_size=chunk_size) == [('a.png', PNG), ('b.jpg', JPEG)]
+
+
+def test_stored_entry_with_data_descriptor_is_rejected():
+    archive = _zip([('a.png', PNG)], compression=zipfile.ZIP_STORED, streamed=True)
+
+    with pytest.raises(ValueError, match='data descriptor'):
+        _read(archive)
+
+
+@pytest.mark.parametrize('streamed', [False, True])
+def test_inflate_is_capped(streamed):
+    bomb = _zip([('bomb.png', b'\x00' * (4 << 20))], streamed=streamed)
+    assert len(bomb) < 10000
+
+    with pytest.raises(ValueError, match='larger than'):
+        _read(bomb, max_image_bytes=1 << 20)
+
+
+def test_skipped_entries_are_not_capped():
+    archive = _zip([('big.bin', b'\x00' * (4 << 20)), ('a.png', PNG)], streamed=True)
+
+    assert _read(archive, max_image_bytes=len(PNG)) == [('a.png', PNG)]
+
+
+def test_stored_image_over_the_limit_is_rejected():
+    archive = _zip([('a.png', PNG)], compression=zipfile.ZIP_STORED)
+
+    with pytest.raises(ValueError, match='a.png is larger than'):
+        _read(archive, max_image_bytes=len(PNG) - 1)
+
+
+@pytest.mark.parametrize('compression, streamed', [
+    (zipfile.ZIP_STORED, False), (zipfile.ZIP_DEFLATED, False), (zipfile.ZIP_DEFLATED, True)
+])
+def test_truncated_archive(compression, streamed):
+    archive = _zip([('a.png', PNG), ('b.jpg', JPEG)], compression=compression, streamed=streamed)
+    second = archive.index(b'PK\x03\x04', 4)
+
+    for cut in (second + 10, second + 40, len(archive) // 2 + 1):
+        with pytest.raises(ValueError, match='truncated'):
+            _read(archive[:cut], chunk_size=64)
+
+
+def test_non_zip_input_yields_nothing():
+    assert _read(b'') == []
+    assert _read(b'not a zip archive at all') == []
+
+
+def test_multipart_expands_zip_parts_and_collects_fields():
+    boundary = 'ecowise-boundary'
+    parts = [
+        ('Content-Disposition: form-data; name="username"', b'alice'),
+        ('Content-Disposition: form-data; name="images"; filename="one.png"\r\n'
+         'Content-Type: image/png', PNG),
+        ('Content-Disposition: form-data; name="images"; filename="more.zip"\r\n'
+         'Content-Type: application/zip', _zip([('two.jpg', JPEG)], streamed=True)),
+    ]
+    body = b''.join(
+        f'--{boundary}\r\n{headers}\r\n\r\n'.encode() + data + b'\r\n' for headers, data in parts
+    ) + f'--{boundary}--\r\n'.encode()
+    fields = {}
+
+    images = list(iter_multipart_images(io.BytesIO(body), boundary, fields, 1 << 20, chunk_size=100))
+
+    assert images == [('one.png', PNG), ('two.jpg', JPEG)]
+    assert fields == {'username': 'alice'}
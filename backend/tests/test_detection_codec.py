@@ -0,0 +1,79 @@
+import struct
+
+import pytest
+
+from detection_codec import (
+    DETECTIONS_V1, DETECTIONS_V2, decode_detections, decode_recommendations,
+    encode_detections, encode_recommendations
+)
+
+
+def test_v1_round_trip_rounds_confidence_and_bbox():
+    detections = [
+        {'name': 'bottle', 'class_id': 39, 'confidence': 0.87, 'bbox': [10.4, 20.6, 110.0, 220.2]},
+        {'name': 'cup', 'confidence': 0.5, 'bbox': [0, 0, 5, 5]},
+    ]
+    blob = encode_detections(detections)
+
+    assert blob[0] == DETECTIONS_V1
+    assert decode_detections(blob) == [
+        {'name': 'bottle', 'confidence': round(222 / 255, 3), 'bbox': [10, 21, 110, 220]},
+        {'name': 'cup', 'confidence': round(128 / 255, 3), 'bbox': [0, 0, 5, 5]},
+    ]
+
+
+def test_custom_names_and_clamped_values():
+    blob = encode_detections([{'name': 'pizza box', 'confidence': 1.5, 'bbox': [-3, 2, 70000, 4]}])
+
+    assert decode_detections(blob) == [{'name': 'pizza box', 'confidence': 1.0, 'bbox': [0, 2, 65535, 4]}]
+
+
+def test_v2_keeps_extra_keys():
+    detections = [
+        {'name': 'bottle', 'confidence': 0.9, 'bbox': [1, 2, 3, 4]},
+        {'name': 'banana', 'confidence': 0.4, 'bbox': [5, 6, 7, 8],
+         'type': 'compost', 'action': 'Compost it', 'points': 5},
+    ]
+    blob = encode_detections(detections)
+
+    assert blob[0] == DETECTIONS_V2
+    decoded = decode_detections(blob)
+    assert 'type' not in decoded[0]
+    assert decoded[1]['type'] == 'compost'
+    assert decoded[1]['action'] == 'Compost it'
+    assert decoded[1]['points'] == 5
+
+
+def test_legacy_repr_round_trip():
+    legacy = repr([{'name': 'cup', 'confidence': 0.75, 'type': 'recyclable', 'points': 10}])
+    decoded = decode_detections(legacy)
+
+    assert decoded == [{'name': 'cup', 'confidence': 0.75, 'type': 'recyclable', 'points': 10}]
+    again = decode_detections(encode_detections(decoded))
+    assert again == [{'name': 'cup', 'confidence': round(191 / 255, 3), 'bbox': [0, 0, 0, 0],
+                      'type': 'recyclable', 'points': 10}]
+
+
+def test_legacy_entry_without_confidence_encodes_as_zero():
+    decoded = decode_detections(repr([{'name': 'bottle', 'type': 'recyclable'}]))
+
+    again = decode_detections(encode_detections(decoded))
+    assert again == [{'name': 'bottle', 'confidence': 0.0, 'bbox': [0, 0, 0, 0], 'type': 'recyclable'}]
+
+
+@pytest.mark.parametrize('value', ['not a list', '{"a": 1}', "[{'name': 'cup'"])
+def test_unreadable_legacy_values_decode_empty(value):
+    assert decode_detections(value) == []
+
+
+def test_unknown_version_is_rejected():
+    with pytest.raises(ValueError):
+        decode_detections(struct.pack('<BH', 9, 0))
+
+
+def test_recommendations_round_trip():
+    recommendations = ['Rinse the bottle', 'Recycle the cap separately']
+
+    assert decode_recommendations(encode_recommendations(recommendations)) == recommendations
+    assert decode_recommendations(repr(recommendations)) == recommendations
+    assert decode_recommendations(None) == []
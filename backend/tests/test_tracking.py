@@ -0,0 +1,82 @@
+import numpy as np
+
+from tracking import IoUTracker, iou_matrix
+
+
+def _det(name, x, y, size=40, confidence=0.8):
+    return {'name': name, 'confidence': confidence, 'bbox': [x, y, x + size, y + size]}
+
+
+def test_iou_matrix():
+    ious = iou_matrix([[0, 0, 10, 10]], [[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30], [0, 0, 0, 0]])
+
+    np.testing.assert_allclose(ious, [[1.0, 1 / 3, 0.0, 0.0]])
+
+
+def test_object_is_confirmed_once_after_min_hits():
+    tracker = IoUTracker(min_hits=2)
+
+    assert tracker.update([_det('bottle', 100, 100)]) == []
+    confirmed = tracker.update([_det('bottle', 102, 101)])
+    assert [t.name for t in confirmed] == ['bottle']
+    for step in range(10):
+        assert tracker.update([_det('bottle', 104 + step, 101)]) == []
+    assert len(tracker.tracks) == 1
+    assert tracker.tracks[0].hits == 12
+
+
+def test_min_hits_one_confirms_immediately():
+    tracker = IoUTracker(min_hits=1)
+
+    assert len(tracker.update([_det('cup', 0, 0), _det('bottle', 200, 200)])) == 2
+    assert tracker.update([_det('cup', 1, 1), _det('bottle', 201, 201)]) == []
+
+
+def test_other_classes_do_not_continue_a_track():
+    tracker = IoUTracker(min_hits=2)
+    tracker.update([_det('bottle', 100, 100)])
+
+    assert tracker.update([_det('cup', 100, 100)]) == []
+    assert sorted(t.name for t in tracker.tracks) == ['bottle', 'cup']
+
+
+def test_short_gap_keeps_the_track_and_its_count():
+    tracker = IoUTracker(max_missed=3, min_hits=2)
+    tracker.update([_det('bottle', 100, 100)])
+    assert len(tracker.update([_det('bottle', 100, 100)])) == 1
+
+    for _ in range(3):
+        tracker.update([])
+    assert tracker.update([_det('bottle', 100, 100)]) == []
+    assert len(tracker.tracks) == 1
+    assert tracker.active()[0]['counted'] is True
+
+
+def test_track_is_dropped_after_max_missed_and_recounted():
+    tracker = IoUTracker(max_missed=3, min_hits=2)
+    tracker.update([_det('bottle', 100, 100)])
+    first = tracker.update([_det('bottle', 100, 100)])[0]
+
+    for _ in range(4):
+        tracker.update([])
+    assert tracker.tracks == []
+
+    tracker.update([_det('bottle', 100, 100)])
+    again = tracker.update([_det('bottle', 100, 100)])
+    assert len(again) == 1 and again[0].id != first.id
+
+
+def test_prediction_bridges_a_gap_longer_than_the_box():
+    tracker = IoUTracker(max_missed=3, min_hits=2)
+    counted = 0
+    for frame in range(45):
+        x = 100 + 5 * frame
+        if frame % 3:
+            tracker.predict()
+        elif 30 <= frame < 39:
+            tracker.update([])  # missed while it moves 60px, more than its width
+        else:
+            counted += len(tracker.update([_det('bottle', x, 100)]))
+
+    assert counted == 1
+    assert [t.id for t in tracker.tracks] == [1]
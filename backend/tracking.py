@@ -0,0 +1,121 @@
+"""
+Lightweight multi-object tracker for EcoWise camera streams
+Greedy same-class IoU matching between detection frames, with constant
+velocity prediction for the frames in between that skip inference.
+"""
+
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU of (N, 4) and (M, 4) xyxy boxes"""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+class Track:
+    def __init__(self, track_id, detection):
+        self.id = track_id
+        self.name = detection['name']
+        self.confidence = detection['confidence']
+        self.bbox = np.asarray(detection['bbox'], dtype=np.float64)
+        self.measured = self.bbox  # last detected box, before any prediction
+        self.velocity = np.zeros(4)  # bbox change per frame
+        self.hits = 1
+        self.missed = 0
+        self.frames_since_update = 0
+        self.counted = False
+
+    def predict(self):
+        self.bbox = self.bbox + self.velocity
+        self.frames_since_update += 1
+
+    def update(self, detection):
+        bbox = np.asarray(detection['bbox'], dtype=np.float64)
+        frames = max(self.frames_since_update, 1)
+        self.velocity = 0.5 * self.velocity + 0.5 * (bbox - self.measured) / frames
+        self.bbox = self.measured = bbox
+        self.confidence = detection['confidence']
+        self.hits += 1
+        self.missed = 0
+        self.frames_since_update = 0
+
+    def to_dict(self):
+        return {
+            "track_id": self.id,
+            "name": self.name,
+            "confidence": round(self.confidence, 3),
+            "bbox": [round(v, 1) for v in self.bbox.tolist()],
+            "counted": self.counted
+        }
+
+
+class IoUTracker:
+    def __init__(self, iou_threshold=0.3, max_missed=3, min_hits=2):
+        """
+        A detection continues a track of the same class when their IoU is at
+        least iou_threshold. Tracks are dropped after max_missed detection
+        frames without a match and confirmed after min_hits matches.
+        """
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self.min_hits = max(1, min_hits)
+        self.tracks = []
+        self._next_id = 1
+
+    def predict(self):
+        """Advance every track one frame (frames that skip inference)"""
+        for track in self.tracks:
+            track.predict()
+
+    def update(self, detections):
+        """
+        Advance one frame and match it with its detections.
+        Returns tracks confirmed for the first time in this frame; each
+        physical object is returned (and should be counted) only once.
+        """
+        self.predict()
+        unmatched = list(range(len(detections)))
+
+        if self.tracks and detections:
+            ious = iou_matrix([t.bbox for t in self.tracks], [d['bbox'] for d in detections])
+            same_class = np.array([[t.name == d['name'] for d in detections] for t in self.tracks])
+            ious[~same_class] = 0.0
+
+            # Greedy: best remaining pair first
+            for flat in np.argsort(ious, axis=None)[::-1]:
+                t, d = np.unravel_index(flat, ious.shape)
+                if ious[t, d] < self.iou_threshold:
+                    break
+                if self.tracks[t].frames_since_update == 0 or d not in unmatched:
+                    continue  # already matched this frame
+                self.tracks[t].update(detections[d])
+                unmatched.remove(d)
+
+        for track in self.tracks:
+            if track.frames_since_update > 0:
+                track.missed += 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+
+        for d in unmatched:
+            self.tracks.append(Track(self._next_id, detections[d]))
+            self._next_id += 1
+
+        confirmed = []
+        for track in self.tracks:
+            if not track.counted and track.hits >= self.min_hits:
+                track.counted = True
+                confirmed.append(track)
+        return confirmed
+
+    def active(self):
+        return [t.to_dict() for t in self.tracks if t.missed == 0]
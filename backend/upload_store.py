@@ -0,0 +1,198 @@
+"""
+Content-addressed storage for uploaded images
+Originals are stored once per distinct content under their SHA-256
+(originals/ab/cd/<sha256>, sharded so no directory grows huge), however often
+or under whatever name they are uploaded. A background thumbnailer writes a
+small JPEG next to each one (thumbnails/ab/cd/<sha256>.jpg) for the history
+UI, which only ever reads thumbnails. Reference counts from recycling_history
+live in the upload_blobs table; eviction keeps the originals within a size
+and age budget and removes uploads no history row refers to.
+"""
+
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+def make_thumbnail(image_bytes, size):
+    """JPEG bytes of the upright image scaled to fit size x size"""
+    image = Image.open(io.BytesIO(image_bytes))
+    if image.format == 'JPEG':
+        image.draft('RGB', (size, size))
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=80, optimize=True)
+    return buffer.getvalue()
+
+
+def _write_once(path, data):
+    """Write data to path atomically unless it already exists; True if written"""
+    if os.path.exists(path):
+        return False
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+class UploadStore:
+    def __init__(self, root, database, max_bytes=2 * 1024 ** 3, max_age_seconds=30 * 86400,
+                 unreferenced_grace_seconds=3600, thumbnail_size=128, evict_every=100,
+                 max_pending_bytes=256 * 1024 ** 2):
+        # Absolute, so paths stay valid for send_file, which resolves
+        # relative ones against the app root rather than the working directory
+        self.root = os.path.abspath(root)
+        self.db = database
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.unreferenced_grace_seconds = unreferenced_grace_seconds
+        self.thumbnail_size = thumbnail_size
+        self.evict_every = max(1, int(evict_every))
+        self.max_pending_bytes = max_pending_bytes
+
+        # Originals are written in order on one thread; thumbnails on another
+        # so a slow resize never holds up the next write. Image bytes queued
+        # for either are capped at max_pending_bytes: past that, uploads are
+        # not kept (and thumbnails not made) rather than piling up in memory
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ecowise-upload')
+        self._thumbnailer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ecowise-thumbnailer')
+        self._lock = threading.Lock()
+        self._saves_since_evict = 0
+        self._pending_bytes = 0
+
+        # Stats exposed through stats()
+        self._stats = {"saved": 0, "deduplicated": 0, "thumbnails": 0, "evicted_originals": 0,
+                       "removed_unreferenced": 0, "errors": 0, "dropped": 0, "thumbnails_skipped": 0}
+
+    def original_path(self, key):
+        return os.path.join(self.root, 'originals', key[:2], key[2:4], key)
+
+    def thumbnail_path(self, key):
+        return os.path.join(self.root, 'thumbnails', key[:2], key[2:4], key + '.jpg')
+
+    def thumbnail_file(self, key):
+        """Path of a ready thumbnail, or None (bad key or not generated yet)"""
+        if not KEY_PATTERN.match(key):
+            return None
+        path = self.thumbnail_path(key)
+        return path if os.path.exists(path) else None
+
+    def save_async(self, key, image_bytes):
+        """Store an upload under its SHA-256 key in the background; False if the queue is full"""
+        if not self._reserve(len(image_bytes)):
+            with self._lock:
+                self._stats["dropped"] += 1
+            return False
+        self._writer.submit(self._save, key, image_bytes)
+        return True
+
+    def evict(self):
+        """
+        Remove uploads no history row has referenced for the grace period,
+        then evict the least recently used originals beyond max_bytes or
+        older than max_age_seconds (their thumbnails stay).
+        """
+        # Files are removed while the database still holds the write lock, so
+        # another worker can't count the original as stored in the meantime
+        removed = self.db.delete_unreferenced_uploads(self.unreferenced_grace_seconds, self._remove_files)
+        evicted = self.db.evict_upload_originals(
+            self.max_bytes, self.max_age_seconds, lambda key: _remove(self.original_path(key)))
+
+        with self._lock:
+            self._stats["removed_unreferenced"] += len(removed)
+            self._stats["evicted_originals"] += len(evicted)
+        if removed or evicted:
+            logger.info("Evicted uploads", extra={"unreferenced": len(removed), "originals": len(evicted)})
+        return len(removed), len(evicted)
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+        self._thumbnailer.shutdown(wait=True)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending_bytes"] = self._pending_bytes
+        stats.update(self.db.upload_storage_stats())
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def _remove_files(self, key):
+        _remove(self.original_path(key))
+        _remove(self.thumbnail_path(key))
+
+    def _reserve(self, size):
+        with self._lock:
+            if self._pending_bytes and self._pending_bytes + size > self.max_pending_bytes:
+                return False
+            self._pending_bytes += size
+            return True
+
+    def _release(self, size):
+        with self._lock:
+            self._pending_bytes -= size
+
+    def _save(self, key, image_bytes):
+        try:
+            # Checked and written under the database write lock (see evict)
+            written = self.db.put_upload_blob(
+                key, len(image_bytes), lambda: _write_once(self.original_path(key), image_bytes))
+            with self._lock:
+                self._stats["saved" if written else "deduplicated"] += 1
+                self._saves_since_evict += 1
+                run_eviction = self._saves_since_evict >= self.evict_every
+                if run_eviction:
+                    self._saves_since_evict = 0
+            if not os.path.exists(self.thumbnail_path(key)):
+                if self._reserve(len(image_bytes)):
+                    self._thumbnailer.submit(self._thumbnail, key, image_bytes)
+                else:
+                    with self._lock:
+                        self._stats["thumbnails_skipped"] += 1
+            if run_eviction:
+                self.evict()
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            logger.error("Could not store upload %s: %s", key, e)
+        finally:
+            self._release(len(image_bytes))
+
+    def _thumbnail(self, key, image_bytes):
+        try:
+            if _write_once(self.thumbnail_path(key), make_thumbnail(image_bytes, self.thumbnail_size)):
+                with self._lock:
+                    self._stats["thumbnails"] += 1
+        except Exception as e:
+            with self._lock:
+                self._stats["errors"] += 1
+            logger.error("Could not make thumbnail for %s: %s", key, e)
+        finally:
+            self._release(len(image_bytes))
@@ -0,0 +1,148 @@
+"""
+Write-behind buffer for client-reported point updates
+Coalesces /user/<username>/update deltas per user in memory and writes them
+to SQLite in one transaction every flush interval (or sooner once enough
+deltas are pending), instead of two UPDATEs and a read per request.
+"""
+
+import logging
+import threading
+import time
+
+from database import CARBON_KG_PER_ITEM, level_for_points
+
+logger = logging.getLogger(__name__)
+
+
+class PointsWriteBuffer:
+    def __init__(self, database, flush_interval_ms=200, max_pending=500):
+        self.database = database
+        self.flush_interval = max(0.001, flush_interval_ms / 1000.0)
+        self.max_pending = max(1, int(max_pending))
+
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        # Held for a whole flush so readers never see deltas that are neither
+        # pending nor committed yet
+        self._flush_lock = threading.Lock()
+        self._pending = {}      # username -> [points, items]
+        self._flushing = set()  # usernames in the transaction being written
+        self._pending_deltas = 0
+        self._closed = False
+
+        # Stats exposed through stats()
+        self._deltas_received = 0
+        self._flushes = 0
+        self._rows_written = 0
+        self._last_flush_ms = 0.0
+
+        self._worker = threading.Thread(target=self._run, name="ecowise-write-behind", daemon=True)
+        self._worker.start()
+        logger.info("Write-behind buffer ready", extra={"flush_interval_ms": flush_interval_ms, "max_pending": self.max_pending})
+
+    def add(self, username, points, items):
+        """Queue a points/items delta; it is written by the next flush"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Write-behind buffer is closed")
+            delta = self._pending.setdefault(username, [0, 0])
+            delta[0] += points
+            delta[1] += items
+            self._pending_deltas += 1
+            self._deltas_received += 1
+            if self._pending_deltas >= self.max_pending:
+                self._wake.notify()
+
+    def read(self, username, reader):
+        """
+        Call reader() (which returns a user dict from the database, or None)
+        and add the user's deltas that are not in the database yet.
+        """
+        with self._lock:
+            buffered = username in self._pending or username in self._flushing
+        if not buffered:
+            return reader()
+
+        with self._flush_lock:
+            user = reader()
+            with self._lock:
+                delta = self._pending.get(username)
+                delta = tuple(delta) if delta else None
+        return self.merge(user, delta)
+
+    @staticmethod
+    def merge(user, delta):
+        if user is None or delta is None:
+            return user
+        points, items = delta
+        user = dict(user)
+        user['eco_points'] += points
+        user['items_recycled'] += items
+        user['carbon_saved_kg'] += items * CARBON_KG_PER_ITEM
+        user['level'] = level_for_points(user['eco_points'])
+        return user
+
+    def flush(self):
+        """Write every pending delta in one transaction"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._pending_deltas = 0
+                self._flushing = set(batch)
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                written = self.database.apply_point_deltas(
+                    [(username, points, items) for username, (points, items) in batch.items()])
+            except Exception as e:
+                logger.error("Write-behind flush failed, will retry: %s", e)
+                with self._lock:
+                    # Put the batch back in front of anything queued since
+                    for username, (points, items) in batch.items():
+                        delta = self._pending.setdefault(username, [0, 0])
+                        delta[0] += points
+                        delta[1] += items
+                    self._pending_deltas += len(batch)
+                    self._flushing = set()
+                return 0
+
+            with self._lock:
+                self._flushing = set()
+                self._flushes += 1
+                self._rows_written += written
+                self._last_flush_ms = (time.perf_counter() - started) * 1000
+            return written
+
+    def close(self):
+        """Stop the flusher and write whatever is still pending"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wake.notify()
+        self._worker.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending_users": len(self._pending),
+                "pending_deltas": self._pending_deltas,
+                "deltas_received": self._deltas_received,
+                "flushes": self._flushes,
+                "rows_written": self._rows_written,
+                "last_flush_ms": round(self._last_flush_ms, 3),
+                "flush_interval_ms": self.flush_interval * 1000,
+                "max_pending": self.max_pending
+            }
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._closed and self._pending_deltas < self.max_pending:
+                    self._wake.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
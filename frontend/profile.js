@@ -47,7 +47,9 @@ async function loadUserHistory() {
         if (data.history && data.history.length > 0) {
             historyList.innerHTML = data.history.map(item => `
                 <div class="history-item">
-                    <div class="history-icon">📸</div>
+                    <div class="history-icon">${item.thumbnail_url
+                        ? `<img src="${API_BASE}${item.thumbnail_url}" alt="" loading="lazy">`
+                        : '📸'}</div>
                     <div class="history-details">
                         <strong>${item.filename}</strong>
                         <span class="history-date">${new Date(item.processed_at).toLocaleDateString()}</span>